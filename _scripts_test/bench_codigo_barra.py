@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""Benchmark del endpoint de lectura de códigos de barras (caja).
+
+Crea una base de datos de prueba aparte (no toca db.sqlite3), carga un catálogo
+de N medicamentos repartidos en varias droguerías y mide la latencia de
+GET /api/inventario/medicamentos/codigo-barra/<codigo>/ de punta a punta
+(autenticación, vista y serialización incluidas):
+
+- frío: caché vacía, cada lectura va al índice (drogueria, codigo_barra);
+- caliente: códigos repetidos, servidos por la caché LRU.
+
+Uso: python _scripts_test/bench_codigo_barra.py [--filas 200000] [--lecturas 5000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+import django
+
+django.setup()
+
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases
+from rest_framework.test import APIClient
+
+
+def percentil(muestras, p):
+    orden = sorted(muestras)
+    return orden[min(len(orden) - 1, int(len(orden) * p / 100))]
+
+
+def medir(client, codigos):
+    tiempos = []
+    for codigo in codigos:
+        inicio = time.perf_counter()
+        resp = client.get(f'/api/inventario/medicamentos/codigo-barra/{codigo}/')
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+        assert resp.status_code == 200, resp.content
+    return tiempos
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--filas', type=int, default=200_000)
+    parser.add_argument('--lecturas', type=int, default=5_000)
+    parser.add_argument('--droguerias', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    config = setup_databases(verbosity=0, interactive=False)
+    try:
+        from droguerias.models import Drogueria
+        from inventario import barcode
+        from inventario.models import Medicamento
+        from usuarios.models import Usuario
+
+        user = Usuario.objects.create_user(username='bench', password='x', email='bench@example.com', rol='empleado')
+        droguerias = Drogueria.objects.bulk_create(
+            Drogueria(codigo=f'BENCH{i}', nombre=f'Bench {i}', propietario=user) for i in range(args.droguerias)
+        )
+        print(f'📦 Cargando {args.filas} medicamentos...')
+        inicio = time.perf_counter()
+        Medicamento.objects.bulk_create(
+            (Medicamento(
+                nombre=f'Medicamento {i}',
+                precio_venta=1000 + i % 500,
+                stock_actual=i % 90,
+                codigo_barra=f'{7700000000000 + i}',
+                drogueria=droguerias[i % args.droguerias],
+            ) for i in range(args.filas)),
+            batch_size=2000,
+        )
+        print(f'   listo en {time.perf_counter() - inicio:.1f}s')
+
+        activa = droguerias[0]
+        user.active_drogueria = activa
+        user.save()
+        client = APIClient()
+        client.force_authenticate(user)
+
+        propios = [f'{7700000000000 + i}' for i in range(0, args.filas, args.droguerias)]
+        frios = random.sample(propios, min(args.lecturas, len(propios)))
+        barcode.cache.limpiar()
+        resultados = {'frío (índice)': medir(client, frios)}
+        calientes = [random.choice(frios[:200]) for _ in range(args.lecturas)]
+        resultados['caliente (caché)'] = medir(client, calientes)
+
+        for nombre, tiempos in resultados.items():
+            print(f'⏱️  {nombre:<17} n={len(tiempos):>5}  p50={percentil(tiempos, 50):.2f}ms  '
+                  f'p99={percentil(tiempos, 99):.2f}ms  max={max(tiempos):.2f}ms')
+        peor = max(percentil(t, 99) for t in resultados.values())
+        print('✅ p99 < 10ms' if peor < 10 else '❌ p99 >= 10ms')
+    finally:
+        teardown_databases(config, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""Benchmark de la exportación en flujo del inventario (inventario.exportacion).
+
+Crea una base de datos de prueba aparte (no toca db.sqlite3), inserta N
+medicamentos y consume el flujo CSV, JSONL y CSV+gzip midiendo tiempo y pico
+de memoria (tracemalloc) para 1k filas y para N filas. El pico debe ser
+prácticamente el mismo en ambos casos.
+
+Uso: python _scripts_test/bench_exportacion.py [--filas 100000]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+import django
+
+django.setup()
+
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases
+
+
+def medir(queryset, formato, comprimir):
+    from inventario.exportacion import exportar
+
+    contenido, _, _ = exportar(queryset, formato, comprimir)
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    total = 0
+    for trozo in contenido:
+        total += len(trozo)
+    duracion = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return duracion, pico, total
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--filas', type=int, default=100_000)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    config = setup_databases(verbosity=0, interactive=False)
+    try:
+        from droguerias.models import Drogueria
+        from inventario.models import Medicamento
+        from usuarios.models import Usuario
+
+        user = Usuario.objects.create_user(username='bench', password='x', email='bench@example.com', rol='empleado')
+        drogueria = Drogueria.objects.create(codigo='BENCH', nombre='Bench', propietario=user)
+        Medicamento.objects.bulk_create(
+            (Medicamento(nombre=f'Medicamento {i}', precio_venta=1000 + i % 500, costo_compra=800,
+                         stock_actual=i % 90, proveedor=f'Proveedor {i % 60}', drogueria=drogueria)
+             for i in range(args.filas)),
+            batch_size=500,
+        )
+        todos = Medicamento.objects.order_by('id')
+        for filas in (1000, args.filas):
+            qs = todos.filter(id__in=todos.values('id')[:filas]) if filas < args.filas else todos
+            for formato, comprimir in (('csv', False), ('jsonl', False), ('csv', True)):
+                duracion, pico, total = medir(qs, formato, comprimir)
+                etiqueta = formato + ('+gzip' if comprimir else '')
+                print(f'⏱️ {filas:>7} filas {etiqueta:<9} {duracion * 1000:8.1f} ms  '
+                      f'{filas / duracion:9.0f} filas/s  pico {pico / 1024:7.1f} KiB  salida {total / 1024:8.1f} KiB')
+    finally:
+        teardown_databases(config, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""Benchmark de la importación masiva de medicamentos (inventario.importacion).
+
+Crea una base de datos de prueba aparte (no toca db.sqlite3), genera un CSV de
+N filas repartidas en varias droguerías y categorías y mide:
+
+- importación inicial (todas las filas se insertan);
+- reimportación del mismo archivo con precios cambiados (todas se actualizan).
+
+Uso: python _scripts_test/bench_importacion.py [--filas 20000]
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+import django
+
+django.setup()
+
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases
+
+
+def generar_csv(filas, droguerias, recargo=0):
+    salida = io.StringIO()
+    salida.write('nombre;precio;costo;stock;categoria;drogueria;proveedor;codigo;vencimiento\n')
+    for i in range(filas):
+        salida.write(
+            f'Medicamento {i};{1000 + i % 500 + recargo},50;{800 + i % 400};{i % 90};Categoría {i % 25};'
+            f'BENCH{i % droguerias};Proveedor {i % 60};{7700000000000 + i};2030-{i % 12 + 1:02d}-15\n'
+        )
+    return salida.getvalue().encode('utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--filas', type=int, default=20_000)
+    parser.add_argument('--droguerias', type=int, default=10)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    config = setup_databases(verbosity=0, interactive=False)
+    try:
+        from droguerias.models import Drogueria
+        from inventario.importacion import importar
+        from inventario.models import ImportacionMedicamentos
+        from usuarios.models import Usuario
+
+        user = Usuario.objects.create_user(username='bench', password='x', email='bench@example.com', rol='empleado')
+        Drogueria.objects.bulk_create(
+            Drogueria(codigo=f'BENCH{i}', nombre=f'Bench {i}', propietario=user) for i in range(args.droguerias)
+        )
+        for nombre, recargo in (('inicial (inserta)', 0), ('reimportación (actualiza)', 7)):
+            contenido = generar_csv(args.filas, args.droguerias, recargo)
+            registro = ImportacionMedicamentos.objects.create(usuario=user, archivo='bench.csv')
+            inicio = time.perf_counter()
+            registro = importar(registro, io.BytesIO(contenido))
+            segundos = time.perf_counter() - inicio
+            print(f'⏱️  {nombre:<26} {registro.filas_procesadas} filas en {segundos:.2f}s '
+                  f'({registro.filas_procesadas / segundos:,.0f} filas/s)  creados={registro.creados} '
+                  f'actualizados={registro.actualizados} errores={registro.con_error}')
+    finally:
+        teardown_databases(config, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
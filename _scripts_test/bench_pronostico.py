@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""Benchmark del pronóstico de demanda en lote (inventario.pronostico).
+
+Crea una base de datos de prueba aparte (no toca db.sqlite3), genera N
+movimientos de salida repartidos entre varios medicamentos y días, y mide
+``pronosticar`` con media móvil y con suavizado exponencial.
+
+Uso: python _scripts_test/bench_pronostico.py [--movimientos 1000000] [--medicamentos 2000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+import django
+
+django.setup()
+
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--movimientos', type=int, default=1_000_000)
+    parser.add_argument('--medicamentos', type=int, default=2000)
+    parser.add_argument('--dias', type=int, default=90)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    config = setup_databases(verbosity=0, interactive=False)
+    try:
+        from django.utils import timezone
+        from droguerias.models import Drogueria
+        from inventario.models import Medicamento, MovimientoInventario
+        from inventario.pronostico import pronosticar
+        from usuarios.models import Usuario
+
+        user = Usuario.objects.create_user(username='bench', password='x', email='bench@example.com', rol='empleado')
+        droguerias = Drogueria.objects.bulk_create(
+            Drogueria(codigo=f'BENCH{i}', nombre=f'Bench {i}', propietario=user) for i in range(10)
+        )
+        Medicamento.objects.bulk_create(
+            (Medicamento(nombre=f'Medicamento {i}', precio_venta=1, stock_actual=1000,
+                         drogueria=droguerias[i % len(droguerias)]) for i in range(args.medicamentos)),
+            batch_size=500,
+        )
+        ids = list(Medicamento.objects.values_list('id', flat=True))
+        rnd = random.Random(7)
+        ahora = timezone.now()
+        inicio = time.perf_counter()
+        lote = []
+        for _ in range(args.movimientos):
+            lote.append(MovimientoInventario(
+                medicamento_id=rnd.choice(ids), tipo_movimiento='salida', cantidad=rnd.randint(1, 5),
+                fecha_movimiento=ahora - timedelta(minutes=rnd.randint(60 * 24, 60 * 24 * args.dias)),
+            ))
+            if len(lote) == 5000:
+                MovimientoInventario.objects.bulk_create(lote, batch_size=500)
+                lote = []
+        MovimientoInventario.objects.bulk_create(lote, batch_size=500)
+        print(f'carga de {args.movimientos} movimientos: {time.perf_counter() - inicio:.1f} s')
+
+        for metodo in ('media_movil', 'suavizado'):
+            inicio = time.perf_counter()
+            resultado = pronosticar(dias=args.dias, metodo=metodo)
+            duracion = time.perf_counter() - inicio
+            print(f'⏱️ {metodo:<12} {args.movimientos} movimientos, {resultado["medicamentos"]} medicamentos: '
+                  f'{duracion:.2f} s ({args.movimientos / duracion:,.0f} movimientos/s)')
+    finally:
+        teardown_databases(config, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
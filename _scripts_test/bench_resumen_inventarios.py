@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+"""Benchmark de GET /api/droguerias/inventarios/resumen/.
+
+Crea una base de datos de prueba aparte (no toca db.sqlite3) con N droguerías
+y su InventarioDrogueria, un administrador y un empleado con membresía en la
+mitad de ellas, y mide:
+
+- la versión anterior (cargar todas las filas y sumar en Python, más un COUNT
+  y un DISTINCT sobre las membresías), reproducida aquí para comparar;
+- el endpoint actual en frío (caché recién invalidada: una consulta agregada);
+- el endpoint actual en caliente (servido desde la caché del alcance).
+
+Uso: python _scripts_test/bench_resumen_inventarios.py [--droguerias 500] [--lecturas 500]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+import django
+
+django.setup()
+
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases
+from rest_framework.test import APIClient
+
+
+def percentil(muestras, p):
+    orden = sorted(muestras)
+    return orden[min(len(orden) - 1, int(len(orden) * p / 100))]
+
+
+def medir(fn, lecturas, antes=None):
+    tiempos = []
+    for _ in range(lecturas):
+        if antes:
+            antes()
+        inicio = time.perf_counter()
+        fn()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return tiempos
+
+
+def resumen_anterior(user):
+    from django.db.models import Q
+    from droguerias.models import InventarioDrogueria
+
+    if user.is_staff:
+        qs = InventarioDrogueria.objects.all()
+    else:
+        qs = InventarioDrogueria.objects.filter(
+            Q(drogueria__propietario=user) |
+            Q(drogueria__usuarios_membresia__usuario=user, drogueria__usuarios_membresia__activo=True)
+        ).distinct()
+    total_valor = sum(inv.valor_total_inventario for inv in qs)
+    total_venta = sum(inv.valor_venta_total for inv in qs)
+    sum(inv.cantidad_medicamentos for inv in qs)
+    sum(inv.cantidad_stock_total for inv in qs)
+    qs.count()
+    return ((total_venta - total_valor) / total_valor * 100) if total_valor > 0 else 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--droguerias', type=int, default=500)
+    parser.add_argument('--lecturas', type=int, default=500)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    config = setup_databases(verbosity=0, interactive=False)
+    try:
+        from droguerias.models import Drogueria, InventarioDrogueria, UsuarioDrogueria
+        from inventario import agregados, cache
+        from usuarios.models import Usuario
+
+        admin = Usuario.objects.create_user(username='bench_admin', password='x', email='ba@example.com',
+                                            is_staff=True)
+        emp = Usuario.objects.create_user(username='bench_emp', password='x', email='be@example.com', rol='empleado')
+        droguerias = Drogueria.objects.bulk_create(
+            Drogueria(codigo=f'RES{i}', nombre=f'Resumen {i}', propietario=admin) for i in range(args.droguerias)
+        )
+        InventarioDrogueria.objects.bulk_create(
+            InventarioDrogueria(
+                drogueria=d,
+                valor_total_inventario=random.randint(1_000, 9_000_000),
+                valor_venta_total=random.randint(9_000_000, 12_000_000),
+                cantidad_medicamentos=random.randint(10, 3000),
+                cantidad_stock_total=random.randint(100, 90_000),
+            ) for d in droguerias
+        )
+        UsuarioDrogueria.objects.bulk_create(
+            UsuarioDrogueria(usuario=emp, drogueria=d, rol='empleado') for d in droguerias[::2]
+        )
+
+        url = '/api/droguerias/inventarios/resumen/'
+        resultados = {}
+        for nombre, user in (('admin', admin), ('empleado', emp)):
+            client = APIClient()
+            client.force_authenticate(user)
+            resultados[f'{nombre} anterior'] = medir(lambda: resumen_anterior(user), args.lecturas)
+            resultados[f'{nombre} frío'] = medir(lambda: client.get(url), args.lecturas,
+                                                 antes=lambda: cache.invalidar(agregados.ESPACIO))
+            resultados[f'{nombre} caliente'] = medir(lambda: client.get(url), args.lecturas)
+
+        for nombre, tiempos in resultados.items():
+            print(f'⏱️  {nombre:<18} n={len(tiempos):>5}  p50={percentil(tiempos, 50):.2f}ms  '
+                  f'p99={percentil(tiempos, 99):.2f}ms')
+    finally:
+        teardown_databases(config, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
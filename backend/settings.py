@@ -92,9 +92,33 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # espera en lugar de fallar con "database is locked" ante escritores concurrentes
+        'OPTIONS': {'timeout': 20},
+        # BD de pruebas en archivo: la BD en memoria compartida bloquea tablas completas
+        # y no permite probar concurrencia real (ver inventario.tests.StockConcurrencyTests)
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
+# Backend de búsqueda del catálogo (inventario.search). Por defecto FTS5 en SQLite.
+# INVENTARIO_SEARCH_BACKEND = 'inventario.search.IcontainsBackend'
+
+# Caché de respuestas del catálogo (inventario.cache). La local es por proceso:
+# con varios workers usar una compartida (p. ej. django.core.cache.backends.redis.RedisCache).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'mims-inventario',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+    # contadores de versión de inventario.cache: pocas claves sin expiración en un
+    # almacén aparte, así el descarte (cull) de 'default' nunca las borra
+    'versiones': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'mims-inventario-versiones',
+    },
+}
+
 # Validaciones de contraseña
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -3,13 +3,14 @@ from rest_framework.routers import DefaultRouter
 from .views import DrogueriaViewSet, ConversacionViewSet, MensajeViewSet, UsuarioDrogueriaViewSet, InventarioDrogueriaViewSet, MovimientoDrogueriaViewSet
 
 router = DefaultRouter()
-# ✅ Registrar con prefijo vacío porque ya está incluido como 'api/droguerias/'
-router.register(r'', DrogueriaViewSet, basename='drogueria')
 router.register(r'conversaciones', ConversacionViewSet, basename='conversacion')
 router.register(r'mensajes', MensajeViewSet, basename='mensaje')
 router.register(r'membresias', UsuarioDrogueriaViewSet, basename='membresia')
 router.register(r'inventarios', InventarioDrogueriaViewSet, basename='inventario-drogueria')
 router.register(r'movimientos', MovimientoDrogueriaViewSet, basename='movimiento-drogueria')
+# ✅ Registrar con prefijo vacío porque ya está incluido como 'api/droguerias/'.
+# Va al final: su ruta de detalle (<pk>/) capturaría 'inventarios/', 'membresias/', etc.
+router.register(r'', DrogueriaViewSet, basename='drogueria')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -167,8 +167,12 @@ class UsuarioDrogueriaViewSet(viewsets.ModelViewSet):
 
 
 class InventarioDrogueriaViewSet(viewsets.ReadOnlyModelViewSet):
-    """ViewSet para consultar inventarios por droguería."""
-    queryset = InventarioDrogueria.objects.all()
+    """ViewSet para consultar inventarios por droguería.
+
+    Los valores se mantienen con deltas en cada cambio de stock o precio
+    (inventario.agregados); aquí solo se leen, nunca se agregan en vivo.
+    """
+    queryset = InventarioDrogueria.objects.select_related('drogueria')
     serializer_class = InventarioDrogueriaSerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -182,31 +186,23 @@ class InventarioDrogueriaViewSet(viewsets.ReadOnlyModelViewSet):
 
     @action(detail=False, methods=['get'])
     def resumen(self, request):
-        """Retorna resumen agregado de todas las droguerías del usuario."""
+        """Retorna resumen agregado de todas las droguerías del usuario.
+
+        Una consulta agregada sobre los valores mantenidos, cacheada por el
+        conjunto de droguerías visibles (ver inventario.agregados.resumen).
+        """
+        from django.db.models import Q
+        from inventario import agregados
+
         user = request.user
         if user.is_staff or user.is_superuser:
-            qs = InventarioDrogueria.objects.all()
-        else:
-            # Solo droguerías donde el usuario es propietario o tiene membresía
-            from django.db.models import Q
-            qs = InventarioDrogueria.objects.filter(
-                Q(drogueria__propietario=user) |
-                Q(drogueria__usuarios_membresia__usuario=user, drogueria__usuarios_membresia__activo=True)
-            ).distinct()
-        
-        total_valor = sum(inv.valor_total_inventario for inv in qs)
-        total_venta = sum(inv.valor_venta_total for inv in qs)
-        total_medicamentos = sum(inv.cantidad_medicamentos for inv in qs)
-        total_stock = sum(inv.cantidad_stock_total for inv in qs)
-        
-        return Response({
-            'total_droguerias': qs.count(),
-            'valor_total_inventario': total_valor,
-            'valor_venta_total': total_venta,
-            'cantidad_total_medicamentos': total_medicamentos,
-            'cantidad_total_stock': total_stock,
-            'margen_promedio': ((total_venta - total_valor) / total_valor * 100) if total_valor > 0 else 0,
-        })
+            return Response(agregados.resumen())
+        # Solo droguerías donde el usuario es propietario o tiene membresía
+        ids = Drogueria.objects.filter(
+            Q(propietario=user) |
+            Q(id__in=UsuarioDrogueria.objects.filter(usuario=user, activo=True).values('drogueria_id'))
+        ).values_list('id', flat=True)
+        return Response(agregados.resumen(list(ids)))
 
 
 class MovimientoDrogueriaViewSet(viewsets.ReadOnlyModelViewSet):
@@ -1,6 +1,6 @@
 from django.contrib import admin
-from .models import Categoria, Medicamento, MovimientoInventario
-from .models import Prestamo
+from .models import Categoria, Medicamento, MovimientoInventario, LoteMedicamento, Producto
+from .models import Prestamo, Transferencia, LineaTransferencia
 
 # =========================
 # 📁 Categoría
@@ -13,6 +13,16 @@ class CategoriaAdmin(admin.ModelAdmin):
     ordering = ('nombre',)
 
 
+# =========================
+# 🏷️ Maestro de productos (SKU)
+# =========================
+@admin.register(Producto)
+class ProductoAdmin(admin.ModelAdmin):
+    list_display = ('id', 'sku', 'nombre', 'codigo_barra', 'creado_en')
+    search_fields = ('sku', 'nombre', 'codigo_barra')
+    ordering = ('nombre',)
+
+
 # =========================
 # 🔄 Inline para movimientos dentro del medicamento
 # =========================
@@ -23,6 +33,14 @@ class MovimientoInventarioInline(admin.TabularInline):
     can_delete = True
 
 
+class LoteMedicamentoInline(admin.TabularInline):
+    model = LoteMedicamento
+    extra = 0
+    fields = ('codigo', 'fecha_vencimiento', 'cantidad', 'creado_en')
+    readonly_fields = ('cantidad', 'creado_en')
+    ordering = ('fecha_vencimiento', 'id')
+
+
 # =========================
 # 💊 Medicamento con CRUD completo
 # =========================
@@ -33,8 +51,9 @@ class MedicamentoAdmin(admin.ModelAdmin):
         'stock_reservado', 'stock_minimo', 'estado', 'esta_vencido', 'verificar_stock'
     )
     list_filter = ('categoria', 'estado')
-    search_fields = ('nombre', 'descripcion')
-    inlines = [MovimientoInventarioInline]
+    search_fields = ('nombre', 'descripcion', 'producto__sku')
+    raw_id_fields = ('producto',)
+    inlines = [LoteMedicamentoInline, MovimientoInventarioInline]
     readonly_fields = ('verificar_stock', 'esta_vencido')
     ordering = ('nombre',)
 
@@ -76,3 +95,18 @@ class AuditLogAdmin(admin.ModelAdmin):
     list_display = ('id', 'action', 'model_name', 'object_id', 'user', 'created_at')
     list_filter = ('action', 'model_name', 'user')
     search_fields = ('message',)
+
+
+class LineaTransferenciaInline(admin.TabularInline):
+    model = LineaTransferencia
+    extra = 0
+    readonly_fields = ('medicamento_origen', 'medicamento_destino', 'cantidad')
+    can_delete = False
+
+
+@admin.register(Transferencia)
+class TransferenciaAdmin(admin.ModelAdmin):
+    list_display = ('id', 'origen', 'destino', 'estado', 'solicitante', 'fecha_solicitud')
+    list_filter = ('estado', 'origen', 'destino')
+    search_fields = ('origen__codigo', 'destino__codigo', 'lineas__medicamento_origen__nombre')
+    inlines = [LineaTransferenciaInline]
@@ -0,0 +1,196 @@
+"""Agregados por droguería (``droguerias.InventarioDrogueria``) mantenidos con deltas.
+
+Cada cambio de stock, precio, costo o droguería de un medicamento aporta su
+diferencia; las de cada escritura se suman por droguería y se aplican en su
+misma transacción con un ``UPDATE ... SET campo = campo + delta`` por fila (ver
+inventario.derivados), de modo que el agregado nunca se confirma sin el stock
+que lo explica. Así la lectura de ``/api/droguerias/inventarios/``
+nunca agrega en vivo.
+
+``resumen`` suma las filas con una sola consulta agregada y se cachea por
+alcance (conjunto de droguerías visibles) en el espacio ``'inventarios'`` de
+inventario.cache, que se invalida con cada delta o reparación.
+
+Los bulk_create / update masivos no emiten señales: ``recalcular`` (``manage.py
+recalcular_inventarios``) verifica todas las droguerías contra un GROUP BY y
+repara las que difieran, repartiendo las droguerías entre varios hilos.
+"""
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from droguerias.models import Drogueria, InventarioDrogueria
+
+from . import cache, valoracion
+from .models import Medicamento
+
+CAMPOS = ('valor_total_inventario', 'valor_venta_total', 'cantidad_medicamentos', 'cantidad_stock_total')
+ESPACIO = 'inventarios'
+
+
+def _invalidar():
+    # ahora y de nuevo al confirmar: una lectura concurrente pudo cachear el valor previo
+    cache.invalidar(ESPACIO)
+    transaction.on_commit(lambda: cache.invalidar(ESPACIO))
+
+
+def contribucion(stock, precio, costo, medicamentos=1):
+    """Aporte de ``stock`` unidades a los agregados de su droguería."""
+    return {
+        'valor_total_inventario': Decimal(costo or 0) * stock,
+        'valor_venta_total': Decimal(precio or 0) * stock,
+        'cantidad_medicamentos': medicamentos,
+        'cantidad_stock_total': stock,
+    }
+
+
+def aporte(medicamento):
+    """Aporte de un medicamento (instancia o dict con stock_actual, precio_venta, costo_compra)."""
+    if isinstance(medicamento, dict):
+        return contribucion(medicamento['stock_actual'], medicamento['precio_venta'], medicamento['costo_compra'])
+    return contribucion(medicamento.stock_actual, medicamento.precio_venta, medicamento.costo_compra)
+
+
+def sumar(acumulado, drogueria_id, deltas):
+    """Acumula ``deltas`` ({campo: delta}) en {drogueria_id: {campo: delta}}."""
+    if drogueria_id is None:
+        return
+    destino = acumulado.setdefault(drogueria_id, dict.fromkeys(CAMPOS, 0))
+    for campo in CAMPOS:
+        destino[campo] += deltas[campo]
+
+
+def mover(acumulado, drogueria_anterior, anterior, drogueria, nuevo):
+    """Acumula el paso de un medicamento del aporte ``anterior`` al ``nuevo`` (None = no existía / ya no existe)."""
+    if anterior is not None:
+        sumar(acumulado, drogueria_anterior, {campo: -anterior[campo] for campo in CAMPOS})
+    if nuevo is not None:
+        sumar(acumulado, drogueria, nuevo)
+
+
+def aplicar(drogueria_id, deltas):
+    """Suma ``deltas`` ({campo: delta}) a la fila de la droguería, creándola si falta."""
+    if drogueria_id is None or not any(deltas.values()):
+        return
+    cambios = {campo: F(campo) + delta for campo, delta in deltas.items() if delta}
+    cambios['ultimo_movimiento'] = timezone.now()
+    if InventarioDrogueria.objects.filter(drogueria_id=drogueria_id).update(**cambios):
+        return
+    # primera vez para esta droguería: la fila parte del estado completo, no del delta
+    try:
+        with transaction.atomic():
+            InventarioDrogueria.objects.create(drogueria_id=drogueria_id, **_calcular([drogueria_id]).get(drogueria_id, {}))
+    except IntegrityError:
+        # otro escritor la creó entre el UPDATE y el INSERT
+        InventarioDrogueria.objects.filter(drogueria_id=drogueria_id).update(**cambios)
+
+
+def aplicar_acumulado(acumulado):
+    """Un UPDATE por droguería, en orden de id (evita deadlocks entre transacciones).
+
+    Retorna si alguna fila cambió (quien llama invalida la caché de ``resumen``).
+    """
+    cambio = False
+    for drogueria_id in sorted(acumulado):
+        cambio = any(acumulado[drogueria_id].values()) or cambio
+        aplicar(drogueria_id, acumulado[drogueria_id])
+    return cambio
+
+
+def _calcular(drogueria_ids):
+    """{drogueria_id: {campo: valor}} calculado desde Medicamento con un GROUP BY."""
+    qs = Medicamento.objects.filter(drogueria_id__in=drogueria_ids)
+    return {
+        g['drogueria_id']: {
+            'valor_total_inventario': Decimal(g['costo_total']),
+            'valor_venta_total': Decimal(g['valor_total']),
+            'cantidad_medicamentos': g['medicamentos'],
+            'cantidad_stock_total': g['unidades'],
+        }
+        for g in valoracion.valorizar(qs, ['drogueria'])['grupos']
+    }
+
+
+def _reparar(drogueria_ids):
+    """Compara y corrige un bloque de droguerías. Retorna los ids reparados."""
+    reparadas = []
+    with transaction.atomic():
+        # bloquear primero: los deltas concurrentes esperan a que termine la reparación
+        actuales = {inv.drogueria_id: inv for inv in
+                    InventarioDrogueria.objects.select_for_update().filter(drogueria_id__in=drogueria_ids)}
+        esperados = _calcular(drogueria_ids)
+        vacio = contribucion(0, 0, 0, medicamentos=0)
+        nuevos, cambiados = [], []
+        for drogueria_id in drogueria_ids:
+            valores = esperados.get(drogueria_id, vacio)
+            inv = actuales.get(drogueria_id)
+            if inv is None:
+                nuevos.append(InventarioDrogueria(drogueria_id=drogueria_id, **valores))
+            elif any(getattr(inv, campo) != valores[campo] for campo in CAMPOS):
+                for campo in CAMPOS:
+                    setattr(inv, campo, valores[campo])
+                cambiados.append(inv)
+            else:
+                continue
+            reparadas.append(drogueria_id)
+        InventarioDrogueria.objects.bulk_create(nuevos)
+        InventarioDrogueria.objects.bulk_update(cambiados, CAMPOS)
+        if reparadas:
+            _invalidar()
+    return reparadas
+
+
+def _reparar_en_hilo(drogueria_ids):
+    try:
+        return _reparar(drogueria_ids)
+    finally:
+        connection.close()
+
+
+def recalcular(hilos=1, bloque=200, drogueria_ids=None):
+    """Verifica y repara los agregados de todas las droguerías (o de ``drogueria_ids``).
+    Retorna los ids reparados."""
+    qs = Drogueria.objects.order_by('id')
+    if drogueria_ids is not None:
+        qs = qs.filter(id__in=drogueria_ids)
+    ids = list(qs.values_list('id', flat=True))
+    bloques = [ids[i:i + bloque] for i in range(0, len(ids), bloque)]
+    if hilos <= 1:
+        return [d for b in bloques for d in _reparar(b)]
+    # cada hilo usa su propia conexión y transacción por bloque
+    with ThreadPoolExecutor(max_workers=hilos) as pool:
+        return [d for reparadas in pool.map(_reparar_en_hilo, bloques) for d in reparadas]
+
+
+# =========================
+# 📊 Resumen agregado
+# =========================
+def _resumen(drogueria_ids):
+    qs = InventarioDrogueria.objects.all()
+    if drogueria_ids is not None:
+        qs = qs.filter(drogueria_id__in=drogueria_ids)
+    totales = qs.aggregate(
+        total_droguerias=Count('id'),
+        valor_total_inventario=Coalesce(Sum('valor_total_inventario'), Decimal(0)),
+        valor_venta_total=Coalesce(Sum('valor_venta_total'), Decimal(0)),
+        cantidad_total_medicamentos=Coalesce(Sum('cantidad_medicamentos'), 0),
+        cantidad_total_stock=Coalesce(Sum('cantidad_stock_total'), 0),
+    )
+    costo, venta = totales['valor_total_inventario'], totales['valor_venta_total']
+    totales['margen_promedio'] = ((venta - costo) / costo * 100) if costo > 0 else 0
+    return totales
+
+
+def resumen(drogueria_ids=None):
+    """Totales de todas las droguerías (None) o de ``drogueria_ids``, cacheados por alcance."""
+    if drogueria_ids is None:
+        clave = 'todas'
+    else:
+        drogueria_ids = sorted(set(drogueria_ids))
+        clave = hashlib.sha1(','.join(map(str, drogueria_ids)).encode()).hexdigest()
+    return cache.obtener(ESPACIO, clave, lambda: _resumen(drogueria_ids))
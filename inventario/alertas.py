@@ -0,0 +1,145 @@
+"""Panel de alertas de inventario con estado materializado por droguería.
+
+- ``construir``: una sola consulta por droguería trae los medicamentos activos
+  con stock bajo o que vencen antes del horizonte (hoy + ``HORIZONTE_DIAS``) y
+  los guarda en ``SnapshotAlertas.items``.
+- ``refrescar``: al confirmar cada transacción, los medicamentos que cambiaron
+  (escrituras de Medicamento y ``stock_cambiado``, ver inventario.derivados) se
+  vuelven a leer y se parchean los snapshots afectados.
+- ``resumen``: lee el snapshot (una fila) y separa stock bajo, próximos a
+  vencer en ``dias`` y vencidos. Si el horizonte ya no cubre la ventana pedida
+  se reconstruye.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Medicamento, SnapshotAlertas
+
+DIAS_POR_DEFECTO = 7
+HORIZONTE_DIAS = 30
+CAMPOS = ('id', 'nombre', 'stock_actual', 'stock_minimo', 'categoria__nombre',
+          'fecha_vencimiento', 'lote', 'drogueria_id')
+
+
+def _criterio(horizonte):
+    return Q(estado=True) & (Q(stock_actual__lte=F('stock_minimo')) | Q(fecha_vencimiento__lte=horizonte))
+
+
+def _item(fila):
+    fecha = fila['fecha_vencimiento']
+    return {
+        'nombre': fila['nombre'],
+        'stock_actual': fila['stock_actual'],
+        'stock_minimo': fila['stock_minimo'],
+        'categoria__nombre': fila['categoria__nombre'],
+        'fecha_vencimiento': fecha.isoformat() if fecha else None,
+        'lote': fila['lote'],
+    }
+
+
+def _califica(fila, horizonte):
+    return fila['stock_actual'] <= fila['stock_minimo'] or (
+        fila['fecha_vencimiento'] is not None and fila['fecha_vencimiento'] <= horizonte)
+
+
+def construir(drogueria_id):
+    """Recalcula el snapshot de una droguería (None: medicamentos sin droguería)."""
+    horizonte = timezone.now().date() + timedelta(days=HORIZONTE_DIAS)
+    filas = (Medicamento.objects
+             .filter(_criterio(horizonte), drogueria_id=drogueria_id)
+             .values(*CAMPOS))
+    items = {str(f['id']): _item(f) for f in filas}
+    with transaction.atomic():
+        snap = SnapshotAlertas.objects.select_for_update().filter(drogueria_id=drogueria_id).first()
+        if snap is None:
+            snap = SnapshotAlertas(drogueria_id=drogueria_id)
+        snap.items, snap.horizonte, snap.actualizado_en = items, horizonte, timezone.now()
+        snap.save()
+    return snap
+
+
+def obtener(drogueria_id, dias=DIAS_POR_DEFECTO):
+    snap = SnapshotAlertas.objects.filter(drogueria_id=drogueria_id).first()
+    if snap is None or snap.horizonte < timezone.now().date() + timedelta(days=dias):
+        snap = construir(drogueria_id)
+    return snap
+
+
+def separar(items, dias=DIAS_POR_DEFECTO):
+    """Divide los items en el formato del panel (compatible con la respuesta anterior)."""
+    hoy = timezone.now().date()
+    limite = (hoy + timedelta(days=dias)).isoformat()
+    hoy = hoy.isoformat()
+    stock_bajo, por_vencer, vencidos = [], [], 0
+    for mid, it in items.items():
+        mid = int(mid)
+        if it['stock_actual'] <= it['stock_minimo']:
+            stock_bajo.append({'id': mid, 'nombre': it['nombre'], 'stock_actual': it['stock_actual'],
+                               'stock_minimo': it['stock_minimo'], 'categoria__nombre': it['categoria__nombre']})
+        fecha = it['fecha_vencimiento']
+        if fecha and hoy <= fecha <= limite:
+            por_vencer.append({'id': mid, 'nombre': it['nombre'], 'fecha_vencimiento': fecha,
+                               'stock_actual': it['stock_actual'], 'lote': it['lote']})
+        elif fecha and fecha < hoy:
+            vencidos += 1
+    stock_bajo.sort(key=lambda m: (-m['stock_actual'], m['id']))
+    por_vencer.sort(key=lambda m: (m['fecha_vencimiento'], m['id']))
+    return {
+        "stock_bajo": {"cantidad": len(stock_bajo), "medicamentos": stock_bajo},
+        "proximo_vencimiento": {"cantidad": len(por_vencer), "medicamentos": por_vencer},
+        "vencidos": {"cantidad": vencidos},
+        "dias": dias,
+        "timestamp": timezone.now().isoformat(),
+        "critico": bool(stock_bajo or por_vencer),
+    }
+
+
+def resumen(drogueria_id, dias=DIAS_POR_DEFECTO):
+    snap = obtener(drogueria_id, dias)
+    data = separar(snap.items, dias)
+    data['actualizado_en'] = snap.actualizado_en.isoformat()
+    return data
+
+
+def resumen_global(dias=DIAS_POR_DEFECTO):
+    """Todas las droguerías (administradores sin droguería activa): una consulta agregada."""
+    horizonte = timezone.now().date() + timedelta(days=dias)
+    filas = Medicamento.objects.filter(_criterio(horizonte)).values(*CAMPOS)
+    return separar({str(f['id']): _item(f) for f in filas}, dias)
+
+
+# =========================
+# 🔄 Refresco incremental
+# =========================
+def refrescar(pendientes):
+    """Parchea los snapshots existentes para {medicamento_id: droguerías conocidas}."""
+    filas = {f['id']: f for f in Medicamento.objects.filter(id__in=list(pendientes)).values(*CAMPOS, 'estado')}
+    por_ambito = {}
+    for mid, conocidas in pendientes.items():
+        fila = filas.get(mid)
+        for drogueria_id in conocidas | ({fila['drogueria_id']} if fila else set()):
+            por_ambito.setdefault(drogueria_id, []).append(mid)
+
+    for drogueria_id, ids in por_ambito.items():
+        with transaction.atomic():
+            snap = SnapshotAlertas.objects.select_for_update().filter(drogueria_id=drogueria_id).first()
+            if snap is None:
+                # se construirá completo en la próxima lectura
+                continue
+            for mid in ids:
+                fila = filas.get(mid)
+                if (fila and fila['estado'] and fila['drogueria_id'] == drogueria_id
+                        and _califica(fila, snap.horizonte)):
+                    snap.items[str(mid)] = _item(fila)
+                else:
+                    snap.items.pop(str(mid), None)
+            snap.actualizado_en = timezone.now()
+            snap.save(update_fields=['items', 'actualizado_en'])
+
+
+def invalidar_todo():
+    """Descarta todos los snapshots (p. ej. tras renombrar una categoría)."""
+    SnapshotAlertas.objects.all().delete()
@@ -10,3 +10,8 @@ class InventarioConfig(AppConfig):
         # el registry de apps esté listo. Django llamará a ready() cuando la app
         # esté cargada.
         from . import signals  # noqa: F401
+
+        # índice de búsqueda: se crea/repara después de cada migrate
+        from django.db.models.signals import post_migrate
+        from .search import preparar_indice
+        post_migrate.connect(preparar_indice, sender=self)
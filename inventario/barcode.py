@@ -0,0 +1,98 @@
+"""Resolución de códigos de barras para el punto de venta.
+
+Búsqueda exacta ``(drogueria, codigo_barra)`` sobre el índice
+``med_drog_codigo_idx`` con una caché LRU en proceso delante. La caché se
+invalida por id de medicamento al confirmar cada escritura (save/delete y
+cambios del libro de stock, ver ``inventario.derivados``) y tiene un TTL corto
+como red de seguridad entre procesos.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from .models import Medicamento
+
+CAPACIDAD = 20000
+TTL_SEGUNDOS = 30
+
+
+class CacheLRU:
+    """LRU thread-safe con invalidación por id de medicamento."""
+
+    def __init__(self, capacidad=CAPACIDAD, ttl=TTL_SEGUNDOS):
+        self.capacidad = capacidad
+        self.ttl = ttl
+        self._datos = OrderedDict()  # clave -> (expira, valor)
+        self._claves_por_id = {}     # medicamento_id -> clave
+        self._lock = threading.Lock()
+
+    def get(self, clave):
+        """Retorna (encontrado, valor)."""
+        with self._lock:
+            item = self._datos.get(clave)
+            if item is None:
+                return False, None
+            if item[0] < time.monotonic():
+                self._quitar(clave)
+                return False, None
+            self._datos.move_to_end(clave)
+            return True, item[1]
+
+    def set(self, clave, valor):
+        with self._lock:
+            if clave in self._datos:
+                self._quitar(clave)
+            self._datos[clave] = (time.monotonic() + self.ttl, valor)
+            if valor is not None:
+                self._claves_por_id[valor['id']] = clave
+            while len(self._datos) > self.capacidad:
+                self._quitar(next(iter(self._datos)))
+
+    def _quitar(self, clave):
+        _, valor = self._datos.pop(clave, (None, None))
+        if valor is not None and self._claves_por_id.get(valor['id']) == clave:
+            del self._claves_por_id[valor['id']]
+
+    def invalidar(self, medicamento_id=None, clave=None):
+        with self._lock:
+            if medicamento_id is not None and medicamento_id in self._claves_por_id:
+                self._quitar(self._claves_por_id[medicamento_id])
+            if clave is not None:
+                self._quitar(clave)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+            self._claves_por_id.clear()
+
+
+cache = CacheLRU()
+
+
+def normalizar_codigo(codigo):
+    return (codigo or '').strip()
+
+
+def buscar_por_codigo(drogueria_id, codigo):
+    """Payload mínimo {id, nombre, precio, stock_disponible} o None si no existe."""
+    clave = (drogueria_id, normalizar_codigo(codigo))
+    encontrado, valor = cache.get(clave)
+    if encontrado:
+        return valor
+    fila = (Medicamento.objects
+            .filter(drogueria_id=clave[0], codigo_barra=clave[1], estado=True)
+            .order_by('id')
+            .values_list('id', 'nombre', 'precio_venta', 'stock_actual', 'stock_reservado')[:1])
+    fila = fila[0] if fila else None
+    valor = None
+    if fila:
+        mid, nombre, precio, actual, reservado = fila
+        valor = {
+            'id': mid,
+            'nombre': nombre,
+            'precio': str(precio),
+            'stock_disponible': max(actual - reservado, 0),
+        }
+    # también se cachean los códigos inexistentes (escaneos repetidos de códigos ajenos)
+    cache.set(clave, valor)
+    return valor
@@ -0,0 +1,152 @@
+"""Caché versionada para respuestas derivadas del catálogo.
+
+Cada espacio (p. ej. ``'catalogo'``) tiene un contador de versión en la caché
+de Django; las claves incluyen la versión vigente, así que invalidar es un
+solo ``incr`` y las entradas viejas simplemente expiran. Se invalida en cada
+escritura de Categoria o Drogueria (``inventario.signals``) y una vez por
+transacción con escrituras de Medicamento o del libro de stock
+(``inventario.derivados``). La misma versión alimenta los
+encabezados ETag/Last-Modified de ``RespuestaCondicionalMixin``.
+
+``Last-Modified`` e ``If-Modified-Since`` tienen resolución de segundos: la
+marca de tiempo se guarda con fracción y ``Last-Modified`` solo se envía
+cuando el segundo de la última invalidación ya terminó (dos invalidaciones en
+el mismo segundo no pueden dar un 304 viejo); mientras tanto decide el ETag.
+
+Los contadores (versión y marca de tiempo) viven en el alias ``'versiones'``
+de ``settings.CACHES``, separado de las respuestas: el descarte por tamaño de
+``'default'`` (``MAX_ENTRIES``) no puede borrar una versión y volver a servir
+entradas viejas con su número.
+
+Las consultas con texto libre (``TEXTO_LIBRE``: búsquedas por nombre, lote,
+SKU...) no se guardan: cada término sería una entrada nueva y cualquier
+cliente anónimo podría llenar la caché. El resto de combinaciones queda
+acotado por ``MAX_ENTRIES`` de ``'default'``.
+
+Con la caché local por defecto (LocMemCache) la invalidación es por proceso;
+en despliegues con varios workers configurar cachés compartidas en
+``settings.CACHES``.
+"""
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.core.cache import cache, caches
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from rest_framework.response import Response
+
+PREFIJO = 'inventario'
+TTL_SEGUNDOS = 300
+ALIAS_VERSIONES = 'versiones'
+TEXTO_LIBRE = ('q', 'search', 'nombre', 'lote', 'sku')
+
+
+def _versiones():
+    return caches[ALIAS_VERSIONES]
+
+
+def _clave_version(espacio):
+    return f'{PREFIJO}:v:{espacio}'
+
+
+def version(espacio):
+    versiones = _versiones()
+    clave = _clave_version(espacio)
+    v = versiones.get(clave)
+    if v is None:
+        versiones.add(clave, 1, None)
+        v = versiones.get(clave, 1)
+    return v
+
+
+def invalidar(*espacios):
+    versiones = _versiones()
+    for espacio in espacios:
+        versiones.set(_clave_modificado(espacio), time.time(), None)
+        clave = _clave_version(espacio)
+        try:
+            versiones.incr(clave)
+        except ValueError:
+            # sin contador aún: nada cacheado con versión anterior
+            versiones.add(clave, 1, None)
+
+
+def cacheable(params):
+    """¿Se guarda la respuesta de estos parámetros? No si traen texto libre."""
+    return not any(params.get(p, '').strip() for p in TEXTO_LIBRE)
+
+
+def obtener(espacio, clave, construir, timeout=TTL_SEGUNDOS):
+    """Devuelve el valor cacheado de ``clave`` en la versión vigente o lo construye."""
+    completa = f'{PREFIJO}:{espacio}:{version(espacio)}:{clave}'
+    valor = cache.get(completa)
+    if valor is None:
+        valor = construir()
+        cache.set(completa, valor, timeout)
+    return valor
+
+
+# =========================
+# 🌐 GET condicional (ETag / Last-Modified)
+# =========================
+def _clave_modificado(espacio):
+    return f'{PREFIJO}:ts:{espacio}'
+
+
+def estado(espacio):
+    """(versión, timestamp con fracción de la última invalidación) del espacio."""
+    versiones = _versiones()
+    ts = versiones.get(_clave_modificado(espacio))
+    if ts is None:
+        ts = time.time()
+        versiones.add(_clave_modificado(espacio), ts, None)
+    return version(espacio), ts
+
+
+def ultima_modificacion(ts):
+    """Segundo HTTP que cubre ``ts``, o None si ese segundo no ha terminado."""
+    segundo = int(ts) + 1
+    return segundo if time.time() >= segundo else None
+
+
+def clave_consulta(request):
+    """path + query params normalizados (orden de claves y valores irrelevante)."""
+    params = sorted((k, sorted(request.query_params.getlist(k))) for k in request.query_params)
+    crudo = request.path + '?' + urlencode([(k, v) for k, vals in params for v in vals])
+    return hashlib.sha1(crudo.encode()).hexdigest()
+
+
+class RespuestaCondicionalMixin:
+    """Para vistas de lista públicas: ETag/Last-Modified desde la versión del espacio,
+    304 sin tocar la base de datos y la respuesta serializada en caché por consulta."""
+    cache_espacio = 'catalogo'
+
+    def list(self, request, *args, **kwargs):
+        v, ts = estado(self.cache_espacio)
+        modificado = ultima_modificacion(ts)
+        etag = quote_etag(f'{self.cache_espacio}-{v}')
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match is not None:
+            # comparación débil (RFC 9110): se ignora el prefijo W/
+            etags = [e.removeprefix('W/') for e in parse_etags(if_none_match)]
+            no_modificado = etag in etags or if_none_match.strip() == '*'
+        else:
+            desde = parse_http_date_safe(request.headers.get('If-Modified-Since') or '')
+            # estricto: un If-Modified-Since del mismo segundo que ts no cubre escrituras posteriores
+            no_modificado = desde is not None and ts < desde
+
+        if no_modificado:
+            response = Response(status=304)
+        elif not cacheable(request.query_params):
+            response = super().list(request, *args, **kwargs)
+        else:
+            response = Response(obtener(
+                self.cache_espacio, f'resp:{clave_consulta(request)}',
+                lambda: super(RespuestaCondicionalMixin, self).list(request, *args, **kwargs).data,
+            ))
+        response['ETag'] = etag
+        if modificado is not None:
+            response['Last-Modified'] = http_date(modificado)
+        # el navegador puede guardarla pero debe revalidar siempre (barato: 304)
+        response['Cache-Control'] = 'public, no-cache'
+        return response
@@ -0,0 +1,77 @@
+"""Árbol público de categorías con sus medicamentos.
+
+Cada categoría trae como máximo ``por_categoria`` medicamentos (Prefetch
+recortado: una sola consulta con ROW_NUMBER por categoría) y un cursor
+``medicamentos_siguiente`` para continuar dentro de esa categoría con
+``?categoria=<id>&cursor=<cursor>``. Los resultados se guardan en la caché
+versionada del espacio ``'catalogo'`` (ver ``inventario.cache``).
+"""
+import base64
+import json
+
+from django.db.models import Prefetch, Q
+
+from . import cache
+from .models import Categoria, Medicamento
+from .serializer import CategoriaSerializer, MedicamentoListSerializer
+
+POR_CATEGORIA = 20
+MAX_POR_CATEGORIA = 100
+ESPACIO = 'catalogo'
+
+
+def _medicamentos():
+    return Medicamento.objects.filter(estado=True).para_listado().order_by('nombre', 'id')
+
+
+def codificar_cursor(med):
+    crudo = json.dumps([med.nombre, med.id])
+    return base64.urlsafe_b64encode(crudo.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    """Retorna (nombre, id); ``ValueError`` si el cursor no es válido."""
+    try:
+        nombre, pk = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode())
+        return str(nombre), int(pk)
+    except (TypeError, ValueError) as e:
+        raise ValueError('Cursor inválido') from e
+
+
+def _pagina(meds, limite):
+    """Serializa hasta ``limite`` medicamentos (se reciben limite + 1) y el cursor siguiente."""
+    meds = list(meds)
+    siguiente = codificar_cursor(meds[limite - 1]) if len(meds) > limite else None
+    return MedicamentoListSerializer(meds[:limite], many=True).data, siguiente
+
+
+def construir_arbol(por_categoria=POR_CATEGORIA):
+    categorias = Categoria.objects.filter(activo=True).order_by('id').prefetch_related(
+        Prefetch('medicamentos', queryset=_medicamentos()[:por_categoria + 1], to_attr='medicamentos_pagina')
+    )
+    arbol = []
+    for cat in categorias:
+        data = dict(CategoriaSerializer(cat).data)
+        data['medicamentos'], data['medicamentos_siguiente'] = _pagina(cat.medicamentos_pagina, por_categoria)
+        arbol.append(data)
+    return arbol
+
+
+def construir_continuacion(categoria_id, cursor, por_categoria=POR_CATEGORIA):
+    nombre, pk = decodificar_cursor(cursor)
+    qs = (_medicamentos()
+          .filter(categoria_id=categoria_id, categoria__activo=True)
+          .filter(Q(nombre__gt=nombre) | Q(nombre=nombre, id__gt=pk)))
+    medicamentos, siguiente = _pagina(qs[:por_categoria + 1], por_categoria)
+    return {'id': categoria_id, 'medicamentos': medicamentos, 'medicamentos_siguiente': siguiente}
+
+
+def arbol(por_categoria=POR_CATEGORIA):
+    return cache.obtener(ESPACIO, f'arbol:{por_categoria}', lambda: construir_arbol(por_categoria))
+
+
+def continuacion(categoria_id, cursor, por_categoria=POR_CATEGORIA):
+    return cache.obtener(
+        ESPACIO, f'cat:{categoria_id}:{por_categoria}:{cursor}',
+        lambda: construir_continuacion(categoria_id, cursor, por_categoria),
+    )
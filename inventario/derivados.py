@@ -0,0 +1,232 @@
+"""Mantenimiento de los índices derivados de Medicamento.
+
+Lo que debe cuadrar con el stock se aplica en la misma transacción que la
+escritura (señales de modelo y ``stock_cambiado``, una por sentencia del libro):
+
+- agregados por droguería: un UPDATE por droguería con la suma de los deltas
+  de la escritura (inventario.agregados);
+- lotes: lote inicial de las altas, ``lotes.consumir`` (FEFO) de las salidas y
+  ``lotes.recortar`` cuando el total se escribió fuera del libro de stock.
+
+Un error en ellos revierte la escritura que los originó.
+
+El resto son efectos reconstruibles: solo se anota en memoria qué cambió, la
+primera anotación registra un único ``transaction.on_commit`` y al confirmar
+se aplica todo junto:
+
+- producto de los medicamentos nuevos (``productos.asignar``);
+- contadores de proveedores: el neto por proveedor;
+- índice de disponibilidad: ``reconstruir`` de los medicamentos escritos y
+  ``sincronizar`` de los que solo cambiaron de stock;
+- snapshot de alertas (``alertas.refrescar``);
+- cachés de códigos de barras, del catálogo y del resumen de inventarios (una
+  invalidación cada una; la del resumen también en el momento de la escritura).
+
+Las anotaciones se agrupan por punto de guardado: si un savepoint se revierte,
+Django descarta su ``on_commit`` y con él lo anotado dentro. Fuera de una
+transacción se aplican al terminar la operación. Un fallo al aplicar se
+registra en el log (``robust=True``) sin revertir el cambio ya confirmado; los
+comandos ``recalcular_proveedores``, ``reconstruir_disponibilidad`` y
+``agrupar_productos`` reparan los índices.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+
+from . import agregados, alertas, barcode, cache, disponibilidad, lotes, productos, proveedores
+from .models import Medicamento
+
+_local = threading.local()
+
+
+class _Pendientes:
+    """Cambios anotados en un mismo punto de guardado; se aplica al confirmar."""
+
+    def __init__(self):
+        self.codigos = set()           # (medicamento_id, clave de código de barras)
+        self.catalogo = False
+        self.productos = set()         # altas sin producto
+        self.escritos = set()          # filas escritas (save o libro de stock) en esta transacción
+        self.inventarios = False       # agregados cambiados: caché de ``agregados.resumen``
+        self.proveedores = {}          # nombre normalizado: [nombre, delta]
+        self.disponibilidad = set()    # fila del índice completa
+        self.sincronizar = set()       # solo disponible / excedente
+        self.alertas = {}              # id: droguerías conocidas además de la actual
+
+    def medicamento(self, medicamento_id, *droguerias):
+        self.alertas.setdefault(medicamento_id, set()).update(d for d in droguerias if d is not None)
+        self.catalogo = True
+
+    def confirmar(self):
+        lotes_abiertos = getattr(_local, 'lotes', {})
+        for clave, lote in list(lotes_abiertos.items()):
+            if lote is self:
+                del lotes_abiertos[clave]
+        self.aplicar()
+
+    def aplicar(self):
+        with transaction.atomic():
+            if self.productos:
+                productos.asignar(self.productos)
+            proveedores.ajustar(self.proveedores)
+            if self.disponibilidad:
+                disponibilidad.reconstruir(medicamento_ids=self.disponibilidad)
+            if self.sincronizar - self.disponibilidad:
+                disponibilidad.sincronizar(self.sincronizar - self.disponibilidad)
+            if self.alertas:
+                alertas.refrescar(self.alertas)
+        for medicamento_id, clave in self.codigos:
+            barcode.cache.invalidar(medicamento_id, clave)
+        if self.catalogo:
+            cache.invalidar('catalogo')
+        if self.inventarios:
+            # de nuevo al confirmar: una lectura concurrente pudo cachear el valor previo
+            cache.invalidar(agregados.ESPACIO)
+
+
+def _registrado(lote, conexion):
+    return any(getattr(func, '__self__', None) is lote for _, func, _ in conexion.run_on_commit)
+
+
+@contextmanager
+def _anotar():
+    """Lote del punto de guardado actual (o uno que se aplica al salir, sin transacción)."""
+    conexion = transaction.get_connection()
+    if not conexion.in_atomic_block:
+        lote = _Pendientes()
+        yield lote
+        lote.aplicar()
+        return
+    lotes_abiertos = getattr(_local, 'lotes', None)
+    if lotes_abiertos is None:
+        lotes_abiertos = _local.lotes = {}
+    # atomic(savepoint=False) apila None: comparte el lote del punto de guardado que lo contiene
+    clave = tuple(sid for sid in conexion.savepoint_ids if sid is not None)
+    lote = lotes_abiertos.get(clave)
+    if lote is None or not _registrado(lote, conexion):
+        # transacciones o savepoints revertidos dejan lotes sin on_commit
+        for vieja in [c for c, l in lotes_abiertos.items() if not _registrado(l, conexion)]:
+            del lotes_abiertos[vieja]
+        lote = lotes_abiertos[clave] = _Pendientes()
+        transaction.on_commit(lote.confirmar, robust=True)
+    yield lote
+
+
+def escrito(medicamento_id):
+    """¿La fila se escribió en la transacción en curso? (los valores leídos antes pueden estar viejos)"""
+    conexion = transaction.get_connection()
+    return conexion.in_atomic_block and any(
+        medicamento_id in lote.escritos for lote in getattr(_local, 'lotes', {}).values())
+
+
+class _Escritura:
+    """Lo que debe cuadrar con el stock de una escritura; se aplica en su misma transacción."""
+
+    def __init__(self):
+        self.agregados = {}            # drogueria_id: {campo: delta}
+        self.altas = {}                # id: (código de lote, vencimiento, stock al crear)
+        self.consumir = {}             # id: unidades que salieron por el libro de stock
+        self.recortar = set()          # total escrito fuera del libro de stock
+
+    def aplicar(self):
+        if self.altas:
+            lotes.crear_iniciales(self.altas)
+        lotes.consumir(self.consumir)
+        if self.recortar:
+            lotes.recortar(medicamento_ids=self.recortar)
+        if agregados.aplicar_acumulado(self.agregados):
+            cache.invalidar(agregados.ESPACIO)
+            with _anotar() as lote:
+                lote.inventarios = True
+
+
+# =========================
+# 💊 Escrituras de Medicamento
+# =========================
+def _contribucion(valores):
+    return agregados.contribucion(valores['stock_actual'], valores['precio_venta'], valores['costo_compra'])
+
+
+def guardado(medicamento, anterior, update_fields=None):
+    """Alta o edición de ``medicamento``; ``anterior``: valores seguidos en la fila (None si es alta)."""
+    escritura = _Escritura()
+    nuevo = _guardado(medicamento, anterior, update_fields, escritura)
+    escritura.aplicar()
+    return nuevo
+
+
+def creados(medicamentos):
+    """Altas escritas con ``bulk_create`` (no emite señales): se anotan como ``guardado``."""
+    escritura = _Escritura()
+    for medicamento in medicamentos:
+        _guardado(medicamento, None, None, escritura)
+    escritura.aplicar()
+
+
+def _guardado(medicamento, anterior, update_fields, escritura):
+    """Acumula en ``escritura`` agregados y lotes y anota el resto en el lote de la transacción."""
+    escritos = None if update_fields is None else {
+        Medicamento._meta.get_field(campo).attname for campo in update_fields}
+    nuevo = {campo: getattr(medicamento, campo) if escritos is None or campo in escritos or anterior is None
+             else anterior[campo] for campo in Medicamento.VALORES_SEGUIDOS}
+    mid = medicamento.id
+    if anterior is None:
+        agregados.mover(escritura.agregados, None, None, nuevo['drogueria_id'], _contribucion(nuevo))
+        if medicamento.stock_actual > 0:
+            escritura.altas[mid] = (medicamento.lote or '', medicamento.fecha_vencimiento, medicamento.stock_actual)
+    else:
+        agregados.mover(escritura.agregados, anterior['drogueria_id'], _contribucion(anterior),
+                        nuevo['drogueria_id'], _contribucion(nuevo))
+        if escritos is None or 'stock_actual' in escritos:
+            escritura.recortar.add(mid)
+    with _anotar() as lote:
+        lote.escritos.add(mid)
+        lote.codigos.add((mid, (medicamento.drogueria_id, barcode.normalizar_codigo(medicamento.codigo_barra))))
+        lote.medicamento(mid, anterior and anterior['drogueria_id'])
+        lote.disponibilidad.add(mid)
+        if anterior is None:
+            if medicamento.producto_id is None:
+                lote.productos.add(mid)
+            proveedores.acumular(lote.proveedores, nuevo['proveedor'], 1)
+        else:
+            proveedores.acumular(lote.proveedores, anterior['proveedor'], -1)
+            proveedores.acumular(lote.proveedores, nuevo['proveedor'], 1)
+    return nuevo
+
+
+def borrado(medicamento):
+    mid = medicamento.id
+    escritura = _Escritura()
+    agregados.mover(escritura.agregados, medicamento.drogueria_id, agregados.aporte(medicamento), None, None)
+    escritura.aplicar()
+    with _anotar() as lote:
+        lote.codigos.add((mid, (medicamento.drogueria_id, barcode.normalizar_codigo(medicamento.codigo_barra))))
+        lote.medicamento(mid, medicamento.drogueria_id)
+        proveedores.acumular(lote.proveedores, medicamento.proveedor, -1)
+        for pendientes in (lote.productos, lote.disponibilidad, lote.sincronizar):
+            pendientes.discard(mid)
+
+
+# =========================
+# 📒 Libro de stock
+# =========================
+def stock(cambios):
+    """Filas de una sentencia de ``inventario.stock``: dicts con medicamento_id, delta y, si
+    ``delta`` != 0, la droguería, el precio y el costo leídos en la misma sentencia."""
+    escritura = _Escritura()
+    for cambio in cambios:
+        if cambio['delta']:
+            agregados.sumar(escritura.agregados, cambio['drogueria_id'], agregados.contribucion(
+                cambio['delta'], cambio['precio_venta'], cambio['costo_compra'], medicamentos=0))
+        if cambio['delta'] < 0:
+            escritura.consumir[cambio['medicamento_id']] = -cambio['delta']
+    escritura.aplicar()
+    with _anotar() as lote:
+        for cambio in cambios:
+            medicamento_id, delta = cambio['medicamento_id'], cambio['delta']
+            lote.codigos.add((medicamento_id, None))
+            lote.medicamento(medicamento_id)
+            lote.sincronizar.add(medicamento_id)
+            if delta:
+                lote.escritos.add(medicamento_id)
@@ -0,0 +1,130 @@
+"""Índice de disponibilidad entre sucursales (``DisponibilidadProducto``).
+
+Antes de solicitar un ``Prestamo`` hay que saber qué droguerías tienen stock
+de sobra de un producto. El índice guarda, por medicamento activo, la clave de
+producto del maestro (``Producto``) y el nombre normalizado, el código de barras, el disponible
+(stock_actual - stock_reservado), el stock mínimo y el excedente sobre él, así
+``localizar`` responde con una única consulta agrupada sobre el índice
+(producto, excedente) o (clave, excedente) si se busca por nombre.
+
+Mantenimiento:
+- ``reconstruir``: altas y ediciones de medicamentos (por ids, al confirmar la
+  transacción; ver inventario.derivados) y cargas masivas sin señales
+  (importación, por droguería).
+- ``sincronizar``: cambios de stock del libro (``stock_cambiado``, al confirmar)
+  y UPDATE masivos; recalcula disponible y excedente desde Medicamento en una
+  sentencia.
+
+El índice se puede reconstruir desde Medicamento: si falla al confirmar, el
+movimiento se conserva y ``manage.py reconstruir_disponibilidad`` lo repara.
+"""
+from django.db import transaction
+from django.db.models import F, Min, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Greatest
+
+from .barcode import normalizar_codigo
+from .models import DisponibilidadProducto, Medicamento
+from .productos import clave_producto
+from .stock import BULK_BATCH_SIZE
+
+CAMPOS = ('drogueria', 'producto', 'clave', 'codigo_barra', 'disponible', 'stock_minimo', 'excedente')
+
+
+def _fila(mid, drogueria_id, producto_id, nombre, codigo_barra, actual, reservado, minimo):
+    disponible = max(actual - reservado, 0)
+    return DisponibilidadProducto(
+        medicamento_id=mid, drogueria_id=drogueria_id, producto_id=producto_id, clave=clave_producto(nombre),
+        codigo_barra=normalizar_codigo(codigo_barra) or None,
+        disponible=disponible, stock_minimo=minimo, excedente=disponible - minimo,
+    )
+
+
+def _guardar(filas):
+    if filas:
+        DisponibilidadProducto.objects.bulk_create(
+            filas, update_conflicts=True, unique_fields=['medicamento'], update_fields=list(CAMPOS),
+        )
+
+
+def actualizar(medicamento):
+    """Inserta o actualiza la fila de ``medicamento`` (la quita si está inactivo o sin droguería)."""
+    if not medicamento.estado or medicamento.drogueria_id is None:
+        DisponibilidadProducto.objects.filter(medicamento_id=medicamento.id).delete()
+        return
+    _guardar([_fila(medicamento.id, medicamento.drogueria_id, medicamento.producto_id,
+                    medicamento.nombre, medicamento.codigo_barra,
+                    medicamento.stock_actual, medicamento.stock_reservado, medicamento.stock_minimo)])
+
+
+def sincronizar(medicamento_ids):
+    """Recalcula disponible, stock_minimo y excedente desde Medicamento (ids o subconsulta)."""
+    med = Medicamento.objects.filter(pk=OuterRef('medicamento_id'))
+    disponible = Greatest(F('stock_actual') - F('stock_reservado'), Value(0))
+    DisponibilidadProducto.objects.filter(medicamento_id__in=medicamento_ids).update(
+        disponible=Subquery(med.values(v=disponible)[:1]),
+        stock_minimo=Subquery(med.values('stock_minimo')[:1]),
+        excedente=Subquery(med.values(v=disponible - F('stock_minimo'))[:1]),
+    )
+
+
+def reconstruir(drogueria_ids=None, medicamento_ids=None):
+    """Reconstruye el índice (de algunas droguerías, algunos medicamentos o completo). Retorna las filas escritas."""
+    medicamentos = Medicamento.objects.all()
+    if drogueria_ids is not None:
+        medicamentos = medicamentos.filter(drogueria_id__in=drogueria_ids)
+    if medicamento_ids is not None:
+        medicamento_ids = list(medicamento_ids)
+        medicamentos = medicamentos.filter(id__in=medicamento_ids)
+    activos = medicamentos.filter(estado=True, drogueria__isnull=False)
+    escritas, lote = 0, []
+    with transaction.atomic():
+        obsoletas = DisponibilidadProducto.objects.exclude(medicamento__in=activos.values('id'))
+        if medicamento_ids is not None:
+            obsoletas = obsoletas.filter(medicamento_id__in=medicamento_ids)
+        elif drogueria_ids is not None:
+            # filas de esas droguerías o de medicamentos que se movieron fuera de ellas
+            obsoletas = obsoletas.filter(medicamento__in=medicamentos.values('id')) | obsoletas.filter(
+                drogueria_id__in=drogueria_ids)
+        obsoletas.delete()
+        filas = activos.order_by('id').values_list(
+            'id', 'drogueria_id', 'producto_id', 'nombre', 'codigo_barra',
+            'stock_actual', 'stock_reservado', 'stock_minimo')
+        for fila in filas.iterator(chunk_size=2000):
+            lote.append(_fila(*fila))
+            if len(lote) == BULK_BATCH_SIZE:
+                _guardar(lote)
+                escritas += len(lote)
+                lote = []
+        _guardar(lote)
+    return escritas + len(lote)
+
+
+def localizar(nombre=None, codigo_barra=None, medicamento_id=None, sku=None, excluir_drogueria=None,
+              solo_excedente=False):
+    """Disponibilidad del producto por droguería, de mayor a menor excedente.
+
+    El producto se identifica por SKU, por código de barras o por uno de sus
+    medicamentos (join por ``producto_id``), o por nombre normalizado.
+    Retorna un QuerySet de dicts (una sola consulta).
+    """
+    if sku is not None:
+        filtro = {'producto__sku': sku.strip()}
+    elif codigo_barra is not None:
+        filtro = {'producto_id__in': DisponibilidadProducto.objects
+                  .filter(codigo_barra=normalizar_codigo(codigo_barra)).values('producto_id')}
+    elif medicamento_id is not None:
+        filtro = {'producto_id__in': Medicamento.objects.filter(pk=medicamento_id).values('producto_id')}
+    elif nombre is not None:
+        filtro = {'clave': clave_producto(nombre)}
+    else:
+        raise ValueError('Indique sku, nombre, codigo_barra o medicamento')
+
+    qs = DisponibilidadProducto.objects.filter(**filtro)
+    if excluir_drogueria is not None:
+        qs = qs.exclude(drogueria_id=excluir_drogueria)
+    qs = (qs.values('drogueria_id', 'drogueria__codigo', 'drogueria__nombre')
+          .annotate(medicamento=Min('medicamento_id'), total_disponible=Sum('disponible'),
+                    total_minimo=Sum('stock_minimo'), total_excedente=Sum('excedente')))
+    if solo_excedente:
+        qs = qs.filter(total_excedente__gt=0)
+    return qs.order_by('-total_excedente', 'drogueria_id')
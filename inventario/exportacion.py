@@ -0,0 +1,116 @@
+"""Exportación en flujo del inventario (CSV o JSONL, opcionalmente gzip).
+
+Las filas se leen con ``values_list(...).iterator(chunk_size=...)`` (sin
+instanciar modelos ni cargar el resultado completo) y se escriben en trozos de
+``FILAS_POR_TROZO`` filas, así la memoria no depende del tamaño del inventario.
+Las columnas coinciden con las que acepta ``inventario.importacion``
+(categoría por nombre, droguería por código), de modo que un archivo exportado
+se puede volver a importar.
+"""
+import csv
+import io
+import json
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+CHUNK_SIZE = 2000
+FILAS_POR_TROZO = 500
+
+# (columna del archivo, campo de la consulta)
+COLUMNAS = (
+    ('id', 'id'),
+    ('nombre', 'nombre'),
+    ('descripcion', 'descripcion'),
+    ('categoria', 'categoria__nombre'),
+    ('drogueria', 'drogueria__codigo'),
+    ('precio_venta', 'precio_venta'),
+    ('costo_compra', 'costo_compra'),
+    ('stock_actual', 'stock_actual'),
+    ('stock_reservado', 'stock_reservado'),
+    ('stock_minimo', 'stock_minimo'),
+    ('lote', 'lote'),
+    ('proveedor', 'proveedor'),
+    ('codigo_barra', 'codigo_barra'),
+    ('ubicacion', 'ubicacion'),
+    ('fecha_ingreso', 'fecha_ingreso'),
+    ('fecha_vencimiento', 'fecha_vencimiento'),
+    ('estado', 'estado'),
+)
+FORMATOS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'jsonl': ('application/x-ndjson; charset=utf-8', 'jsonl'),
+}
+
+
+def _filas(queryset):
+    campos = [campo for _, campo in COLUMNAS]
+    return queryset.values_list(*campos).iterator(chunk_size=CHUNK_SIZE)
+
+
+def _precio(valor):
+    # SQLite devuelve los DecimalField como REAL: se normalizan a 2 decimales
+    return None if valor is None else f'{valor:.2f}'
+
+
+def _normalizar(fila):
+    fila = list(fila)
+    fila[5], fila[6] = _precio(fila[5]), _precio(fila[6])
+    return fila
+
+
+def _trozos(filas, buffer, escribir):
+    """Escribe las filas en ``buffer`` y lo vacía cada FILAS_POR_TROZO (no una escritura por fila)."""
+    n = 0
+    for fila in filas:
+        escribir(_normalizar(fila))
+        n += 1
+        if n == FILAS_POR_TROZO:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            n = 0
+    if n:
+        yield buffer.getvalue()
+
+
+def csv_stream(queryset):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    # BOM para que Excel detecte UTF-8
+    buffer.write('\ufeff')
+    escritor.writerow([c for c, _ in COLUMNAS])
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    yield from _trozos(_filas(queryset), buffer, escritor.writerow)
+
+
+def jsonl_stream(queryset):
+    buffer = io.StringIO()
+    nombres = [c for c, _ in COLUMNAS]
+
+    def escribir(fila):
+        buffer.write(json.dumps(dict(zip(nombres, fila)), cls=DjangoJSONEncoder, ensure_ascii=False))
+        buffer.write('\n')
+
+    yield from _trozos(_filas(queryset), buffer, escribir)
+
+
+def gzip_stream(trozos):
+    """Comprime un flujo de texto en formato gzip sin acumularlo en memoria."""
+    compresor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 = contenedor gzip
+    for trozo in trozos:
+        datos = compresor.compress(trozo.encode('utf-8'))
+        if datos:
+            yield datos
+    yield compresor.flush()
+
+
+def exportar(queryset, formato='csv', comprimir=False):
+    """Retorna (iterable de bytes/str, content_type, extensión) para ``queryset``."""
+    content_type, extension = FORMATOS[formato]
+    trozos = csv_stream(queryset) if formato == 'csv' else jsonl_stream(queryset)
+    if comprimir:
+        return gzip_stream(trozos), 'application/gzip', extension + '.gz'
+    return trozos, content_type, extension
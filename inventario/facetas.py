@@ -0,0 +1,133 @@
+"""Facetas del catálogo público: conteos por categoría, rango de precio y disponibilidad.
+
+La barra de filtros de la tienda necesita, para la búsqueda actual, cuántos
+medicamentos hay en cada categoría, en cada rango de precio y disponibles o
+agotados. ``facetas`` aplica una sola vez los mismos filtros del catálogo
+(``apply_medicamento_filters`` y ``?search=``) y resuelve todos los conteos en
+una única consulta agrupada por categoría con agregación condicional
+(``COUNT(...) FILTER (WHERE ...)``); los totales por precio y disponibilidad
+se suman en Python sobre esas pocas filas.
+
+El resultado se guarda en la caché versionada del espacio ``'catalogo'`` con
+una clave de filtros normalizada: solo los parámetros que cambian el
+resultado, en orden, y los booleanos en forma canónica (``disponible=true`` y
+``disponible=1`` comparten entrada; la página o el orden no cuentan). Las
+búsquedas de texto libre no se guardan (``cache.cacheable``).
+"""
+import hashlib
+from decimal import Decimal, InvalidOperation
+from urllib.parse import urlencode
+
+from django.db.models import Count, F, Q
+
+from . import cache
+from .filters import apply_medicamento_filters
+from .models import Medicamento
+from .search import get_backend
+
+ESPACIO = 'catalogo'
+# límites de los rangos de precio (pesos): [0, 5000), [5000, 20000), ... [50000, ∞)
+CORTES_PRECIO = (Decimal('5000'), Decimal('20000'), Decimal('50000'))
+MAX_CORTES = 10
+# mismas columnas que ``?search=`` en el catálogo público
+COLUMNAS_BUSQUEDA = ('nombre', 'descripcion', 'codigo_barra', 'proveedor')
+
+# parámetros que interpreta apply_medicamento_filters (más ``search``)
+FILTROS = (
+    'q', 'nombre', 'categoria', 'categorias', 'drogueria', 'estado', 'producto', 'sku',
+    'precio_min', 'precio_max', 'stock_min', 'stock_max', 'disponible', 'lote',
+    'vencido', 'fecha_venc_from', 'fecha_venc_to', 'search',
+)
+
+
+def _booleano(param, valor):
+    # misma lectura que apply_medicamento_filters
+    if param == 'estado':
+        return '0' if str(valor).lower() in ('false', '0') else '1'
+    return '1' if str(valor).lower() in ('true', '1') else '0'
+
+
+def clave_filtros(params, cortes=CORTES_PRECIO):
+    """Clave de caché de la combinación de filtros (independiente del orden de los parámetros)."""
+    pares = []
+    for param in FILTROS:
+        valores = params.getlist(param)
+        if not valores:
+            continue
+        if param in ('estado', 'disponible', 'vencido'):
+            # apply_medicamento_filters solo lee el primer valor
+            valores = [_booleano(param, params.get(param))]
+        elif param == 'search':
+            valores = [params.get(param, '').strip()]
+        elif param != 'categorias':
+            valores = [params.get(param)]
+        pares += [(param, v) for v in sorted(valores)]
+    pares.append(('rangos', ','.join(str(c) for c in cortes)))
+    return hashlib.sha1(urlencode(pares).encode()).hexdigest()
+
+
+def leer_cortes(valor):
+    """``?rangos=5000,20000`` → límites crecientes; ``ValueError`` si no son válidos."""
+    if not valor:
+        return CORTES_PRECIO
+    try:
+        valores = {Decimal(v.strip()) for v in valor.split(',') if v.strip()}
+        if not all(v.is_finite() for v in valores):  # nan, Infinity
+            raise InvalidOperation
+        cortes = tuple(sorted(valores))
+    except InvalidOperation:
+        raise ValueError('rangos debe ser una lista de precios separados por coma') from None
+    if not cortes or len(cortes) > MAX_CORTES or cortes[0] <= 0:
+        raise ValueError(f'rangos admite entre 1 y {MAX_CORTES} precios positivos')
+    return cortes
+
+
+def _rangos(cortes):
+    limites = (None,) + tuple(cortes) + (None,)
+    return list(zip(limites, limites[1:]))
+
+
+def contar(qs, cortes=CORTES_PRECIO):
+    """Todas las facetas de ``qs`` en una consulta (agrupada por categoría)."""
+    rangos = _rangos(cortes)
+    agregados = {'total': Count('id'), 'disponibles': Count('id', filter=Q(stock_actual__gt=F('stock_reservado')))}
+    for i, (desde, hasta) in enumerate(rangos):
+        condicion = Q()
+        if desde is not None:
+            condicion &= Q(precio_venta__gte=desde)
+        if hasta is not None:
+            condicion &= Q(precio_venta__lt=hasta)
+        agregados[f'precio_{i}'] = Count('id', filter=condicion)
+    filas = list(qs.order_by().values('categoria_id', 'categoria__nombre').annotate(**agregados))
+
+    categorias = sorted(
+        ({'id': f['categoria_id'], 'nombre': f['categoria__nombre'], 'total': f['total']} for f in filas),
+        key=lambda c: (-c['total'], c['nombre'] is None, c['nombre'] or ''),
+    )
+    total = sum(f['total'] for f in filas)
+    disponibles = sum(f['disponibles'] for f in filas)
+    precios = [
+        {'desde': str(desde) if desde is not None else None, 'hasta': str(hasta) if hasta is not None else None,
+         'total': sum(f[f'precio_{i}'] for f in filas)}
+        for i, (desde, hasta) in enumerate(rangos)
+    ]
+    return {
+        'total': total,
+        'categorias': categorias,
+        'precios': precios,
+        'disponibilidad': {'disponible': disponibles, 'agotado': total - disponibles},
+    }
+
+
+def construir(params, cortes=CORTES_PRECIO):
+    qs = apply_medicamento_filters(Medicamento.objects.filter(estado=True), params)
+    termino = params.get('search', '').strip()
+    if termino:
+        qs = get_backend().buscar(qs, termino, COLUMNAS_BUSQUEDA)
+    return contar(qs, cortes)
+
+
+def facetas(params, cortes=CORTES_PRECIO):
+    if not cache.cacheable(params):
+        return construir(params, cortes)
+    return cache.obtener(ESPACIO, f'facetas:{clave_filtros(params, cortes)}', lambda: construir(params, cortes))
@@ -4,6 +4,27 @@ Centralizamos filtros para poder probar y mantenerlos fácilmente.
 """
 from django.db.models import Q, F
 from django.utils import timezone
+from rest_framework import filters
+
+from .search import get_backend
+
+# columnas que cubre el parámetro general `q` (sin proveedor)
+COLUMNAS_Q = ('nombre', 'descripcion', 'codigo_barra', 'lote')
+
+
+class BusquedaFilter(filters.BaseFilterBackend):
+    """Reemplazo de SearchFilter para medicamentos: usa el índice de búsqueda.
+
+    Lee ``?search=`` y limita la búsqueda a ``view.search_fields``; los
+    resultados quedan ordenados por relevancia salvo que se pida otro orden.
+    """
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        termino = request.query_params.get(self.search_param, '').strip()
+        if not termino:
+            return queryset
+        return get_backend().buscar(queryset, termino, getattr(view, 'search_fields', None))
 
 
 def apply_medicamento_filters(qs, params):
@@ -14,15 +35,11 @@ def apply_medicamento_filters(qs, params):
     estado = params.get('estado')
     orden = params.get('orden')  # 'nombre_asc', 'nombre_desc', 'precio_asc', 'precio_desc'
 
-    # búsqueda general (q) — si viene, usar sobre varios campos (sin proveedor)
+    # búsqueda general (q) — índice de texto sobre varios campos (sin proveedor),
+    # ordenado por relevancia salvo que se indique `orden`
     qparam = params.get('q')
     if qparam:
-        qs = qs.filter(
-            Q(nombre__icontains=qparam) |
-            Q(descripcion__icontains=qparam) |
-            Q(codigo_barra__icontains=qparam) |
-            Q(lote__icontains=qparam)
-        )
+        qs = get_backend().buscar(qs, qparam, COLUMNAS_Q)
 
     if nombre and not qparam:
         qs = qs.filter(nombre__icontains=nombre)
@@ -35,6 +52,13 @@ def apply_medicamento_filters(qs, params):
     
     if drogueria:
         qs = qs.filter(drogueria_id=drogueria)
+    # mismo producto del maestro en todas las droguerías
+    producto = params.get('producto')
+    if producto:
+        qs = qs.filter(producto_id=producto)
+    sku = params.get('sku')
+    if sku:
+        qs = qs.filter(producto__sku=sku.strip())
     if estado is not None:
         if str(estado).lower() in ('false', '0'):
             qs = qs.filter(estado=False)
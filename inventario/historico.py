@@ -0,0 +1,114 @@
+"""Stock histórico a partir de checkpoints periódicos.
+
+``generar_checkpoints`` guarda con un único ``INSERT ... SELECT`` el stock de
+todos los medicamentos en un instante (pensado para ejecutarse a diario con
+``manage.py generar_checkpoints``).
+
+``stock_en`` reconstruye el stock en una fecha ``Z`` con una sola consulta
+(subconsultas correlacionadas sobre índices) por lote de medicamentos:
+
+- hacia adelante: desde el último checkpoint en o antes de ``Z``, sumando el
+  delta de los movimientos del intervalo;
+- hacia atrás: si no hay ninguno antes de ``Z``, desde el primer checkpoint
+  posterior (o el stock actual) restando el delta del intervalo.
+
+El delta de un movimiento es +cantidad (entrada), -cantidad (salida) o la
+cantidad con signo (ajuste).
+
+Los cambios de stock escritos fuera del libro de stock (edición del
+medicamento, importación masiva) dejan un movimiento de ajuste con
+``registrar_ajustes``; sin él, la reconstrucción no vería ese salto.
+"""
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import EstadoTarea, Medicamento, MovimientoInventario, StockCheckpoint
+
+TAREA = 'checkpoints_stock'
+
+
+def generar_checkpoints(fecha=None):
+    """Inserta un checkpoint por medicamento con su stock actual. Retorna cuántos se crearon."""
+    fecha = fecha or timezone.now()
+    qn = connection.ops.quote_name
+    sql = 'INSERT INTO {cp} ({med}, {drog}, {fecha}, {stock}) SELECT {id}, {drog}, %s, {stock} FROM {tabla}'.format(
+        cp=qn(StockCheckpoint._meta.db_table),
+        med=qn('medicamento_id'),
+        drog=qn('drogueria_id'),
+        fecha=qn('fecha'),
+        stock=qn('stock_actual'),
+        id=qn('id'),
+        tabla=qn(Medicamento._meta.db_table),
+    )
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(sql, [connection.ops.adapt_datetimefield_value(fecha)])
+        creados = cursor.rowcount
+        EstadoTarea.objects.update_or_create(nombre=TAREA, defaults={'ultima_ejecucion': fecha})
+    return creados
+
+
+def registrar_ajustes(cambios, usuario_id=None, observacion=None):
+    """Movimientos de ajuste para stock ya escrito: ``cambios`` = [(medicamento_id, drogueria_id, delta)].
+
+    No vuelve a aplicar el delta (el stock ya cambió); se omiten los deltas en 0.
+    """
+    ahora = timezone.now()
+    MovimientoInventario.objects.bulk_create([
+        MovimientoInventario(medicamento_id=mid, drogueria_id=drogueria_id, tipo_movimiento='ajuste',
+                             cantidad=delta, fecha_movimiento=ahora, usuario_id=usuario_id, observacion=observacion)
+        for mid, drogueria_id, delta in cambios if delta
+    ], batch_size=500)
+
+
+def _movs():
+    return MovimientoInventario.objects.filter(medicamento=OuterRef('pk')).order_by()
+
+
+def _neto(movs):
+    """Subconsulta: suma de los deltas de ``movs``."""
+    return Subquery(
+        movs.values('medicamento')
+        .annotate(n=Sum(Case(
+            When(tipo_movimiento='salida', then=-F('cantidad')),
+            default=F('cantidad'),
+            output_field=IntegerField(),
+        )))
+        .values('n'),
+        output_field=IntegerField(),
+    )
+
+
+def stock_en(queryset, fecha):
+    """Anota ``stock_historico`` y ``base_historico`` ('checkpoint', 'posterior' o
+    'actual') sobre un queryset de Medicamento."""
+    cps = StockCheckpoint.objects.filter(medicamento=OuterRef('pk')).order_by()
+    cp_antes = cps.filter(fecha__lte=fecha).order_by('-fecha')
+    cp_despues = cps.filter(fecha__gt=fecha).order_by('fecha')
+
+    qs = queryset.annotate(
+        _cp_fecha=Subquery(cp_antes.values('fecha')[:1]),
+        _cp_stock=Subquery(cp_antes.values('stock_actual')[:1]),
+        _ref_fecha=Subquery(cp_despues.values('fecha')[:1]),
+        _ref_stock=Coalesce(Subquery(cp_despues.values('stock_actual')[:1]), F('stock_actual')),
+    ).annotate(
+        _hasta=Coalesce(F('_ref_fecha'), Value(timezone.now())),
+    ).annotate(
+        _neto_adelante=Coalesce(
+            _neto(_movs().filter(fecha_movimiento__gt=OuterRef('_cp_fecha'), fecha_movimiento__lte=fecha)), Value(0)),
+        _neto_atras=Coalesce(
+            _neto(_movs().filter(fecha_movimiento__gt=fecha, fecha_movimiento__lte=OuterRef('_hasta'))), Value(0)),
+    )
+    return qs.annotate(
+        stock_historico=Case(
+            When(_cp_fecha__isnull=False, then=Greatest(F('_cp_stock') + F('_neto_adelante'), Value(0))),
+            default=Greatest(F('_ref_stock') - F('_neto_atras'), Value(0)),
+            output_field=IntegerField(),
+        ),
+        base_historico=Case(
+            When(_cp_fecha__isnull=False, then=Value('checkpoint')),
+            When(_ref_fecha__isnull=False, then=Value('posterior')),
+            default=Value('actual'),
+        ),
+    )
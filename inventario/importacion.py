@@ -0,0 +1,359 @@
+"""Importación masiva de medicamentos desde CSV o XLSX con upsert.
+
+El archivo se recorre como flujo de filas en bloques de ``BLOQUE``; cada bloque:
+
+1. se valida en Python (sin un serializer por fila) y resuelve categoría y
+   droguería por nombre (o código) con diccionarios cargados una sola vez;
+   las categorías que no existen se crean;
+2. consulta qué (nombre, drogueria) ya existen, para contar creados/actualizados;
+3. se escribe con ``bulk_create(update_conflicts=True)`` sobre la restricción
+   única ``(nombre, drogueria)``: las filas nuevas se insertan y las existentes
+   actualizan solo las columnas con valor en su fila (una celda numérica vacía
+   no pisa el valor guardado); un ``bulk_create`` por combinación de columnas;
+4. confirma su propia transacción y actualiza ``ImportacionMedicamentos``, así
+   el progreso se puede consultar mientras corre.
+
+Las escrituras masivas no emiten señales: cada bloque ajusta los contadores de
+los proveedores que tocó, y al terminar se recalculan los agregados de las
+droguerías importadas y se invalidan las cachés de catálogo, alertas y
+códigos de barras. El índice FTS se mantiene por triggers.
+
+XLSX requiere ``openpyxl`` (en requirements.txt; sin ella se rechazan los XLSX con un error).
+"""
+import csv
+import io
+import os
+import tempfile
+import threading
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from droguerias.models import Drogueria
+
+from . import agregados, alertas, barcode, cache, disponibilidad, historico, lotes, productos, proveedores
+from .models import Categoria, ImportacionMedicamentos, Medicamento
+
+BLOQUE = 2000
+MAX_ERRORES = 200
+LOTE_SQL = 500
+
+# encabezado normalizado -> campo del modelo
+ALIAS = {
+    'precio': 'precio_venta',
+    'costo': 'costo_compra',
+    'stock': 'stock_actual',
+    'codigo': 'codigo_barra',
+    'codigo_de_barras': 'codigo_barra',
+    'vencimiento': 'fecha_vencimiento',
+    'ingreso': 'fecha_ingreso',
+}
+TEXTO = {'descripcion': None, 'lote': 60, 'proveedor': 150, 'codigo_barra': 120, 'ubicacion': 120, 'imagen_url': 500}
+DECIMALES = ('precio_venta', 'costo_compra')
+ENTEROS = ('stock_actual', 'stock_minimo')
+FECHAS = ('fecha_vencimiento', 'fecha_ingreso')
+COLUMNAS = {'nombre', 'categoria', 'drogueria', 'estado', *TEXTO, *DECIMALES, *ENTEROS, *FECHAS}
+OBLIGATORIAS = {'nombre', 'precio_venta'}
+MAX_PRECIO = Decimal('99999999.99')  # max_digits=10, decimal_places=2
+
+
+class ErrorFila(ValueError):
+    pass
+
+
+# =========================
+# 📄 Lectura del archivo
+# =========================
+def _normalizar_encabezado(valor):
+    clave = '_'.join(str(valor or '').strip().lower().split())
+    return ALIAS.get(clave, clave)
+
+
+def _filas_csv(archivo):
+    texto = io.TextIOWrapper(archivo, encoding='utf-8-sig', newline='')
+    muestra = texto.read(8192)
+    texto.seek(0)
+    try:
+        dialecto = csv.Sniffer().sniff(muestra, delimiters=',;\t')
+    except csv.Error:
+        dialecto = csv.excel
+    lector = csv.reader(texto, dialecto)
+    yield from lector
+
+
+def _filas_xlsx(archivo):
+    try:
+        import openpyxl
+    except ImportError:
+        raise ValueError('Importar XLSX requiere openpyxl (pip install openpyxl)') from None
+    libro = openpyxl.load_workbook(archivo, read_only=True, data_only=True)
+    try:
+        yield from libro.active.iter_rows(values_only=True)
+    finally:
+        libro.close()
+
+
+def leer_filas(archivo, nombre):
+    """Genera dicts {campo: valor crudo} a partir de un archivo binario CSV o XLSX."""
+    extension = os.path.splitext(nombre or '')[1].lower()
+    if extension == '.xlsx':
+        filas = _filas_xlsx(archivo)
+    elif extension in ('.csv', '.txt', ''):
+        filas = _filas_csv(archivo)
+    else:
+        raise ValueError(f'Formato no soportado: {extension} (use .csv o .xlsx)')
+    encabezado = [_normalizar_encabezado(c) for c in next(filas, None) or []]
+    if faltantes := OBLIGATORIAS - set(encabezado):
+        raise ValueError(f"Faltan columnas obligatorias: {', '.join(sorted(faltantes))}")
+    indices = [(i, c) for i, c in enumerate(encabezado) if c in COLUMNAS]
+    for fila in filas:
+        if not any(v not in (None, '') for v in fila):
+            continue
+        yield {c: fila[i] if i < len(fila) else None for i, c in indices}
+
+
+# =========================
+# ✅ Validación
+# =========================
+def _vacio(valor):
+    return valor is None or (isinstance(valor, str) and not valor.strip())
+
+
+def _decimal(valor, campo):
+    if isinstance(valor, (int, float, Decimal)):
+        numero = Decimal(str(valor))
+    else:
+        texto = str(valor).strip().replace('$', '').replace(' ', '')
+        if ',' in texto and '.' not in texto:
+            texto = texto.replace(',', '.')
+        try:
+            numero = Decimal(texto)
+        except InvalidOperation:
+            raise ErrorFila(f'{campo} no es un número: {valor!r}') from None
+    if not numero.is_finite() or numero < 0 or numero > MAX_PRECIO:
+        raise ErrorFila(f'{campo} fuera de rango: {valor!r}')
+    return numero.quantize(Decimal('0.01'))
+
+
+def _entero(valor, campo):
+    try:
+        numero = Decimal(str(valor).strip())
+    except InvalidOperation:
+        raise ErrorFila(f'{campo} no es un entero: {valor!r}') from None
+    if numero != numero.to_integral_value() or numero < 0:
+        raise ErrorFila(f'{campo} debe ser un entero no negativo: {valor!r}')
+    return int(numero)
+
+
+def _fecha(valor, campo):
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    try:
+        fecha = parse_date(str(valor).strip())
+    except ValueError:
+        fecha = None
+    if fecha is None:
+        raise ErrorFila(f'{campo} debe tener formato AAAA-MM-DD: {valor!r}')
+    return fecha
+
+
+def _booleano(valor):
+    if isinstance(valor, bool):
+        return valor
+    return str(valor).strip().lower() not in ('0', 'false', 'no', 'inactivo', 'f', 'n')
+
+
+class Resolutor:
+    """Cachés nombre/código -> id de categorías y droguerías para toda la importación."""
+
+    def __init__(self, drogueria_defecto=None):
+        self.drogueria_defecto = drogueria_defecto
+        self.categorias = {n.casefold(): i for i, n in Categoria.objects.values_list('id', 'nombre')}
+        self.droguerias = {}
+        for i, nombre, codigo in Drogueria.objects.values_list('id', 'nombre', 'codigo'):
+            self.droguerias.setdefault(codigo.casefold(), i)
+            self.droguerias.setdefault(nombre.casefold(), i)
+
+    def categoria(self, nombre):
+        if _vacio(nombre):
+            return None
+        nombre = ' '.join(str(nombre).split())[:100]
+        clave = nombre.casefold()
+        if clave not in self.categorias:
+            self.categorias[clave] = Categoria.objects.get_or_create(nombre=nombre)[0].id
+        return self.categorias[clave]
+
+    def drogueria(self, valor):
+        if _vacio(valor):
+            if self.drogueria_defecto is None:
+                raise ErrorFila('Falta la droguería (columna drogueria o droguería por defecto)')
+            return self.drogueria_defecto
+        drogueria_id = self.droguerias.get(str(valor).strip().casefold())
+        if drogueria_id is None:
+            raise ErrorFila(f'Droguería desconocida: {valor!r}')
+        return drogueria_id
+
+
+def validar(fila, resolutor):
+    """Convierte una fila cruda en kwargs de Medicamento. Lanza ErrorFila."""
+    nombre = ' '.join(str(fila.get('nombre') or '').split())
+    if not nombre:
+        raise ErrorFila('nombre es obligatorio')
+    if len(nombre) > 150:
+        raise ErrorFila('nombre supera 150 caracteres')
+    if _vacio(fila.get('precio_venta')):
+        raise ErrorFila('precio_venta es obligatorio')
+    datos = {'nombre': nombre, 'drogueria_id': resolutor.drogueria(fila.get('drogueria'))}
+    for campo, valor in fila.items():
+        if campo in ('nombre', 'drogueria'):
+            continue
+        if campo == 'categoria':
+            datos['categoria_id'] = resolutor.categoria(valor)
+        elif _vacio(valor):
+            if campo in TEXTO or campo in FECHAS:
+                datos[campo] = None
+        elif campo in DECIMALES:
+            datos[campo] = _decimal(valor, campo)
+        elif campo in ENTEROS:
+            datos[campo] = _entero(valor, campo)
+        elif campo in FECHAS:
+            datos[campo] = _fecha(valor, campo)
+        elif campo == 'estado':
+            datos[campo] = _booleano(valor)
+        else:
+            texto = str(valor).strip()
+            limite = TEXTO[campo]
+            if limite and len(texto) > limite:
+                raise ErrorFila(f'{campo} supera {limite} caracteres')
+            datos[campo] = texto
+    return datos
+
+
+# =========================
+# 💾 Escritura por bloques
+# =========================
+def _escribir_bloque(filas, usuario_id=None):
+    """Upsert de un bloque ya validado. Retorna (creados, actualizados)."""
+    # la última fila de un mismo (nombre, drogueria) dentro del bloque gana
+    por_clave = {(d['nombre'], d['drogueria_id']): d for d in filas}
+    # bloqueadas hasta confirmar el bloque: el ajuste de stock se calcula contra este valor
+    existentes = {(nombre, drogueria_id): (mid, stock, proveedor) for nombre, drogueria_id, mid, stock, proveedor in (
+        Medicamento.objects.select_for_update()
+        .filter(drogueria_id__in={k[1] for k in por_clave}, nombre__in={k[0] for k in por_clave})
+        .values_list('nombre', 'drogueria_id', 'id', 'stock_actual', 'proveedor'))}
+    # las filas existentes actualizan solo las columnas con valor en su fila (una celda
+    # numérica vacía no está en ``d``); las nuevas toman el valor por defecto del modelo
+    grupos = {}
+    for d in por_clave.values():
+        grupos.setdefault(frozenset(d), []).append(d)
+    for columnas, datos in grupos.items():
+        objetos = [Medicamento(**d) for d in datos]
+        actualizables = sorted({c.removesuffix('_id') for c in columnas} - {'nombre', 'drogueria'})
+        if 'fecha_vencimiento' in columnas:
+            # bulk_create no pasa por save(): el barrido de vencimientos revisa las fechas importadas
+            for objeto in objetos:
+                objeto.revisar_vencimiento = objeto.fecha_vencimiento is not None
+            actualizables.append('revisar_vencimiento')
+        Medicamento.objects.bulk_create(
+            objetos,
+            batch_size=LOTE_SQL,
+            update_conflicts=True,
+            unique_fields=['nombre', 'drogueria'],
+            update_fields=actualizables,
+        )
+    # stock importado sobre filas existentes: movimiento de ajuste (stock histórico)
+    historico.registrar_ajustes(
+        [(mid, clave[1], por_clave[clave]['stock_actual'] - stock) for clave, (mid, stock, _) in existentes.items()
+         if 'stock_actual' in por_clave[clave]],
+        usuario_id=usuario_id, observacion='Importación masiva',
+    )
+    # contadores solo de los proveedores que cambian en este bloque
+    netos = {}
+    for clave, d in por_clave.items():
+        if 'proveedor' in d:
+            if clave in existentes:
+                proveedores.acumular(netos, existentes[clave][2], -1)
+            proveedores.acumular(netos, d['proveedor'], 1)
+    proveedores.ajustar(netos)
+    actualizados = len(existentes.keys() & por_clave.keys())
+    return len(por_clave) - actualizados, actualizados
+
+
+def _finalizar(drogueria_ids):
+    lotes.recortar(drogueria_ids=drogueria_ids)
+    productos.agrupar(drogueria_ids=drogueria_ids)
+    disponibilidad.reconstruir(drogueria_ids=drogueria_ids)
+    agregados.recalcular(drogueria_ids=drogueria_ids)
+    alertas.invalidar_todo()
+    cache.invalidar('catalogo')
+    barcode.cache.limpiar()
+
+
+def importar(importacion, archivo, bloque=BLOQUE):
+    """Procesa ``archivo`` (binario) y va actualizando ``importacion``. Retorna la importación."""
+    ImportacionMedicamentos.objects.filter(pk=importacion.pk).update(estado='procesando')
+    progreso = {'filas_procesadas': 0, 'creados': 0, 'actualizados': 0, 'con_error': 0}
+    errores, droguerias, estado = [], set(), 'fallida'
+    try:
+        resolutor = Resolutor(importacion.drogueria_id)
+        filas = leer_filas(archivo, importacion.archivo)
+        numero, terminado = 1, False  # la fila 1 es el encabezado
+        while not terminado:
+            validas = []
+            for _ in range(bloque):
+                fila = next(filas, None)
+                if fila is None:
+                    terminado = True
+                    break
+                numero += 1
+                progreso['filas_procesadas'] += 1
+                try:
+                    validas.append(validar(fila, resolutor))
+                except ErrorFila as e:
+                    progreso['con_error'] += 1
+                    if len(errores) < MAX_ERRORES:
+                        errores.append({'fila': numero, 'error': str(e)})
+            if validas:
+                with transaction.atomic():
+                    creados, actualizados = _escribir_bloque(validas, importacion.usuario_id)
+                progreso['creados'] += creados
+                progreso['actualizados'] += actualizados
+                droguerias.update(d['drogueria_id'] for d in validas)
+            ImportacionMedicamentos.objects.filter(pk=importacion.pk).update(errores=errores, **progreso)
+        estado = 'completada'
+    except ValueError as e:
+        # archivo ilegible, formato no soportado o sin columnas obligatorias
+        errores.append({'fila': None, 'error': str(e)})
+    finally:
+        # también si falla a mitad: los bloques ya confirmados quedan
+        if droguerias:
+            _finalizar(droguerias)
+        ImportacionMedicamentos.objects.filter(pk=importacion.pk).update(
+            estado=estado, errores=errores, finalizado_en=timezone.now(), **progreso)
+    importacion.refresh_from_db()
+    return importacion
+
+
+def importar_en_segundo_plano(importacion, subido):
+    """Copia el archivo subido a disco e importa en un hilo aparte (progreso vía ``importacion``)."""
+    extension = os.path.splitext(importacion.archivo)[1]
+    with tempfile.NamedTemporaryFile(suffix=extension, delete=False) as destino:
+        for parte in subido.chunks():
+            destino.write(parte)
+
+    def ejecutar():
+        try:
+            with open(destino.name, 'rb') as archivo:
+                importar(importacion, archivo)
+        finally:
+            os.unlink(destino.name)
+            connection.close()
+
+    hilo = threading.Thread(target=ejecutar, name=f'importacion-{importacion.pk}', daemon=True)
+    hilo.start()
+    return hilo
@@ -0,0 +1,154 @@
+"""Stock por lote con asignación FEFO (first-expiry-first-out).
+
+``LoteMedicamento`` guarda las existencias de cada lote; ``Medicamento`` sigue
+siendo la fila que leen los listados (``stock_actual`` total, ``lote`` y
+``fecha_vencimiento`` del próximo lote en vencer), mantenida con deltas.
+
+- ``ingresar``: entrada de un lote (suma al lote existente o lo crea) y al total.
+- ``consumir``: se ejecuta con los deltas negativos de ``stock_cambiado``
+  (salidas, préstamos, transferencias, ajustes; ver inventario.derivados), en la
+  misma transacción que el UPDATE del libro. Descuenta los lotes en orden de
+  vencimiento con un único ``UPDATE ... FROM`` sobre una suma acumulada
+  (``SUM() OVER``): cada lote pierde lo que queda del pedido tras los lotes que
+  vencen antes, sin recorrerlos en Python.
+- ``recortar``: misma asignación cuando el total se cambió fuera del libro de
+  stock (``save()`` o importación masiva) y los lotes suman más que él.
+
+El stock sin lote (``stock_actual`` - suma de lotes) se consume al final.
+"""
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Case, Exists, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import NullIf
+
+from .models import LoteMedicamento, Medicamento
+from .stock import BULK_BATCH_SIZE, _soporta_returning, aplicar_delta
+
+
+def _asignar(pedido, params_pedido, condicion, params_condicion, join=''):
+    """Descuenta de los lotes el ``pedido`` (expresión SQL por medicamento) en orden FEFO.
+
+    Retorna los ids de medicamentos con algún lote agotado (su próximo
+    vencimiento cambió), o None si el motor no permite saberlo.
+    """
+    qn = connection.ops.quote_name
+    tabla, cantidad, venc = qn(LoteMedicamento._meta.db_table), qn('cantidad'), qn('fecha_vencimiento')
+    id_, med = qn('id'), qn('medicamento_id')
+    sql = (
+        'WITH asignacion AS ('
+        ' SELECT l.{id} AS lote_id, l.{c} AS disponible,'
+        ' SUM(l.{c}) OVER (PARTITION BY l.{med} ORDER BY l.{v} IS NULL, l.{v}, l.{id}) AS acumulado,'
+        ' {pedido} AS pedido'
+        ' FROM {t} l {join} WHERE l.{c} > 0 AND {condicion}'
+        ') '
+        'UPDATE {t} SET {c} = CASE WHEN asignacion.acumulado <= asignacion.pedido THEN 0'
+        ' ELSE asignacion.acumulado - asignacion.pedido END '
+        'FROM asignacion WHERE {t}.{id} = asignacion.lote_id'
+        ' AND asignacion.acumulado - asignacion.disponible < asignacion.pedido'
+    ).format(t=tabla, c=cantidad, v=venc, id=id_, med=med, pedido=pedido, join=join, condicion=condicion)
+    params = params_pedido + params_condicion
+    with connection.cursor() as cursor:
+        if _soporta_returning():
+            cursor.execute(sql + ' RETURNING {}, {}'.format(med, cantidad), params)
+            return {mid for mid, restante in cursor.fetchall() if restante == 0}
+        cursor.execute(sql, params)
+        return None
+
+
+def refrescar_proximo(medicamento_ids):
+    """Copia a Medicamento el código y vencimiento del próximo lote con stock.
+
+    Si el vencimiento cambia, la fila queda marcada para el barrido de vencimientos.
+    """
+    primero = (LoteMedicamento.objects.filter(medicamento=OuterRef('pk'), cantidad__gt=0)
+               .order_by(F('fecha_vencimiento').asc(nulls_last=True), 'id'))
+    proximo = Subquery(primero.values('fecha_vencimiento')[:1])
+    Medicamento.objects.filter(id__in=medicamento_ids).filter(Exists(primero)).update(
+        fecha_vencimiento=proximo,
+        lote=NullIf(Subquery(primero.values('codigo')[:1]), Value('')),
+        revisar_vencimiento=Case(When(Q(fecha_vencimiento=proximo), then=F('revisar_vencimiento')),
+                                 default=Value(True)),
+    )
+
+
+def consumir(cantidades):
+    """Descuenta {medicamento_id: unidades} de los lotes, primero el que vence antes.
+
+    Si los lotes no alcanzan, el resto corresponde a stock sin lote.
+    """
+    cantidades = {mid: n for mid, n in cantidades.items() if n > 0}
+    if not cantidades:
+        return
+    ids = sorted(cantidades)
+    pedido = 'CASE l.{} {} END'.format(connection.ops.quote_name('medicamento_id'),
+                                       ' '.join(['WHEN %s THEN %s'] * len(ids)))
+    condicion = 'l.{} IN ({})'.format(connection.ops.quote_name('medicamento_id'), ', '.join(['%s'] * len(ids)))
+    agotados = _asignar(pedido, [p for mid in ids for p in (mid, cantidades[mid])], condicion, ids)
+    if agotados is None or agotados:
+        refrescar_proximo(ids if agotados is None else agotados)
+
+
+def recortar(medicamento_ids=None, drogueria_ids=None):
+    """Ajusta los lotes cuyo total supera ``stock_actual`` (FEFO), en una sentencia."""
+    qn = connection.ops.quote_name
+    med_t = qn(Medicamento._meta.db_table)
+    join = 'JOIN {m} ON {m}.{id} = l.{med}'.format(m=med_t, id=qn('id'), med=qn('medicamento_id'))
+    pedido = 'SUM(l.{c}) OVER (PARTITION BY l.{med}) - {m}.{stock}'.format(
+        c=qn('cantidad'), med=qn('medicamento_id'), m=med_t, stock=qn('stock_actual'))
+    condiciones, params = ['1 = 1'], []
+    if medicamento_ids is not None:
+        ids = sorted(medicamento_ids)
+        if not ids:
+            return
+        condiciones.append('l.{} IN ({})'.format(qn('medicamento_id'), ', '.join(['%s'] * len(ids))))
+        params += ids
+    if drogueria_ids is not None:
+        ids = sorted(drogueria_ids)
+        if not ids:
+            return
+        condiciones.append('{}.{} IN ({})'.format(med_t, qn('drogueria_id'), ', '.join(['%s'] * len(ids))))
+        params += ids
+    agotados = _asignar(pedido, [], ' AND '.join(condiciones), params, join=join)
+    if agotados is None:
+        agotados = Medicamento.objects.all()
+        if medicamento_ids is not None:
+            agotados = agotados.filter(id__in=medicamento_ids)
+        if drogueria_ids is not None:
+            agotados = agotados.filter(drogueria_id__in=drogueria_ids)
+        refrescar_proximo(agotados.values('id'))
+    elif agotados:
+        refrescar_proximo(agotados)
+
+
+def ingresar(medicamento_id, cantidad, codigo, fecha_vencimiento=None):
+    """Entrada de ``cantidad`` unidades del lote ``codigo``. Retorna el nuevo stock_actual.
+
+    Si el lote ya existe se suma a él (su vencimiento no cambia).
+    """
+    if cantidad <= 0:
+        raise ValueError('La cantidad debe ser mayor que 0')
+    codigo = (codigo or '').strip()
+    with transaction.atomic():
+        lotes = LoteMedicamento.objects.filter(medicamento_id=medicamento_id, codigo=codigo)
+        if not lotes.update(cantidad=F('cantidad') + cantidad):
+            try:
+                with transaction.atomic():
+                    LoteMedicamento.objects.create(medicamento_id=medicamento_id, codigo=codigo,
+                                                   fecha_vencimiento=fecha_vencimiento, cantidad=cantidad)
+            except IntegrityError:
+                # otra entrada concurrente creó el lote
+                lotes.update(cantidad=F('cantidad') + cantidad)
+        nuevo = aplicar_delta(medicamento_id, cantidad)
+        refrescar_proximo([medicamento_id])
+    return nuevo
+
+
+def crear_iniciales(altas):
+    """Lotes del stock de alta: {medicamento_id: (código, vencimiento, cantidad)}.
+
+    Se crean junto con el alta (inventario.derivados), antes de cualquier otro
+    lote del medicamento.
+    """
+    LoteMedicamento.objects.bulk_create([
+        LoteMedicamento(medicamento_id=mid, codigo=codigo, fecha_vencimiento=fecha, cantidad=cantidad)
+        for mid, (codigo, fecha, cantidad) in sorted(altas.items())
+    ], batch_size=BULK_BATCH_SIZE)
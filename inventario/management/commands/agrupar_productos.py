@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from inventario.productos import agrupar
+
+
+class Command(BaseCommand):
+    help = "Asigna el producto del maestro (SKU) a los medicamentos que no lo tienen, agrupando por nombre y código de barras."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--drogueria', type=int, action='append', dest='droguerias',
+                            help='Limitar a una droguería (repetible)')
+
+    def handle(self, *args, **options):
+        resultado = agrupar(drogueria_ids=options['droguerias'])
+        self.stdout.write(
+            f"Medicamentos asignados: {resultado['asignados']} · productos nuevos: {resultado['creados']}"
+        )
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventario.vencimientos import DIAS_AVISO, barrer
+
+
+class Command(BaseCommand):
+    help = "Genera alertas de medicamentos vencidos o próximos a vencer desde el último barrido."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=DIAS_AVISO, help='Días de anticipación para "próximo a vencer"')
+        parser.add_argument('--completo', action='store_true', help='Ignorar el último barrido y revisar todo el rango')
+        parser.add_argument('--continuo', action='store_true', help='Repetir el barrido en bucle (planificador en proceso)')
+        parser.add_argument('--intervalo', type=float, default=3600.0, help='Segundos entre barridos en modo continuo')
+
+    def handle(self, *args, **options):
+        completo = options['completo']
+        while True:
+            totales = barrer(dias=options['dias'], completo=completo)
+            self.stdout.write(f"Alertas creadas: vencidos={totales['vencido']} por_vencer={totales['por_vencer']}")
+            if not options['continuo']:
+                return
+            completo = False
+            time.sleep(options['intervalo'])
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventario.outbox import LOTE_DRENAJE, drenar
+
+
+class Command(BaseCommand):
+    help = "Materializa los eventos pendientes del outbox de inventario (AuditLog y Alertas)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=LOTE_DRENAJE, help='Eventos procesados por transacción')
+        parser.add_argument('--continuo', action='store_true', help='Seguir drenando en bucle (proceso en segundo plano)')
+        parser.add_argument('--intervalo', type=float, default=2.0, help='Segundos de espera entre pasadas en modo continuo')
+
+    def handle(self, *args, **options):
+        while True:
+            procesados = drenar(lote=options['lote'])
+            if procesados or not options['continuo']:
+                self.stdout.write(f"Eventos procesados: {procesados}")
+            if not options['continuo']:
+                return
+            time.sleep(options['intervalo'])
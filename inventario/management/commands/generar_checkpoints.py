@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventario.historico import generar_checkpoints
+
+
+class Command(BaseCommand):
+    help = "Guarda un checkpoint del stock de cada medicamento (para consultas de stock histórico)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--continuo', action='store_true', help='Repetir en bucle (planificador en proceso)')
+        parser.add_argument('--intervalo', type=float, default=86400.0, help='Segundos entre checkpoints en modo continuo')
+
+    def handle(self, *args, **options):
+        while True:
+            creados = generar_checkpoints()
+            self.stdout.write(f"Checkpoints creados: {creados}")
+            if not options['continuo']:
+                return
+            time.sleep(options['intervalo'])
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from droguerias.models import Drogueria
+from inventario.importacion import BLOQUE, importar
+from inventario.models import ImportacionMedicamentos
+
+
+class Command(BaseCommand):
+    help = "Importa (upsert por nombre y droguería) medicamentos desde un archivo CSV o XLSX."
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Ruta del archivo .csv o .xlsx')
+        parser.add_argument('--drogueria', help='Código de la droguería para filas sin columna drogueria')
+        parser.add_argument('--bloque', type=int, default=BLOQUE, help='Filas por transacción')
+
+    def handle(self, *args, **options):
+        drogueria = None
+        if options['drogueria']:
+            drogueria = Drogueria.objects.filter(codigo=options['drogueria']).first()
+            if drogueria is None:
+                raise CommandError(f"Droguería {options['drogueria']} no existe")
+        registro = ImportacionMedicamentos.objects.create(drogueria=drogueria, archivo=options['archivo'][-255:])
+        with open(options['archivo'], 'rb') as archivo:
+            registro = importar(registro, archivo, bloque=options['bloque'])
+        self.stdout.write(
+            f"{registro.estado}: {registro.filas_procesadas} filas, {registro.creados} creados, "
+            f"{registro.actualizados} actualizados, {registro.con_error} con error"
+        )
+        for error in registro.errores[:20]:
+            self.stdout.write(f"  fila {error['fila']}: {error['error']}")
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventario.reservas import LOTE, liberar_vencidas
+
+
+class Command(BaseCommand):
+    help = "Cancela préstamos y transferencias pendientes vencidos y libera su stock reservado."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=LOTE, help='Solicitudes por transacción')
+        parser.add_argument('--continuo', action='store_true', help='Repetir en bucle (planificador en proceso)')
+        parser.add_argument('--intervalo', type=float, default=300.0, help='Segundos entre barridos en modo continuo')
+
+    def handle(self, *args, **options):
+        while True:
+            totales = liberar_vencidas(lote=options['lote'])
+            self.stdout.write(f"Préstamos cancelados: {totales['prestamos']}, transferencias: {totales['transferencias']}")
+            if not options['continuo']:
+                return
+            time.sleep(options['intervalo'])
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventario.pronostico import METODOS, pronosticar
+
+
+class Command(BaseCommand):
+    help = "Recalcula el pronóstico de demanda, stock de seguridad y punto de reorden de todos los medicamentos."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=90, help='Días de historia de salidas')
+        parser.add_argument('--metodo', choices=sorted(METODOS), default='media_movil')
+        parser.add_argument('--ventana', type=int, default=28, help='Días de la media móvil')
+        parser.add_argument('--alfa', type=float, default=0.3, help='Factor del suavizado exponencial')
+        parser.add_argument('--plazo', type=int, default=7, help='Días de reposición del proveedor')
+        parser.add_argument('--servicio', type=float, default=0.95, help='Nivel de servicio (0.5 - 0.999)')
+        parser.add_argument('--drogueria', type=int, action='append', dest='droguerias',
+                            help='Limitar a una droguería (repetible)')
+        parser.add_argument('--aplicar', action='store_true',
+                            help='Copiar el punto de reorden a stock_minimo de los medicamentos con demanda')
+
+    def handle(self, *args, **options):
+        try:
+            resultado = pronosticar(
+                dias=options['dias'], metodo=options['metodo'], ventana=options['ventana'],
+                alfa=options['alfa'], plazo=options['plazo'], servicio=options['servicio'],
+                drogueria_ids=options['droguerias'], aplicar=options['aplicar'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(
+            f"Medicamentos: {resultado['medicamentos']} (con demanda: {resultado['con_demanda']}); "
+            f"stock_minimo actualizado: {resultado['aplicados']}"
+        )
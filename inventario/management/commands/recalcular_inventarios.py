@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from inventario.agregados import recalcular
+
+
+class Command(BaseCommand):
+    help = "Verifica y repara los agregados de InventarioDrogueria contra Medicamento (tras cargas masivas)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=4, help='Bloques de droguerías procesados en paralelo')
+        parser.add_argument('--bloque', type=int, default=200, help='Droguerías por bloque (una transacción cada uno)')
+
+    def handle(self, *args, **options):
+        reparadas = recalcular(hilos=options['hilos'], bloque=options['bloque'])
+        self.stdout.write(f"Droguerías reparadas: {len(reparadas)}")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from inventario.proveedores import recalcular
+
+
+class Command(BaseCommand):
+    help = "Reconstruye la tabla de proveedores y sus contadores desde Medicamento (tras cargas masivas)."
+
+    def handle(self, *args, **options):
+        total = recalcular()
+        self.stdout.write(f"Proveedores: {total}")
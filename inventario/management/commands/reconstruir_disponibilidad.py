@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from inventario.disponibilidad import reconstruir
+
+
+class Command(BaseCommand):
+    help = "Reconstruye el índice de disponibilidad entre sucursales desde Medicamento (tras cargas masivas)."
+
+    def handle(self, *args, **options):
+        total = reconstruir()
+        self.stdout.write(f"Medicamentos indexados: {total}")
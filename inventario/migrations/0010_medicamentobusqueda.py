@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-17 12:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0009_eventooutbox_auditlog_created_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MedicamentoBusqueda',
+            fields=[
+                ('medicamento', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='busqueda', serialize=False, to='inventario.medicamento')),
+                ('indice', models.TextField(db_column='inventario_medicamento_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'inventario_medicamento_fts',
+                'managed': False,
+            },
+        ),
+    ]
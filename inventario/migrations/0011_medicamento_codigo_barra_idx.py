@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 12:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('droguerias', '0004_inventariodrogueria_movimientodrogueria'),
+        ('inventario', '0010_medicamentobusqueda'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='medicamento',
+            index=models.Index(fields=['drogueria', 'codigo_barra'], name='med_drog_codigo_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-17 12:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('droguerias', '0004_inventariodrogueria_movimientodrogueria'),
+        ('inventario', '0011_medicamento_codigo_barra_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['created_at', 'id'], name='audit_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimientoinventario',
+            index=models.Index(fields=['fecha_movimiento', 'id'], name='mov_fecha_id_idx'),
+        ),
+    ]
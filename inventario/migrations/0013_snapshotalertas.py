@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-17 12:47
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('droguerias', '0004_inventariodrogueria_movimientodrogueria'),
+        ('inventario', '0012_historial_cursor_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SnapshotAlertas',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('items', models.JSONField(default=dict)),
+                ('horizonte', models.DateField()),
+                ('actualizado_en', models.DateTimeField(default=django.utils.timezone.now)),
+                ('drogueria', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='snapshot_alertas', to='droguerias.drogueria')),
+            ],
+        ),
+    ]
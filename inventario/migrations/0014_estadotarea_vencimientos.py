@@ -0,0 +1,32 @@
+# Generated by Django 5.2.8 on 2026-10-17 12:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('droguerias', '0004_inventariodrogueria_movimientodrogueria'),
+        ('inventario', '0013_snapshotalertas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadoTarea',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=60, unique=True)),
+                ('ultima_ejecucion', models.DateTimeField(blank=True, null=True)),
+                ('datos', models.JSONField(blank=True, default=dict)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='alerta',
+            name='tipo',
+            field=models.CharField(choices=[('low_stock', 'Stock bajo'), ('vencido', 'Vencido'), ('por_vencer', 'Próximo a vencer'), ('prestamo', 'Prestamo'), ('info', 'Información')], max_length=30),
+        ),
+        migrations.AddIndex(
+            model_name='medicamento',
+            index=models.Index(fields=['fecha_vencimiento'], name='med_vencimiento_idx'),
+        ),
+    ]
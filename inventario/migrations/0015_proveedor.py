@@ -0,0 +1,42 @@
+# Generated by Django 5.2.8 on 2026-10-17 12:50
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def poblar_proveedores(apps, schema_editor):
+    Medicamento = apps.get_model('inventario', 'Medicamento')
+    Proveedor = apps.get_model('inventario', 'Proveedor')
+    conteos, nombres = {}, {}
+    filas = (Medicamento.objects.exclude(proveedor__isnull=True).exclude(proveedor='')
+             .values('proveedor').annotate(n=Count('id')).order_by())
+    for fila in filas:
+        limpio = ' '.join(fila['proveedor'].split())
+        clave = limpio.casefold()
+        if clave:
+            conteos[clave] = conteos.get(clave, 0) + fila['n']
+            nombres.setdefault(clave, limpio[:150])
+    Proveedor.objects.bulk_create(
+        [Proveedor(nombre=nombres[c], nombre_normalizado=c, medicamentos=n) for c, n in conteos.items()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0014_estadotarea_vencimientos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Proveedor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=150)),
+                ('nombre_normalizado', models.CharField(max_length=150, unique=True)),
+                ('medicamentos', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(poblar_proveedores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.8 on 2026-10-17 12:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('droguerias', '0004_inventariodrogueria_movimientodrogueria'),
+        ('inventario', '0015_proveedor'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateTimeField()),
+                ('stock_actual', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='movimientoinventario',
+            index=models.Index(fields=['medicamento', 'fecha_movimiento'], name='mov_med_fecha_idx'),
+        ),
+        migrations.AddField(
+            model_name='stockcheckpoint',
+            name='drogueria',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='droguerias.drogueria'),
+        ),
+        migrations.AddField(
+            model_name='stockcheckpoint',
+            name='medicamento',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='inventario.medicamento'),
+        ),
+        migrations.AddConstraint(
+            model_name='stockcheckpoint',
+            constraint=models.UniqueConstraint(fields=('medicamento', 'fecha'), name='unique_checkpoint_med_fecha'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.8 on 2026-10-17 16:10
+
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import BigIntegerField, Count, F, Sum
+from django.db.models.functions import Cast, Coalesce, Round
+
+
+def _centavos(campo):
+    return Cast(Round(F(campo) * 100), BigIntegerField()) * F('stock_actual')
+
+
+def poblar_inventarios(apps, schema_editor):
+    # los agregados se mantienen con deltas desde ahora; aquí se parte del estado actual
+    Drogueria = apps.get_model('droguerias', 'Drogueria')
+    InventarioDrogueria = apps.get_model('droguerias', 'InventarioDrogueria')
+    Medicamento = apps.get_model('inventario', 'Medicamento')
+    filas = {
+        f['drogueria_id']: f for f in
+        Medicamento.objects.exclude(drogueria__isnull=True).order_by().values('drogueria_id').annotate(
+            n=Count('id'),
+            unidades=Coalesce(Sum('stock_actual'), 0),
+            costo=Coalesce(Sum(_centavos('costo_compra')), 0),
+            venta=Coalesce(Sum(_centavos('precio_venta')), 0),
+        )
+    }
+    existentes = {i.drogueria_id: i for i in InventarioDrogueria.objects.all()}
+    nuevos, cambiados = [], []
+    for drogueria_id in Drogueria.objects.values_list('id', flat=True):
+        fila = filas.get(drogueria_id, {'n': 0, 'unidades': 0, 'costo': 0, 'venta': 0})
+        inv = existentes.get(drogueria_id) or InventarioDrogueria(drogueria_id=drogueria_id)
+        inv.valor_total_inventario = Decimal(fila['costo']).scaleb(-2)
+        inv.valor_venta_total = Decimal(fila['venta']).scaleb(-2)
+        inv.cantidad_medicamentos = fila['n']
+        inv.cantidad_stock_total = fila['unidades']
+        (cambiados if inv.pk else nuevos).append(inv)
+    InventarioDrogueria.objects.bulk_create(nuevos, batch_size=500)
+    InventarioDrogueria.objects.bulk_update(
+        cambiados,
+        ['valor_total_inventario', 'valor_venta_total', 'cantidad_medicamentos', 'cantidad_stock_total'],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('droguerias', '0004_inventariodrogueria_movimientodrogueria'),
+        ('inventario', '0016_stockcheckpoint'),
+    ]
+
+    operations = [
+        migrations.RunPython(poblar_inventarios, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.8 on 2026-10-17 13:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('droguerias', '0004_inventariodrogueria_movimientodrogueria'),
+        ('inventario', '0017_poblar_inventarios_drogueria'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Transferencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(choices=[('pending', 'Pendiente'), ('accepted', 'Aceptado'), ('rejected', 'Rechazado'), ('cancelled', 'Cancelado')], default='pending', max_length=20)),
+                ('fecha_solicitud', models.DateTimeField(auto_now_add=True)),
+                ('fecha_respuesta', models.DateTimeField(blank=True, null=True)),
+                ('nota', models.TextField(blank=True, null=True)),
+                ('destino', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transferencias_destino', to='droguerias.drogueria')),
+                ('origen', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transferencias_origen', to='droguerias.drogueria')),
+                ('respondedor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='transferencias_respondidas', to=settings.AUTH_USER_MODEL)),
+                ('solicitante', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='transferencias_solicitadas', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-fecha_solicitud'],
+            },
+        ),
+        migrations.CreateModel(
+            name='LineaTransferencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.PositiveIntegerField()),
+                ('medicamento_destino', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='lineas_transferencia_destino', to='inventario.medicamento')),
+                ('medicamento_origen', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lineas_transferencia_origen', to='inventario.medicamento')),
+                ('transferencia', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lineas', to='inventario.transferencia')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='transferencia',
+            index=models.Index(fields=['origen', 'destino', 'estado', 'fecha_solicitud'], name='transf_orig_dest_estado_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='lineatransferencia',
+            constraint=models.UniqueConstraint(fields=('transferencia', 'medicamento_origen'), name='linea_transf_med_unica'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-17 13:03
+
+import inventario.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('droguerias', '0004_inventariodrogueria_movimientodrogueria'),
+        ('inventario', '0018_transferencia'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prestamo',
+            name='expira_en',
+            field=models.DateTimeField(blank=True, default=inventario.models.expiracion_reserva, null=True),
+        ),
+        migrations.AddField(
+            model_name='transferencia',
+            name='expira_en',
+            field=models.DateTimeField(blank=True, default=inventario.models.expiracion_reserva, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='prestamo',
+            index=models.Index(fields=['estado', 'expira_en'], name='prest_estado_expira_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transferencia',
+            index=models.Index(fields=['estado', 'expira_en'], name='transf_estado_expira_idx'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.8 on 2026-10-17 13:13
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def poblar_lotes(apps, schema_editor):
+    # el stock existente pasa a un lote por medicamento con su lote y vencimiento actuales
+    Medicamento = apps.get_model('inventario', 'Medicamento')
+    LoteMedicamento = apps.get_model('inventario', 'LoteMedicamento')
+    filas = (Medicamento.objects.filter(stock_actual__gt=0).order_by('id')
+             .values_list('id', Coalesce('lote', models.Value('')), 'fecha_vencimiento', 'stock_actual'))
+    lote = []
+    for medicamento_id, codigo, vence, cantidad in filas.iterator(chunk_size=2000):
+        lote.append(LoteMedicamento(medicamento_id=medicamento_id, codigo=codigo,
+                                    fecha_vencimiento=vence, cantidad=cantidad))
+        if len(lote) == 500:
+            LoteMedicamento.objects.bulk_create(lote)
+            lote = []
+    LoteMedicamento.objects.bulk_create(lote)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0020_importacionmedicamentos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movimientoinventario',
+            name='fecha_vencimiento',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='movimientoinventario',
+            name='lote',
+            field=models.CharField(blank=True, max_length=60, null=True),
+        ),
+        migrations.CreateModel(
+            name='LoteMedicamento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('codigo', models.CharField(blank=True, default='', max_length=60)),
+                ('fecha_vencimiento', models.DateField(blank=True, null=True)),
+                ('cantidad', models.PositiveIntegerField(default=0)),
+                ('creado_en', models.DateTimeField(default=django.utils.timezone.now)),
+                ('medicamento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lotes', to='inventario.medicamento')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['medicamento', 'fecha_vencimiento', 'id'], name='lote_med_venc_idx'), models.Index(fields=['fecha_vencimiento'], name='lote_vencimiento_idx')],
+                'constraints': [models.UniqueConstraint(fields=('medicamento', 'codigo'), name='unique_lote_medicamento_codigo')],
+            },
+        ),
+        migrations.RunPython(poblar_lotes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-17 13:17
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('droguerias', '0004_inventariodrogueria_movimientodrogueria'),
+        ('inventario', '0021_lotes_medicamento'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PronosticoDemanda',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metodo', models.CharField(choices=[('media_movil', 'Media móvil'), ('suavizado', 'Suavizado exponencial')], max_length=20)),
+                ('demanda_diaria', models.FloatField(default=0)),
+                ('desviacion', models.FloatField(default=0)),
+                ('stock_seguridad', models.PositiveIntegerField(default=0)),
+                ('punto_reorden', models.PositiveIntegerField(default=0)),
+                ('dias_historia', models.PositiveIntegerField(default=0)),
+                ('dias_con_demanda', models.PositiveIntegerField(default=0)),
+                ('calculado_en', models.DateTimeField(default=django.utils.timezone.now)),
+                ('drogueria', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='droguerias.drogueria')),
+                ('medicamento', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='pronostico', to='inventario.medicamento')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['drogueria', 'punto_reorden'], name='pron_drog_reorden_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.8 on 2026-10-17 13:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def poblar_disponibilidad(apps, schema_editor):
+    # misma normalización que inventario.disponibilidad.clave_producto
+    Medicamento = apps.get_model('inventario', 'Medicamento')
+    DisponibilidadProducto = apps.get_model('inventario', 'DisponibilidadProducto')
+    filas = (Medicamento.objects.filter(estado=True, drogueria__isnull=False).order_by('id')
+             .values_list('id', 'drogueria_id', 'nombre', 'codigo_barra',
+                          'stock_actual', 'stock_reservado', 'stock_minimo'))
+    lote = []
+    for mid, drogueria_id, nombre, codigo, actual, reservado, minimo in filas.iterator(chunk_size=2000):
+        disponible = max(actual - reservado, 0)
+        lote.append(DisponibilidadProducto(
+            medicamento_id=mid, drogueria_id=drogueria_id, clave=' '.join((nombre or '').split()).casefold()[:150],
+            codigo_barra=(codigo or '').strip() or None,
+            disponible=disponible, stock_minimo=minimo, excedente=disponible - minimo,
+        ))
+        if len(lote) == 500:
+            DisponibilidadProducto.objects.bulk_create(lote)
+            lote = []
+    DisponibilidadProducto.objects.bulk_create(lote)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('droguerias', '0004_inventariodrogueria_movimientodrogueria'),
+        ('inventario', '0022_pronosticodemanda'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DisponibilidadProducto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=150)),
+                ('codigo_barra', models.CharField(blank=True, max_length=120, null=True)),
+                ('disponible', models.IntegerField(default=0)),
+                ('stock_minimo', models.PositiveIntegerField(default=0)),
+                ('excedente', models.IntegerField(default=0)),
+                ('drogueria', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='droguerias.drogueria')),
+                ('medicamento', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='disponibilidad', to='inventario.medicamento')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['clave', 'excedente'], name='disp_clave_excedente_idx'), models.Index(fields=['codigo_barra'], name='disp_codigo_idx')],
+            },
+        ),
+        migrations.RunPython(poblar_disponibilidad, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.8 on 2026-10-17 13:36
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('droguerias', '0004_inventariodrogueria_movimientodrogueria'),
+        ('inventario', '0023_disponibilidadproducto'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Producto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sku', models.CharField(blank=True, max_length=60, null=True, unique=True)),
+                ('nombre', models.CharField(max_length=150)),
+                ('nombre_normalizado', models.CharField(db_index=True, max_length=150)),
+                ('codigo_barra', models.CharField(blank=True, db_index=True, max_length=120, null=True)),
+                ('creado_en', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='disponibilidadproducto',
+            name='producto',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='inventario.producto'),
+        ),
+        migrations.AddField(
+            model_name='medicamento',
+            name='producto',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='medicamentos', to='inventario.producto'),
+        ),
+        migrations.AddIndex(
+            model_name='disponibilidadproducto',
+            index=models.Index(fields=['producto', 'excedente'], name='disp_producto_excedente_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicamento',
+            index=models.Index(fields=['producto', 'drogueria'], name='med_producto_drog_idx'),
+        ),
+    ]
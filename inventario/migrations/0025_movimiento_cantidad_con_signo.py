@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 13:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0024_productos'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='movimientoinventario',
+            name='cantidad',
+            field=models.IntegerField(),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-17 14:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('droguerias', '0004_inventariodrogueria_movimientodrogueria'),
+        ('inventario', '0025_movimiento_cantidad_con_signo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicamento',
+            name='revisar_vencimiento',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='medicamento',
+            index=models.Index(condition=models.Q(('revisar_vencimiento', True)), fields=['fecha_vencimiento'], name='med_revisar_venc_idx'),
+        ),
+    ]
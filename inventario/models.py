@@ -1,4 +1,9 @@
-from django.db import models
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Case, ExpressionWrapper, F, Value, When
+from django.db.models.functions import Greatest
 from django.utils import timezone
 from usuarios.models import Usuario  # relación con usuarios
 from droguerias.models import Drogueria
@@ -15,9 +20,85 @@ class Categoria(models.Model):
         return self.nombre
 
 
+# =========================
+# 🏭 PROVEEDOR
+# =========================
+class Proveedor(models.Model):
+    """Proveedores deduplicados a partir de ``Medicamento.proveedor``.
+
+    ``nombre_normalizado`` (minúsculas y espacios colapsados) es la clave única e
+    indexada para búsqueda por prefijo; ``medicamentos`` es un contador mantenido
+    por ``inventario.proveedores`` en cada escritura de Medicamento.
+    """
+    nombre = models.CharField(max_length=150)
+    nombre_normalizado = models.CharField(max_length=150, unique=True)
+    medicamentos = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return self.nombre
+
+
+# =========================
+# 🏷️ PRODUCTO
+# =========================
+class Producto(models.Model):
+    """Maestro de productos compartido entre droguerías (ver ``inventario.productos``).
+
+    Cada ``Medicamento`` es el producto en una sucursal; las consultas entre
+    sucursales (préstamos, transferencias, disponibilidad) se unen por
+    ``Medicamento.producto_id`` en lugar de comparar nombres.
+    """
+    sku = models.CharField(max_length=60, unique=True, null=True, blank=True)
+    nombre = models.CharField(max_length=150)
+    nombre_normalizado = models.CharField(max_length=150, db_index=True)
+    codigo_barra = models.CharField(max_length=120, blank=True, null=True, db_index=True)
+    creado_en = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.sku or 'sin SKU'} · {self.nombre}"
+
+
 # =========================
 # 💊 MEDICAMENTO
 # =========================
+class MedicamentoQuerySet(models.QuerySet):
+    def para_listado(self):
+        """Consulta de listados: relaciones en el mismo SELECT y calculados en SQL.
+
+        Solo trae las columnas de categoría y droguería que muestra
+        ``MedicamentoListSerializer`` y anota los campos calculados (``*_db``) para
+        no evaluar propiedades por fila.
+        """
+        hoy = timezone.now().date()
+        return (self
+                .select_related('categoria', 'drogueria')
+                .only(*LISTADO_CAMPOS)
+                .annotate(
+                    stock_disponible_db=Greatest(F('stock_actual') - F('stock_reservado'), Value(0)),
+                    valor_total_db=ExpressionWrapper(
+                        F('precio_venta') * F('stock_actual'),
+                        output_field=models.DecimalField(max_digits=20, decimal_places=2)),
+                    costo_total_db=ExpressionWrapper(
+                        F('costo_compra') * F('stock_actual'),
+                        output_field=models.DecimalField(max_digits=20, decimal_places=2)),
+                    esta_vencido_db=Case(
+                        When(fecha_vencimiento__lt=hoy, then=Value(True)),
+                        default=Value(False), output_field=models.BooleanField()),
+                    stock_status_db=Case(
+                        When(stock_actual__lte=F('stock_minimo'), then=Value('Bajo stock ⚠️')),
+                        default=Value('Stock suficiente ✅'), output_field=models.CharField()),
+                ))
+
+
+LISTADO_CAMPOS = (
+    'id', 'nombre', 'descripcion', 'precio_venta', 'costo_compra',
+    'stock_actual', 'stock_reservado', 'stock_minimo', 'fecha_vencimiento', 'estado',
+    'imagen_url', 'lote', 'fecha_ingreso', 'proveedor', 'codigo_barra', 'ubicacion', 'producto',
+    'categoria__id', 'categoria__nombre', 'categoria__descripcion', 'categoria__activo',
+    'drogueria__id', 'drogueria__codigo', 'drogueria__nombre',
+)
+
+
 class Medicamento(models.Model):
     # nombre ya no es único globalmente — permitimos el mismo nombre en distintas droguerías
     nombre = models.CharField(max_length=150)
@@ -36,6 +117,14 @@ class Medicamento(models.Model):
         blank=True,
         related_name='medicamentos'
     )
+    # producto del maestro compartido (mismo producto en todas las sucursales)
+    producto = models.ForeignKey(
+        Producto,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='medicamentos'
+    )
     precio_venta = models.DecimalField(max_digits=10, decimal_places=2)
     # información de compra y lote
     costo_compra = models.DecimalField(max_digits=10, decimal_places=2, default=0)
@@ -51,10 +140,51 @@ class Medicamento(models.Model):
     fecha_vencimiento = models.DateField(null=True, blank=True)
     estado = models.BooleanField(default=True)
     imagen_url = models.CharField(max_length=500, blank=True, null=True)
+    # la fecha de vencimiento cambió desde el último barrido (inventario.vencimientos)
+    revisar_vencimiento = models.BooleanField(default=False, editable=False)
+
+    objects = MedicamentoQuerySet.as_manager()
+
+    # columnas cuyo valor anterior necesitan los índices derivados (inventario.derivados)
+    VALORES_SEGUIDOS = ('drogueria_id', 'proveedor', 'stock_actual', 'precio_venta', 'costo_compra')
 
     def __str__(self):
         return self.nombre
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # valores leídos: al guardar, los deltas se calculan sin volver a consultar la fila
+        if all(campo in instance.__dict__ for campo in cls.VALORES_SEGUIDOS):
+            instance._valores_db = {campo: instance.__dict__[campo] for campo in cls.VALORES_SEGUIDOS}
+        if 'fecha_vencimiento' in instance.__dict__:
+            instance._vencimiento_db = instance.__dict__['fecha_vencimiento']
+        return instance
+
+    def save(self, *args, **kwargs):
+        # una fecha nueva (alta, edición) puede caer ya dentro de la ventana de aviso:
+        # se marca para que el próximo barrido la revise aunque no cruce un umbral
+        update_fields = kwargs.get('update_fields')
+        escribe_fecha = update_fields is None or 'fecha_vencimiento' in update_fields
+        if (escribe_fecha and self.fecha_vencimiento is not None
+                and self.fecha_vencimiento != getattr(self, '_vencimiento_db', None)):
+            self.revisar_vencimiento = True
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'revisar_vencimiento'}
+        # post_save escribe los agregados (inventario.derivados) en la misma transacción
+        with transaction.atomic(using=kwargs.get('using'), savepoint=False):
+            super().save(*args, **kwargs)
+        if escribe_fecha:
+            self._vencimiento_db = self.fecha_vencimiento
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        valores = getattr(self, '_valores_db', None)
+        if valores is not None:
+            leidos = None if fields is None else {self._meta.get_field(f).attname for f in fields}
+            valores.update({campo: self.__dict__[campo] for campo in self.VALORES_SEGUIDOS
+                            if leidos is None or campo in leidos})
+
     class Meta:
         # asegurar unicidad por (nombre, drogueria) para permitir el mismo medicamento en varias sucursales
         constraints = [
@@ -63,6 +193,14 @@ class Medicamento(models.Model):
         indexes = [
             models.Index(fields=['drogueria', 'categoria', 'nombre'], name='med_drog_cat_nom_idx'),
             models.Index(fields=['stock_actual'], name='med_stock_idx'),
+            # lectura de códigos de barras en caja (inventario.barcode)
+            models.Index(fields=['drogueria', 'codigo_barra'], name='med_drog_codigo_idx'),
+            # barrido de vencimientos por rango de fechas (inventario.vencimientos)
+            models.Index(fields=['fecha_vencimiento'], name='med_vencimiento_idx'),
+            models.Index(fields=['fecha_vencimiento'], condition=models.Q(revisar_vencimiento=True),
+                         name='med_revisar_venc_idx'),
+            # el mismo producto en otra sucursal (préstamos, transferencias, reportes)
+            models.Index(fields=['producto', 'drogueria'], name='med_producto_drog_idx'),
         ]
 
     @property
@@ -92,6 +230,29 @@ class Medicamento(models.Model):
         return bool(self.fecha_vencimiento and self.fecha_vencimiento < timezone.now().date())
 
 
+class MedicamentoBusqueda(models.Model):
+    """Índice FTS5 de medicamentos (tabla virtual de SQLite, no gestionada por Django).
+
+    La crean y mantienen ``inventario.search`` (post_migrate) y triggers sobre
+    inventario_medicamento; se consulta vía ``Medicamento.busqueda``.
+    """
+    medicamento = models.OneToOneField(
+        Medicamento,
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_column='rowid',
+        db_constraint=False,
+        related_name='busqueda'
+    )
+    # columna oculta con el nombre de la tabla: destino de MATCH
+    indice = models.TextField(db_column='inventario_medicamento_fts')
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'inventario_medicamento_fts'
+
+
 # =========================
 # 📦 MOVIMIENTOS DE INVENTARIO
 # =========================
@@ -116,7 +277,8 @@ class MovimientoInventario(models.Model):
         related_name='movimientos'
     )
     tipo_movimiento = models.CharField(max_length=10, choices=TIPO_MOVIMIENTO)
-    cantidad = models.PositiveIntegerField()
+    # entradas y salidas: unidades (>= 0); ajuste: diferencia con signo (p. ej. -3 por merma)
+    cantidad = models.IntegerField()
     fecha_movimiento = models.DateTimeField(default=timezone.now)
     usuario = models.ForeignKey(
         Usuario,
@@ -125,6 +287,9 @@ class MovimientoInventario(models.Model):
         blank=True
     )
     observacion = models.TextField(blank=True, null=True)
+    # lote recibido en una entrada (ver inventario.lotes); las salidas se asignan FEFO
+    lote = models.CharField(max_length=60, blank=True, null=True)
+    fecha_vencimiento = models.DateField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.tipo_movimiento.title()} - {self.medicamento.nombre} ({self.cantidad})"
@@ -132,34 +297,155 @@ class MovimientoInventario(models.Model):
     # =========================
     # Actualiza stock al guardar
     # =========================
-    def save(self, *args, **kwargs):
-        """Ajusta automáticamente el stock del medicamento."""
+    def save(self, *args, consumir_reserva=False, **kwargs):
+        """Ajusta el stock del medicamento con un UPDATE condicional (ver inventario.stock).
+
+        ``consumir_reserva`` descuenta también stock_reservado en una salida
+        (despacho de un préstamo ya reservado).
+        """
         if not self.pk:  # solo al crear el movimiento
-            if self.tipo_movimiento == "entrada":
-                # entrada incrementa stock_actual
-                self.medicamento.stock_actual += self.cantidad
-                # si es entrada desde una transferencia, podemos liberar reservados
-                if kwargs.get('transferencia_release'):
-                    self.medicamento.stock_reservado = max(self.medicamento.stock_reservado - self.cantidad, 0)
-            elif self.tipo_movimiento == "salida":
-                # salida reduce stock_actual (y si se desea reservar, usar otro flujo)
-                self.medicamento.stock_actual -= self.cantidad
-                # prevenir stock negativo
-                if self.medicamento.stock_actual < 0:
-                    self.medicamento.stock_actual = 0
-            self.medicamento.save()
+            from django.db import transaction
+            from . import lotes
+            from .stock import aplicar_movimiento
+
+            # el UPDATE de stock y el INSERT del movimiento se confirman juntos
+            with transaction.atomic():
+                if self.tipo_movimiento == 'entrada' and self.lote:
+                    self.medicamento.stock_actual = lotes.ingresar(
+                        self.medicamento_id, self.cantidad, self.lote, self.fecha_vencimiento,
+                    )
+                else:
+                    self.medicamento.stock_actual = aplicar_movimiento(
+                        self.medicamento_id, self.tipo_movimiento, self.cantidad,
+                        consumir_reserva=consumir_reserva,
+                    )
+                super().save(*args, **kwargs)
+            return
         super().save(*args, **kwargs)
 
     class Meta:
         indexes = [
             models.Index(fields=['medicamento', 'drogueria', 'fecha_movimiento'], name='mov_med_drog_fecha_idx'),
+            # paginación por cursor del historial (inventario.pagination)
+            models.Index(fields=['fecha_movimiento', 'id'], name='mov_fecha_id_idx'),
+            # delta acotado entre un checkpoint y una fecha (inventario.historico)
+            models.Index(fields=['medicamento', 'fecha_movimiento'], name='mov_med_fecha_idx'),
+        ]
+
+
+class LoteMedicamento(models.Model):
+    """Existencias de un lote de un medicamento (ver ``inventario.lotes``).
+
+    ``Medicamento.stock_actual`` sigue siendo el total de la fila y la suma de
+    los lotes nunca lo supera; la diferencia es stock sin lote registrado, que
+    se consume después de todos los lotes. Las salidas descuentan primero el
+    lote que vence antes (FEFO).
+    """
+    medicamento = models.ForeignKey(Medicamento, on_delete=models.CASCADE, related_name='lotes')
+    codigo = models.CharField(max_length=60, blank=True, default='')
+    fecha_vencimiento = models.DateField(null=True, blank=True)
+    cantidad = models.PositiveIntegerField(default=0)
+    creado_en = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['medicamento', 'codigo'], name='unique_lote_medicamento_codigo')
+        ]
+        indexes = [
+            # orden de asignación FEFO dentro de un medicamento
+            models.Index(fields=['medicamento', 'fecha_vencimiento', 'id'], name='lote_med_venc_idx'),
+            # lotes por vencer en un rango de fechas
+            models.Index(fields=['fecha_vencimiento'], name='lote_vencimiento_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.medicamento_id} · {self.codigo or 'sin código'} ({self.cantidad})"
+
+
+class StockCheckpoint(models.Model):
+    """Foto periódica del stock de un medicamento (ver ``inventario.historico``).
+
+    El stock en una fecha pasada se obtiene desde el checkpoint más cercano más
+    los movimientos del intervalo, sin recorrer todo el historial.
+    """
+    medicamento = models.ForeignKey(Medicamento, on_delete=models.CASCADE, related_name='checkpoints')
+    drogueria = models.ForeignKey(Drogueria, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    fecha = models.DateTimeField()
+    stock_actual = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['medicamento', 'fecha'], name='unique_checkpoint_med_fecha')
+        ]
+
+    def __str__(self):
+        return f"{self.medicamento_id} @ {self.fecha:%Y-%m-%d %H:%M}: {self.stock_actual}"
+
+
+class DisponibilidadProducto(models.Model):
+    """Índice de disponibilidad por producto y droguería (ver ``inventario.disponibilidad``).
+
+    Una fila por medicamento activo con droguería, con su producto del maestro
+    y el nombre normalizado; las señales de stock la mantienen al día para
+    ubicar en una consulta qué sucursales tienen excedente.
+    """
+    medicamento = models.OneToOneField(Medicamento, on_delete=models.CASCADE, related_name='disponibilidad')
+    drogueria = models.ForeignKey(Drogueria, on_delete=models.CASCADE, related_name='+')
+    producto = models.ForeignKey(Producto, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    clave = models.CharField(max_length=150)
+    codigo_barra = models.CharField(max_length=120, blank=True, null=True)
+    disponible = models.IntegerField(default=0)
+    stock_minimo = models.PositiveIntegerField(default=0)
+    excedente = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['clave', 'excedente'], name='disp_clave_excedente_idx'),
+            models.Index(fields=['producto', 'excedente'], name='disp_producto_excedente_idx'),
+            models.Index(fields=['codigo_barra'], name='disp_codigo_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.clave} @ {self.drogueria_id}: {self.disponible}"
+
+
+class PronosticoDemanda(models.Model):
+    """Pronóstico de demanda y punto de reorden por medicamento (ver ``inventario.pronostico``).
+
+    Se recalcula en lote con ``manage.py pronosticar_demanda``; con ``--aplicar``
+    el punto de reorden pasa a ``Medicamento.stock_minimo``, que es el umbral
+    que usan las alertas y el filtro de bajo stock.
+    """
+    METODOS = [
+        ('media_movil', 'Media móvil'),
+        ('suavizado', 'Suavizado exponencial'),
+    ]
+
+    medicamento = models.OneToOneField(Medicamento, on_delete=models.CASCADE, related_name='pronostico')
+    drogueria = models.ForeignKey(Drogueria, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    metodo = models.CharField(max_length=20, choices=METODOS)
+    demanda_diaria = models.FloatField(default=0)
+    desviacion = models.FloatField(default=0)
+    stock_seguridad = models.PositiveIntegerField(default=0)
+    punto_reorden = models.PositiveIntegerField(default=0)
+    dias_historia = models.PositiveIntegerField(default=0)
+    dias_con_demanda = models.PositiveIntegerField(default=0)
+    calculado_en = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['drogueria', 'punto_reorden'], name='pron_drog_reorden_idx'),
         ]
 
+    def __str__(self):
+        return f"{self.medicamento_id}: {self.demanda_diaria:.2f}/día, reorden {self.punto_reorden}"
+
 
 class Alerta(models.Model):
     TIPOS = [
         ('low_stock', 'Stock bajo'),
         ('vencido', 'Vencido'),
+        ('por_vencer', 'Próximo a vencer'),
         ('prestamo', 'Prestamo'),
         ('info', 'Información'),
     ]
@@ -196,21 +482,77 @@ class AuditLog(models.Model):
     user = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, blank=True)
     message = models.TextField(blank=True, null=True)
     data = models.JSONField(blank=True, null=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # default (no auto_now_add) para conservar la fecha del evento al drenar el outbox
+    created_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['model_name', 'object_id', 'created_at'], name='audit_model_obj_idx'),
+            models.Index(fields=['created_at', 'id'], name='audit_created_id_idx'),
         ]
 
     def __str__(self):
         return f"Audit: {self.action} on {self.model_name}#{self.object_id} by {self.user} at {self.created_at}"
 
 
+class EventoOutbox(models.Model):
+    """Efecto secundario pendiente (auditoría / alerta) escrito en la misma transacción.
+
+    Las señales de inventario solo insertan un evento compacto; el comando
+    ``drenar_outbox`` los convierte en AuditLog y Alerta con inserciones masivas.
+    """
+    tipo = models.CharField(max_length=40)
+    datos = models.JSONField()
+    creado_en = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"Evento({self.tipo}) #{self.pk}"
+
+
+class EstadoTarea(models.Model):
+    """Marca de la última ejecución de una tarea periódica (barridos, recálculos)."""
+    nombre = models.CharField(max_length=60, unique=True)
+    ultima_ejecucion = models.DateTimeField(null=True, blank=True)
+    datos = models.JSONField(default=dict, blank=True)
+
+    def __str__(self):
+        return f"{self.nombre} ({self.ultima_ejecucion or 'nunca'})"
+
+
+class SnapshotAlertas(models.Model):
+    """Alertas de inventario materializadas por droguería (stock bajo y vencimientos).
+
+    ``items`` guarda {medicamento_id: datos} de los medicamentos activos con stock
+    bajo o vencimiento hasta ``horizonte``; ``inventario.alertas`` lo construye con
+    una consulta y lo parchea por medicamento en cada cambio de stock o fecha.
+    """
+    drogueria = models.OneToOneField(
+        Drogueria,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='snapshot_alertas'
+    )
+    items = models.JSONField(default=dict)
+    horizonte = models.DateField()
+    actualizado_en = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Alertas {self.drogueria_id or 'sin droguería'} ({len(self.items)})"
+
+
 # =========================
 # 🔁 PRÉSTAMOS / TRANSFERENCIAS ENTRE DROGUERÍAS
 # =========================
+def expiracion_reserva():
+    """Vencimiento por defecto de la reserva de una solicitud pendiente (ver inventario.reservas)."""
+    return timezone.now() + timedelta(hours=getattr(settings, 'INVENTARIO_RESERVA_TTL_HORAS', 72))
+
+
 class Prestamo(models.Model):
     ESTADO = [
         ('pending', 'Pendiente'),
@@ -248,12 +590,15 @@ class Prestamo(models.Model):
     respondedor = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, blank=True, related_name='respuestas_prestamo')
     fecha_solicitud = models.DateTimeField(auto_now_add=True)
     fecha_respuesta = models.DateTimeField(null=True, blank=True)
+    # si sigue pendiente pasada esta fecha, la reserva se libera y se cancela
+    expira_en = models.DateTimeField(default=expiracion_reserva, null=True, blank=True)
     nota = models.TextField(blank=True, null=True)
 
     class Meta:
         ordering = ['-fecha_solicitud']
         indexes = [
             models.Index(fields=['origen', 'destino', 'estado', 'fecha_solicitud'], name='prest_origen_dest_estado_idx'),
+            models.Index(fields=['estado', 'expira_en'], name='prest_estado_expira_idx'),
         ]
 
     def __str__(self):
@@ -276,15 +621,17 @@ class Prestamo(models.Model):
 
         Lanza ValueError si no hay stock disponible suficiente.
         """
-        disponible = self.medicamento_origen.stock_actual - self.medicamento_origen.stock_reservado
-        if self.cantidad > disponible:
-            raise ValueError('Stock insuficiente para reservar')
+        from .stock import reservar, StockInsuficienteError
+        try:
+            reservar(self.medicamento_origen_id, self.cantidad)
+        except StockInsuficienteError:
+            raise StockInsuficienteError('Stock insuficiente para reservar') from None
         self.medicamento_origen.stock_reservado += self.cantidad
-        self.medicamento_origen.save()
 
     def liberar_reserva(self):
+        from .stock import liberar_reserva
+        liberar_reserva(self.medicamento_origen_id, self.cantidad)
         self.medicamento_origen.stock_reservado = max(self.medicamento_origen.stock_reservado - self.cantidad, 0)
-        self.medicamento_origen.save()
 
     def aceptar(self, user=None):
         """Acepta la solicitud: crea movimientos de salida/entrada y actualiza estado."""
@@ -295,20 +642,30 @@ class Prestamo(models.Model):
 
         # Ejecutar todo en una transacción para evitar inconsistencias
         with transaction.atomic():
+            # el barrido de reservas (inventario.reservas) pudo cancelarla entretanto
+            if not Prestamo.objects.select_for_update().filter(pk=self.pk, estado='pending').exists():
+                raise ValueError('Solo solicitudes pendientes pueden aceptarse')
             # Verificar existencia de medicamento_destino; si no existe, crear uno equivalente
             if not self.medicamento_destino:
-                # buscar por nombre/categoria en la drogueria destino
-                dest, created = Medicamento.objects.get_or_create(
-                nombre=self.medicamento_origen.nombre,
-                drogueria=self.destino,
-                defaults={
-                    'descripcion': self.medicamento_origen.descripcion,
-                    'categoria': self.medicamento_origen.categoria,
-                    'precio_venta': self.medicamento_origen.precio_venta,
-                    'costo_compra': self.medicamento_origen.costo_compra,
-                    'stock_actual': 0,
-                }
-                )
+                # mismo producto del maestro en la drogueria destino; si no, por nombre
+                dest = None
+                if self.medicamento_origen.producto_id:
+                    dest = (Medicamento.objects
+                            .filter(producto_id=self.medicamento_origen.producto_id, drogueria=self.destino)
+                            .order_by('id').first())
+                if dest is None:
+                    dest, created = Medicamento.objects.get_or_create(
+                        nombre=self.medicamento_origen.nombre,
+                        drogueria=self.destino,
+                        defaults={
+                            'descripcion': self.medicamento_origen.descripcion,
+                            'categoria': self.medicamento_origen.categoria,
+                            'precio_venta': self.medicamento_origen.precio_venta,
+                            'costo_compra': self.medicamento_origen.costo_compra,
+                            'producto_id': self.medicamento_origen.producto_id,
+                            'stock_actual': 0,
+                        }
+                    )
                 self.medicamento_destino = dest
                 self.save()
 
@@ -316,14 +673,14 @@ class Prestamo(models.Model):
             origen_med = Medicamento.objects.select_for_update().get(pk=self.medicamento_origen.pk)
             dest_med = Medicamento.objects.select_for_update().get(pk=self.medicamento_destino.pk)
 
-            # Crear movimiento salida en origen (ajusta stock_actual en 'origen_med')
-            MovimientoInventario.objects.create(
+            # Salida en origen: descuenta stock_actual y la reserva en el mismo UPDATE
+            MovimientoInventario(
                 medicamento=origen_med,
                 drogueria=self.origen,
                 tipo_movimiento='salida',
                 cantidad=self.cantidad,
                 usuario=user
-            )
+            ).save(consumir_reserva=True)
 
             # Crear movimiento entrada en destino (ajusta stock_actual en 'dest_med')
             MovimientoInventario.objects.create(
@@ -334,9 +691,6 @@ class Prestamo(models.Model):
                 usuario=user
             )
 
-            # Reducir la reserva en la instancia bloqueada para no sobrescribir cambios
-            origen_med.stock_reservado = max(origen_med.stock_reservado - self.cantidad, 0)
-            origen_med.save()
             self.estado = 'accepted'
             self.respondedor = user
             from django.utils.timezone import now
@@ -346,12 +700,98 @@ class Prestamo(models.Model):
     def rechazar(self, user=None, nota=None):
         if self.estado != 'pending':
             raise ValueError('Solo solicitudes pendientes pueden rechazarse')
-        # liberar reserva
-        self.liberar_reserva()
-        self.estado = 'rejected'
-        self.respondedor = user
-        self.nota = nota or self.nota
-        from django.utils.timezone import now
-        self.fecha_respuesta = now()
-        self.save()
+        with transaction.atomic():
+            # el barrido de reservas (inventario.reservas) pudo cancelarla y liberar ya la reserva
+            if not Prestamo.objects.select_for_update().filter(pk=self.pk, estado='pending').exists():
+                raise ValueError('Solo solicitudes pendientes pueden rechazarse')
+            # liberar reserva
+            self.liberar_reserva()
+            self.estado = 'rejected'
+            self.respondedor = user
+            self.nota = nota or self.nota
+            from django.utils.timezone import now
+            self.fecha_respuesta = now()
+            self.save()
+
+
+
+class Transferencia(models.Model):
+    """Documento de transferencia con varias líneas entre dos droguerías.
+
+    A diferencia de ``Prestamo`` (un medicamento por solicitud), todas las
+    líneas se reservan al crearla y se aceptan o rechazan en una sola
+    transacción (ver inventario.transferencias).
+    """
+    ESTADO = Prestamo.ESTADO
+
+    origen = models.ForeignKey(Drogueria, on_delete=models.CASCADE, related_name='transferencias_origen')
+    destino = models.ForeignKey(Drogueria, on_delete=models.CASCADE, related_name='transferencias_destino')
+    estado = models.CharField(max_length=20, choices=ESTADO, default='pending')
+    solicitante = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, blank=True,
+                                    related_name='transferencias_solicitadas')
+    respondedor = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, blank=True,
+                                    related_name='transferencias_respondidas')
+    fecha_solicitud = models.DateTimeField(auto_now_add=True)
+    fecha_respuesta = models.DateTimeField(null=True, blank=True)
+    expira_en = models.DateTimeField(default=expiracion_reserva, null=True, blank=True)
+    nota = models.TextField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-fecha_solicitud']
+        indexes = [
+            models.Index(fields=['origen', 'destino', 'estado', 'fecha_solicitud'], name='transf_orig_dest_estado_idx'),
+            models.Index(fields=['estado', 'expira_en'], name='transf_estado_expira_idx'),
+        ]
+
+    def __str__(self):
+        return f"Transferencia {self.id}: {self.origen_id}->{self.destino_id} [{self.estado}]"
+
+
+class LineaTransferencia(models.Model):
+    transferencia = models.ForeignKey(Transferencia, on_delete=models.CASCADE, related_name='lineas')
+    medicamento_origen = models.ForeignKey(Medicamento, on_delete=models.CASCADE, related_name='lineas_transferencia_origen')
+    # se resuelve (o se crea) al aceptar si no se indicó
+    medicamento_destino = models.ForeignKey(Medicamento, on_delete=models.SET_NULL, null=True, blank=True,
+                                            related_name='lineas_transferencia_destino')
+    cantidad = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['transferencia', 'medicamento_origen'], name='linea_transf_med_unica'),
+        ]
 
+    def __str__(self):
+        return f"{self.medicamento_origen_id} x{self.cantidad}"
+
+
+# =========================
+# 📥 IMPORTACIÓN MASIVA DE MEDICAMENTOS
+# =========================
+class ImportacionMedicamentos(models.Model):
+    """Progreso y resultado de una importación CSV/XLSX (ver inventario.importacion)."""
+    ESTADO = [
+        ('pendiente', 'Pendiente'),
+        ('procesando', 'Procesando'),
+        ('completada', 'Completada'),
+        ('fallida', 'Fallida'),
+    ]
+
+    usuario = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, blank=True)
+    drogueria = models.ForeignKey(Drogueria, on_delete=models.SET_NULL, null=True, blank=True,
+                                  help_text='Droguería por defecto para filas sin columna drogueria')
+    archivo = models.CharField(max_length=255)
+    estado = models.CharField(max_length=20, choices=ESTADO, default='pendiente')
+    filas_procesadas = models.PositiveIntegerField(default=0)
+    creados = models.PositiveIntegerField(default=0)
+    actualizados = models.PositiveIntegerField(default=0)
+    con_error = models.PositiveIntegerField(default=0)
+    # primeras filas con error: [{'fila': n, 'error': '...'}]
+    errores = models.JSONField(default=list, blank=True)
+    creado_en = models.DateTimeField(auto_now_add=True)
+    finalizado_en = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-creado_en']
+
+    def __str__(self):
+        return f"Importación {self.id} ({self.archivo}) [{self.estado}]"
@@ -0,0 +1,181 @@
+"""Outbox transaccional para los efectos secundarios de inventario.
+
+Las señales (y la ingesta en lote) registran ``EventoOutbox`` compactos dentro de
+la misma transacción que el cambio de stock; ``drenar()`` —invocado por el
+comando ``drenar_outbox``— los convierte en AuditLog y Alerta con inserciones
+masivas y deduplica las alertas no leídas con una consulta por lote.
+
+Tipos de evento y sus datos:
+- movimiento: movimiento, medicamento, drogueria, usuario, tipo_movimiento,
+  cantidad, nombre, stock_actual, stock_minimo
+- vencido: medicamento, drogueria, nombre (solo eventos antiguos: los vencimientos
+  ahora los genera ``inventario.vencimientos``)
+- prestamo_aceptado / prestamo_rechazado: prestamo, usuario, medicamento,
+  origen, destino, origen_codigo, destino_codigo, nombre, cantidad
+- transferencia_aceptada / transferencia_rechazada: transferencia, usuario,
+  origen, destino, lineas, unidades
+- reservas_expiradas: modelo, ids, unidades (un evento por lote de
+  ``inventario.reservas``)
+"""
+from django.db import transaction
+
+from .models import Alerta, AuditLog, EventoOutbox
+
+LOTE_DRENAJE = 1000
+
+
+def registrar(tipo, **datos):
+    return EventoOutbox.objects.create(tipo=tipo, datos=datos)
+
+
+def registrar_varios(eventos):
+    """Inserta varios eventos: ``eventos`` es una lista de (tipo, datos)."""
+    EventoOutbox.objects.bulk_create(
+        [EventoOutbox(tipo=tipo, datos=datos) for tipo, datos in eventos],
+        batch_size=500,
+    )
+
+
+def datos_movimiento(mov, nombre, stock_actual, stock_minimo):
+    """Datos del evento 'movimiento'; el stock es el resultante tras aplicar el movimiento."""
+    return {
+        'movimiento': mov.pk,
+        'medicamento': mov.medicamento_id,
+        'drogueria': mov.drogueria_id,
+        'usuario': mov.usuario_id,
+        'tipo_movimiento': mov.tipo_movimiento,
+        'cantidad': mov.cantidad,
+        'nombre': nombre,
+        'stock_actual': stock_actual,
+        'stock_minimo': stock_minimo,
+    }
+
+
+def _audit_movimiento(evento):
+    d = evento.datos
+    return AuditLog(
+        action='movimiento_creado',
+        model_name='MovimientoInventario',
+        object_id=d['movimiento'],
+        user_id=d['usuario'],
+        message=f"Movimiento {d['tipo_movimiento']} {d['cantidad']} para {d['nombre']}",
+        data={'medicamento': d['medicamento'], 'drogueria': d['drogueria']},
+        created_at=evento.creado_en,
+    )
+
+
+def _audit_prestamo(evento, verbo):
+    d = evento.datos
+    return AuditLog(
+        action=evento.tipo,
+        model_name='Prestamo',
+        object_id=d['prestamo'],
+        user_id=d['usuario'],
+        message=f"Prestamo {d['prestamo']} {verbo}: {d['nombre']} x{d['cantidad']}",
+        data={'origen': d['origen'], 'destino': d['destino']},
+        created_at=evento.creado_en,
+    )
+
+
+def _audit_transferencia(evento, verbo):
+    d = evento.datos
+    return AuditLog(
+        action=evento.tipo,
+        model_name='Transferencia',
+        object_id=d['transferencia'],
+        user_id=d['usuario'],
+        message=f"Transferencia {d['transferencia']} {verbo}: {d['lineas']} línea(s), {d['unidades']} unidades",
+        data={'origen': d['origen'], 'destino': d['destino']},
+        created_at=evento.creado_en,
+    )
+
+
+def _procesar(eventos):
+    """Convierte un lote de eventos en AuditLog/Alerta. Retorna (audits, alertas)."""
+    audits = []
+    alertas_prestamo = []
+    # candidatos a alerta deduplicada: {(tipo, medicamento_id): Alerta}
+    candidatas = {}
+
+    for evento in eventos:
+        d = evento.datos
+        if evento.tipo == 'movimiento':
+            audits.append(_audit_movimiento(evento))
+            if d['stock_actual'] <= d['stock_minimo']:
+                # el último evento del lote gana: refleja el stock más reciente
+                candidatas[('low_stock', d['medicamento'])] = Alerta(
+                    tipo='low_stock',
+                    nivel='warning',
+                    mensaje=f"Stock bajo para {d['nombre']}: {d['stock_actual']} <= {d['stock_minimo']}",
+                    medicamento_id=d['medicamento'],
+                    drogueria_id=d['drogueria'],
+                )
+        elif evento.tipo == 'vencido':
+            candidatas.setdefault(('vencido', d['medicamento']), Alerta(
+                tipo='vencido',
+                nivel='danger',
+                mensaje=f"{d['nombre']} está vencido o su fecha de vencimiento ha pasado.",
+                medicamento_id=d['medicamento'],
+                drogueria_id=d['drogueria'],
+            ))
+        elif evento.tipo == 'prestamo_aceptado':
+            alertas_prestamo.append(Alerta(
+                tipo='prestamo',
+                nivel='info',
+                mensaje=f"Préstamo aceptado: {d['nombre']} x{d['cantidad']} {d['origen_codigo']} → {d['destino_codigo']}",
+                medicamento_id=d['medicamento'],
+                drogueria_id=d['destino'],
+            ))
+            audits.append(_audit_prestamo(evento, 'aceptado'))
+        elif evento.tipo == 'prestamo_rechazado':
+            audits.append(_audit_prestamo(evento, 'rechazado'))
+        elif evento.tipo == 'transferencia_aceptada':
+            alertas_prestamo.append(Alerta(
+                tipo='prestamo',
+                nivel='info',
+                mensaje=f"Transferencia {d['transferencia']} aceptada: {d['lineas']} línea(s), {d['unidades']} unidades",
+                drogueria_id=d['destino'],
+            ))
+            audits.append(_audit_transferencia(evento, 'aceptada'))
+        elif evento.tipo == 'transferencia_rechazada':
+            audits.append(_audit_transferencia(evento, 'rechazada'))
+        elif evento.tipo == 'reservas_expiradas':
+            audits.append(AuditLog(
+                action='reservas_expiradas',
+                model_name=d['modelo'],
+                message=f"{len(d['ids'])} solicitud(es) vencida(s) cancelada(s); {d['unidades']} unidades liberadas",
+                data={'ids': d['ids'], 'unidades': d['unidades']},
+                created_at=evento.creado_en,
+            ))
+
+    # deduplicar contra alertas no leídas existentes: una consulta por tipo
+    nuevas = []
+    for tipo in ('low_stock', 'vencido'):
+        ids = [mid for (t, mid) in candidatas if t == tipo]
+        if not ids:
+            continue
+        existentes = set(Alerta.objects
+                         .filter(tipo=tipo, leido=False, medicamento_id__in=ids)
+                         .values_list('medicamento_id', flat=True))
+        nuevas.extend(a for (t, mid), a in candidatas.items() if t == tipo and mid not in existentes)
+
+    AuditLog.objects.bulk_create(audits, batch_size=500)
+    Alerta.objects.bulk_create(nuevas + alertas_prestamo, batch_size=500)
+    return len(audits), len(nuevas) + len(alertas_prestamo)
+
+
+def drenar(lote=LOTE_DRENAJE):
+    """Procesa todos los eventos pendientes en lotes. Retorna el número de eventos procesados."""
+    total = 0
+    while True:
+        with transaction.atomic():
+            qs = EventoOutbox.objects.order_by('id')
+            if transaction.get_connection().features.has_select_for_update_skip_locked:
+                # varios drenadores en paralelo no procesan el mismo evento
+                qs = qs.select_for_update(skip_locked=True)
+            eventos = list(qs[:lote])
+            if not eventos:
+                return total
+            _procesar(eventos)
+            EventoOutbox.objects.filter(id__in=[e.id for e in eventos]).delete()
+        total += len(eventos)
@@ -1,7 +1,98 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param, remove_query_param
 
 
 class StandardResultsSetPagination(PageNumberPagination):
     page_size = 10
     page_size_query_param = 'page_size'
     max_page_size = 100
+
+
+class KeysetPagination(StandardResultsSetPagination):
+    """Paginación por cursor sobre ``(campo_cursor, id)`` para historiales grandes.
+
+    Con ``?cursor=`` (vacío para la primera página) cada página es un
+    ``WHERE (campo, id) < (valor, id)`` sobre el índice correspondiente, sin
+    COUNT(*) ni OFFSET: la página 1000 cuesta lo mismo que la primera. La
+    respuesta es ``{next, results}``. Orden descendente por defecto; con
+    ``ordering=<campo_cursor>`` ascendente. Sin ``cursor`` se mantiene la
+    paginación por número de página.
+    """
+    campo_cursor = None
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Cursor inválido'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.por_cursor = self.cursor_query_param in request.query_params
+        if not self.por_cursor:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.page_size_cursor = self.get_page_size(request)
+        self.descendente = request.query_params.get('ordering') != self.campo_cursor
+        signo = '-' if self.descendente else ''
+        queryset = queryset.order_by(f'{signo}{self.campo_cursor}', f'{signo}id')
+
+        posicion = self._decodificar(request.query_params.get(self.cursor_query_param), queryset.model)
+        if posicion is not None:
+            valor, pk = posicion
+            op = 'lt' if self.descendente else 'gt'
+            # el primer término redundante permite recorrer el índice como rango
+            queryset = queryset.filter(
+                Q(**{f'{self.campo_cursor}__{op}e': valor}),
+                Q(**{f'{self.campo_cursor}__{op}': valor}) | Q(**{self.campo_cursor: valor, f'id__{op}': pk}),
+            )
+
+        filas = list(queryset[:self.page_size_cursor + 1])
+        self.hay_siguiente = len(filas) > self.page_size_cursor
+        filas = filas[:self.page_size_cursor]
+        self.ultima = filas[-1] if filas else None
+        return filas
+
+    def get_paginated_response(self, data):
+        if not self.por_cursor:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_next_link(self):
+        if not self.por_cursor:
+            return super().get_next_link()
+        if not self.hay_siguiente:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, self._codificar(self.ultima))
+
+    def _codificar(self, obj):
+        valor = getattr(obj, self.campo_cursor)
+        crudo = json.dumps([valor.isoformat(), obj.pk])
+        return base64.urlsafe_b64encode(crudo.encode()).decode().rstrip('=')
+
+    def _decodificar(self, cursor, model):
+        if not cursor:
+            return None
+        try:
+            crudo = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+            valor, pk = json.loads(crudo)
+            valor = model._meta.get_field(self.campo_cursor).to_python(valor)
+            return valor, int(pk)
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class MovimientoPagination(KeysetPagination):
+    campo_cursor = 'fecha_movimiento'
+
+
+class AuditLogPagination(KeysetPagination):
+    campo_cursor = 'created_at'
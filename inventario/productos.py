@@ -0,0 +1,151 @@
+"""Maestro de productos (``Producto``) compartido entre droguerías.
+
+Cada ``Medicamento`` referencia su producto; préstamos, transferencias y la
+disponibilidad entre sucursales buscan el equivalente en otra droguería por
+``producto_id`` (índice ``med_producto_drog_idx``) en lugar de por nombre.
+
+- ``resolver``: producto de un medicamento nuevo: por código de barras, si no
+  por nombre normalizado; si no existe se crea. ``asignar`` lo aplica a las
+  altas de una transacción al confirmarla (ver inventario.derivados); si
+  falla, el alta se conserva sin producto hasta el próximo ``agrupar``.
+- ``agrupar`` (``manage.py agrupar_productos``): asigna producto en lote a los
+  medicamentos que no lo tienen. Agrupa con union-find: dos medicamentos son
+  el mismo producto si comparten nombre normalizado o código de barras
+  (directa o transitivamente), y se respetan los productos ya existentes.
+"""
+from django.db import transaction
+from django.db.models import CharField, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Concat, LPad
+
+from .barcode import normalizar_codigo
+from .models import DisponibilidadProducto, Medicamento, Producto
+from .proveedores import limpiar, normalizar
+from .stock import BULK_BATCH_SIZE
+
+
+def clave_producto(nombre):
+    return normalizar(nombre)[:150]
+
+
+def _asignar_sku():
+    # SKU interno de los productos nuevos: P + id con 6 dígitos, en una sola sentencia
+    Producto.objects.filter(sku__isnull=True).update(
+        sku=Concat(Value('P'), LPad(Cast('id', CharField()), 6, Value('0'))),
+    )
+
+
+def resolver(nombre, codigo_barra=None):
+    """Id del producto para un medicamento con ese nombre y código (lo crea si no existe)."""
+    codigo = normalizar_codigo(codigo_barra)
+    clave = clave_producto(nombre)
+    producto_id = None
+    if codigo:
+        producto_id = Producto.objects.filter(codigo_barra=codigo).order_by('id').values_list('id', flat=True).first()
+    if producto_id is None:
+        producto_id = Producto.objects.filter(nombre_normalizado=clave).order_by('id').values_list('id', flat=True).first()
+    if producto_id is None:
+        producto = Producto.objects.create(nombre=limpiar(nombre)[:150], nombre_normalizado=clave,
+                                           codigo_barra=codigo or None)
+        producto.sku = f'P{producto.pk:06d}'
+        producto.save(update_fields=['sku'])
+        producto_id = producto.pk
+    return producto_id
+
+
+def asignar(medicamento_ids):
+    """Resuelve el producto de los medicamentos que siguen sin él (un bulk_update)."""
+    resueltos, cambios = {}, []
+    pendientes = (Medicamento.objects.filter(id__in=list(medicamento_ids), producto__isnull=True)
+                  .order_by('id').values_list('id', 'nombre', 'codigo_barra'))
+    for mid, nombre, codigo in pendientes:
+        clave = (clave_producto(nombre), normalizar_codigo(codigo))
+        if clave not in resueltos:
+            resueltos[clave] = resolver(nombre, codigo)
+        cambios.append(Medicamento(id=mid, producto_id=resueltos[clave]))
+    Medicamento.objects.bulk_update(cambios, ['producto'], batch_size=BULK_BATCH_SIZE)
+
+
+class _Grupos:
+    """Union-find sobre claves ('n', nombre), ('b', código) y ('p', producto_id)."""
+
+    def __init__(self):
+        self.padre = {}
+
+    def raiz(self, nodo):
+        padre = self.padre
+        padre.setdefault(nodo, nodo)
+        while padre[nodo] != nodo:
+            padre[nodo] = padre[padre[nodo]]  # compresión de camino a la mitad
+            nodo = padre[nodo]
+        return nodo
+
+    def unir(self, a, b):
+        ra, rb = self.raiz(a), self.raiz(b)
+        if ra != rb:
+            self.padre[rb] = ra
+
+
+def agrupar(drogueria_ids=None):
+    """Asigna producto a los medicamentos sin producto. Retorna {'asignados', 'creados'}."""
+    grupos = _Grupos()
+    for pid, clave, codigo in Producto.objects.values_list('id', 'nombre_normalizado', 'codigo_barra').iterator():
+        grupos.unir(('p', pid), ('n', clave))
+        if codigo:
+            grupos.unir(('p', pid), ('b', codigo))
+
+    pendientes = Medicamento.objects.filter(producto__isnull=True)
+    if drogueria_ids is not None:
+        pendientes = pendientes.filter(drogueria_id__in=drogueria_ids)
+    meds = []
+    for mid, nombre, codigo in pendientes.order_by('id').values_list('id', 'nombre', 'codigo_barra').iterator(
+            chunk_size=2000):
+        nodo, codigo = ('n', clave_producto(nombre)), normalizar_codigo(codigo)
+        grupos.raiz(nodo)
+        if codigo:
+            grupos.unir(nodo, ('b', codigo))
+        meds.append((mid, nodo, nombre, codigo))
+    if not meds:
+        return {'asignados': 0, 'creados': 0}
+
+    # cada grupo usa el producto existente de menor id; si no tiene, uno nuevo
+    producto_de = {}
+    for nodo in list(grupos.padre):
+        if nodo[0] == 'p':
+            raiz = grupos.raiz(nodo)
+            producto_de[raiz] = min(producto_de.get(raiz, nodo[1]), nodo[1])
+    nuevos = {}
+    for _, nodo, nombre, codigo in meds:
+        raiz = grupos.raiz(nodo)
+        if raiz in producto_de:
+            continue
+        producto = nuevos.get(raiz)
+        if producto is None:
+            nuevos[raiz] = Producto(nombre=limpiar(nombre)[:150], nombre_normalizado=nodo[1],
+                                    codigo_barra=codigo or None)
+        elif codigo and not producto.codigo_barra:
+            producto.codigo_barra = codigo
+
+    with transaction.atomic():
+        Producto.objects.bulk_create(list(nuevos.values()), batch_size=BULK_BATCH_SIZE)
+        _asignar_sku()
+        producto_de.update({raiz: producto.pk for raiz, producto in nuevos.items()})
+        Medicamento.objects.bulk_update(
+            [Medicamento(id=mid, producto_id=producto_de[grupos.raiz(nodo)]) for mid, nodo, _, _ in meds],
+            ['producto'], batch_size=BULK_BATCH_SIZE,
+        )
+        # bulk_update no emite señales: el índice de disponibilidad toma el producto de Medicamento
+        DisponibilidadProducto.objects.filter(producto__isnull=True).update(
+            producto_id=Subquery(Medicamento.objects.filter(pk=OuterRef('medicamento_id')).values('producto_id')[:1]),
+        )
+    return {'asignados': len(meds), 'creados': len(nuevos)}
+
+
+def equivalentes(medicamentos, drogueria_id):
+    """{producto_id: id del medicamento de ese producto en ``drogueria_id``} en una consulta."""
+    productos = {m.producto_id for m in medicamentos if m.producto_id}
+    encontrados = {}
+    if productos:
+        for pid, mid in (Medicamento.objects.filter(drogueria_id=drogueria_id, producto_id__in=productos)
+                         .order_by('id').values_list('producto_id', 'id')):
+            encontrados.setdefault(pid, mid)
+    return encontrados
@@ -0,0 +1,193 @@
+"""Pronóstico de demanda y punto de reorden en lote (``manage.py pronosticar_demanda``).
+
+En una pasada para todos los medicamentos activos (opcionalmente de algunas
+droguerías):
+
+1. Las salidas de los últimos ``dias`` se suman por (medicamento, día local) en
+   la base de datos: una sola consulta agrupada, sin instanciar movimientos.
+2. Con NumPy se arma la matriz medicamentos × días (los días sin salidas valen
+   0) y se calcula, vectorizado por medicamento:
+   - ``media_movil``: media y desviación de los últimos ``ventana`` días;
+   - ``suavizado``: suavizado exponencial simple (``alfa``); la desviación es
+     la del error de pronóstico a un día.
+3. stock de seguridad = z(``servicio``) · σ · √``plazo`` y
+   punto de reorden = demanda diaria · ``plazo`` + stock de seguridad.
+4. Los resultados se guardan en ``PronosticoDemanda`` con upserts en bloque. Con
+   ``aplicar`` el punto de reorden de los medicamentos con demanda pasa a
+   ``Medicamento.stock_minimo`` con un único UPDATE.
+
+Requiere ``numpy`` (en requirements.txt; sin ella el pronóstico responde con un error).
+"""
+import math
+from datetime import datetime, time, timedelta
+from statistics import NormalDist
+
+from django.db import connection, transaction
+from django.db.models import Func, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import alertas, cache, disponibilidad
+from .models import Medicamento, MovimientoInventario, PronosticoDemanda
+from .stock import BULK_BATCH_SIZE
+
+METODOS = dict(PronosticoDemanda.METODOS)
+CAMPOS = ('drogueria', 'metodo', 'demanda_diaria', 'desviacion', 'stock_seguridad', 'punto_reorden',
+          'dias_historia', 'dias_con_demanda', 'calculado_en')
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ValueError('El pronóstico de demanda requiere numpy (pip install numpy)') from None
+    return numpy
+
+
+def _inicio_del_dia(dia):
+    return timezone.make_aware(datetime.combine(dia, time.min))
+
+
+class _OrdinalDiaSQLite(Func):
+    """Ordinal del día local (``date.toordinal``) con ``julianday``, nativo de SQLite.
+
+    ``TruncDate`` en SQLite es una función Python invocada por fila; con un
+    millón de movimientos domina el tiempo total. El desfase horario es el de
+    la zona actual al momento del cálculo.
+    """
+    template = 'CAST(julianday(%(expressions)s) + %(desfase)s AS INTEGER) - 1721425'
+    output_field = IntegerField()
+
+
+def _dia(desde):
+    if connection.vendor == 'sqlite':
+        desfase = timezone.localtime(_inicio_del_dia(desde)).utcoffset().total_seconds() / 86400
+        # julianday cuenta los días desde el mediodía: +0.5 los hace empezar a medianoche
+        return _OrdinalDiaSQLite('fecha_movimiento', desfase=repr(0.5 + desfase))
+    return TruncDate('fecha_movimiento')
+
+
+def _demanda_diaria(np, medicamentos, ids, desde, hasta, dias):
+    """Matriz (medicamentos con salidas × días) y la posición de cada fila en ``ids``."""
+    filas = list(
+        MovimientoInventario.objects
+        .filter(tipo_movimiento='salida', fecha_movimiento__gte=_inicio_del_dia(desde),
+                fecha_movimiento__lt=_inicio_del_dia(hasta), medicamento__in=medicamentos.values('id'))
+        .annotate(dia=_dia(desde))
+        .values_list('medicamento_id', 'dia')
+        .annotate(total=Sum('cantidad'))
+        .order_by()
+    )
+    n = len(filas)
+    base = desde.toordinal()
+    mids = np.fromiter((f[0] for f in filas), dtype=np.int64, count=n)
+    dia = np.fromiter(((f[1] if isinstance(f[1], int) else f[1].toordinal()) - base for f in filas),
+                      dtype=np.int64, count=n)
+    total = np.fromiter((f[2] for f in filas), dtype=np.float64, count=n)
+    posicion = np.searchsorted(ids, mids)
+    # medicamentos dados de alta entre las dos consultas: no están en ``ids``
+    validas = (posicion < len(ids)) & (ids[np.minimum(posicion, len(ids) - 1)] == mids)
+    posiciones, fila = np.unique(posicion[validas], return_inverse=True)
+    matriz = np.zeros((len(posiciones), dias))
+    np.add.at(matriz, (fila, dia[validas]), total[validas])
+    return posiciones, matriz
+
+
+def _media_movil(np, matriz, ventana):
+    recientes = matriz[:, -ventana:]
+    sigma = recientes.std(axis=1, ddof=1) if recientes.shape[1] > 1 else np.zeros(len(matriz))
+    return recientes.mean(axis=1), sigma
+
+
+def _suavizado(np, matriz, alfa):
+    # recursión sobre los días, vectorizada sobre todos los medicamentos a la vez
+    nivel = matriz[:, 0].copy()
+    errores = np.zeros(len(matriz))
+    for t in range(1, matriz.shape[1]):
+        error = matriz[:, t] - nivel
+        errores += error * error
+        nivel += alfa * error
+    return nivel, np.sqrt(errores / max(matriz.shape[1] - 1, 1))
+
+
+def pronosticar(dias=90, metodo='media_movil', ventana=28, alfa=0.3, plazo=7, servicio=0.95,
+                drogueria_ids=None, aplicar=False, hoy=None):
+    """Recalcula ``PronosticoDemanda`` para los medicamentos activos.
+
+    La historia son los ``dias`` completos anteriores a ``hoy`` (por defecto la
+    fecha local). Retorna {'medicamentos', 'con_demanda', 'aplicados'}.
+    """
+    np = _numpy()
+    if metodo not in METODOS:
+        raise ValueError(f'Método desconocido: {metodo}')
+    if dias < 1 or ventana < 1 or plazo < 0 or not 0 < alfa <= 1 or not 0.5 <= servicio < 1:
+        raise ValueError('Parámetros de pronóstico fuera de rango')
+
+    hoy = hoy or timezone.localdate()
+    desde = hoy - timedelta(days=dias)
+    medicamentos = Medicamento.objects.filter(estado=True)
+    if drogueria_ids is not None:
+        medicamentos = medicamentos.filter(drogueria_id__in=drogueria_ids)
+    pares = list(medicamentos.order_by('id').values_list('id', 'drogueria_id'))
+    ids = np.fromiter((p[0] for p in pares), dtype=np.int64, count=len(pares))
+
+    demanda = np.zeros(len(ids))
+    sigma = np.zeros(len(ids))
+    con_demanda = np.zeros(len(ids), dtype=np.int64)
+    if len(ids):
+        posiciones, matriz = _demanda_diaria(np, medicamentos, ids, desde, hoy, dias)
+        if len(posiciones):
+            if metodo == 'media_movil':
+                d, s = _media_movil(np, matriz, min(ventana, dias))
+            else:
+                d, s = _suavizado(np, matriz, alfa)
+            demanda[posiciones], sigma[posiciones] = d, s
+            con_demanda[posiciones] = (matriz > 0).sum(axis=1)
+
+    z = NormalDist().inv_cdf(servicio)
+    # redondeo previo: evita que el ruido de punto flotante sume una unidad al aplicar ceil
+    seguridad = np.ceil(np.round(z * sigma * math.sqrt(plazo), 6))
+    reorden = np.ceil(np.round(demanda * plazo + seguridad, 6))
+
+    ahora = timezone.now()
+    filas = zip(pares, demanda.tolist(), sigma.tolist(), seguridad.astype(np.int64).tolist(),
+                reorden.astype(np.int64).tolist(), con_demanda.tolist())
+    lote = []
+    for (mid, drogueria_id), d, s, ss, rop, n in filas:
+        lote.append(PronosticoDemanda(
+            medicamento_id=mid, drogueria_id=drogueria_id, metodo=metodo, demanda_diaria=d, desviacion=s,
+            stock_seguridad=ss, punto_reorden=rop, dias_historia=dias, dias_con_demanda=n, calculado_en=ahora,
+        ))
+        if len(lote) == BULK_BATCH_SIZE:
+            _guardar(lote)
+            lote = []
+    _guardar(lote)
+
+    aplicados = 0
+    if aplicar:
+        aplicados = aplicar_punto_reorden(medicamentos)
+    return {'medicamentos': len(pares), 'con_demanda': int((con_demanda > 0).sum()), 'aplicados': aplicados}
+
+
+def _guardar(lote):
+    if lote:
+        PronosticoDemanda.objects.bulk_create(
+            lote, update_conflicts=True, unique_fields=['medicamento'], update_fields=list(CAMPOS),
+        )
+
+
+def aplicar_punto_reorden(medicamentos=None):
+    """Copia el punto de reorden a ``stock_minimo`` en los medicamentos con demanda registrada."""
+    medicamentos = Medicamento.objects.all() if medicamentos is None else medicamentos
+    with transaction.atomic():
+        con_demanda = medicamentos.filter(pronostico__dias_con_demanda__gt=0)
+        aplicados = con_demanda.update(
+            stock_minimo=Subquery(
+                PronosticoDemanda.objects.filter(medicamento=OuterRef('pk')).values('punto_reorden')[:1]
+            ),
+        )
+        disponibilidad.sincronizar(con_demanda.values('id'))
+    # el umbral de bajo stock cambió para muchos productos: snapshot y catálogo completos
+    alertas.invalidar_todo()
+    cache.invalidar('catalogo')
+    return aplicados
@@ -0,0 +1,88 @@
+"""Mantenimiento de la tabla de proveedores (``Proveedor``).
+
+``Medicamento.proveedor`` sigue siendo texto libre; aquí se normaliza
+(espacios colapsados, sin distinguir mayúsculas) y se mantiene un contador de
+medicamentos por proveedor con UPDATE atómicos: las escrituras de
+Medicamento acumulan el neto por proveedor y ``ajustar`` lo aplica al
+confirmar la transacción (ver inventario.derivados). El contador es un índice
+reconstruible: si ``ajustar`` falla la escritura ya confirmada se conserva y
+``recalcular`` (``manage.py recalcular_proveedores``) reconstruye todo con un
+GROUP BY, también después de bulk_create / update masivos, que no emiten señales.
+"""
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+
+from .models import Medicamento, Proveedor
+
+
+def limpiar(nombre):
+    return ' '.join((nombre or '').split())
+
+
+def normalizar(nombre):
+    return limpiar(nombre).casefold()
+
+
+def _ajustar(nombre, delta):
+    clave = normalizar(nombre)
+    if not clave:
+        return
+    if delta > 0:
+        Proveedor.objects.get_or_create(nombre_normalizado=clave, defaults={'nombre': limpiar(nombre)[:150]})
+    # nunca negativo, aunque el contador esté desfasado (update masivo sin recalcular)
+    Proveedor.objects.filter(nombre_normalizado=clave).update(medicamentos=Greatest(F('medicamentos') + delta, 0))
+
+
+def acumular(acumulado, nombre, delta):
+    """Suma ``delta`` medicamentos a ``nombre`` en {nombre normalizado: [nombre, delta]}."""
+    clave = normalizar(nombre)
+    if clave:
+        acumulado.setdefault(clave, [nombre, 0])[1] += delta
+
+
+def ajustar(acumulado):
+    """Aplica los netos de ``acumular`` (un UPDATE por proveedor que cambió)."""
+    for clave in sorted(acumulado):
+        nombre, delta = acumulado[clave]
+        if delta:
+            _ajustar(nombre, delta)
+
+
+def buscar(prefijo=None):
+    """Proveedores con medicamentos, opcionalmente por prefijo (rango sobre el índice único)."""
+    qs = Proveedor.objects.filter(medicamentos__gt=0)
+    clave = normalizar(prefijo)
+    if clave:
+        qs = qs.filter(nombre_normalizado__gte=clave, nombre_normalizado__lt=clave + '\U0010ffff')
+    return qs.order_by('nombre_normalizado')
+
+
+def recalcular():
+    """Reconstruye proveedores y contadores desde Medicamento. Retorna el total de proveedores."""
+    conteos, nombres = {}, {}
+    filas = (Medicamento.objects
+             .exclude(proveedor__isnull=True).exclude(proveedor='')
+             .values('proveedor').annotate(n=Count('id')).order_by())
+    for fila in filas:
+        clave = normalizar(fila['proveedor'])
+        if clave:
+            conteos[clave] = conteos.get(clave, 0) + fila['n']
+            nombres.setdefault(clave, limpiar(fila['proveedor'])[:150])
+    with transaction.atomic():
+        existentes = {p.nombre_normalizado: p for p in Proveedor.objects.select_for_update()}
+        nuevos, cambiados = [], []
+        for clave, n in conteos.items():
+            prov = existentes.pop(clave, None)
+            if prov is None:
+                nuevos.append(Proveedor(nombre=nombres[clave], nombre_normalizado=clave, medicamentos=n))
+            elif prov.medicamentos != n:
+                prov.medicamentos = n
+                cambiados.append(prov)
+        for prov in existentes.values():
+            if prov.medicamentos:
+                prov.medicamentos = 0
+                cambiados.append(prov)
+        Proveedor.objects.bulk_create(nuevos, batch_size=500)
+        Proveedor.objects.bulk_update(cambiados, ['medicamentos'], batch_size=500)
+    return len(conteos)
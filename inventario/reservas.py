@@ -0,0 +1,99 @@
+"""Expiración de reservas de préstamos y transferencias pendientes.
+
+Al crear un ``Prestamo`` o una ``Transferencia`` se reserva stock en origen
+(``stock_reservado``) y se fija ``expira_en`` (``settings.INVENTARIO_RESERVA_TTL_HORAS``,
+72 h por defecto). ``liberar_vencidas`` (``manage.py liberar_reservas``) procesa
+por lotes las solicitudes pendientes vencidas, sobre el índice (estado, expira_en):
+
+- suma las cantidades por medicamento y las descuenta de ``stock_reservado`` con
+  un único UPDATE ``CASE id`` por lote (sin bajar de 0);
+- marca las solicitudes como 'cancelled' con un UPDATE;
+- registra un solo evento de outbox por lote (un AuditLog al drenar).
+"""
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from . import outbox
+from .models import LineaTransferencia, Medicamento, Prestamo, Transferencia
+from .stock import stock_cambiado
+
+LOTE = 500
+
+
+def _pendientes_vencidas(modelo, ahora, lote):
+    qs = modelo.objects.filter(estado='pending', expira_en__lte=ahora).order_by('id')
+    if connection.features.has_select_for_update_skip_locked:
+        # varios barridos en paralelo (o un aceptar concurrente) no toman la misma fila
+        qs = qs.select_for_update(skip_locked=True)
+    else:
+        qs = qs.select_for_update()
+    return list(qs.values_list('id', flat=True)[:lote])
+
+
+def _liberar(cantidades):
+    """Descuenta {medicamento_id: cantidad} de stock_reservado con un solo UPDATE."""
+    if not cantidades:
+        return
+    ids = sorted(cantidades)
+    Medicamento.objects.filter(id__in=ids).update(stock_reservado=Greatest(
+        F('stock_reservado') - Case(
+            *[When(id=mid, then=Value(cantidades[mid])) for mid in ids],
+            default=Value(0),
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    ))
+    stock_cambiado.send(sender=Medicamento, cambios=[
+        {'medicamento_id': mid, 'delta': 0, 'reservado_delta': -cantidades[mid], 'stock_actual': None}
+        for mid in ids
+    ])
+
+
+def _cancelar(modelo, ids, ahora):
+    return modelo.objects.filter(id__in=ids, estado='pending').update(
+        estado='cancelled', fecha_respuesta=ahora,
+    )
+
+
+def _lote_prestamos(ahora, lote):
+    with transaction.atomic():
+        ids = _pendientes_vencidas(Prestamo, ahora, lote)
+        if not ids:
+            return 0
+        cantidades = {}
+        for mid, cantidad in Prestamo.objects.filter(id__in=ids).values_list('medicamento_origen_id', 'cantidad'):
+            cantidades[mid] = cantidades.get(mid, 0) + cantidad
+        _liberar(cantidades)
+        _cancelar(Prestamo, ids, ahora)
+        outbox.registrar('reservas_expiradas', modelo='Prestamo', ids=ids, unidades=sum(cantidades.values()))
+    return len(ids)
+
+
+def _lote_transferencias(ahora, lote):
+    with transaction.atomic():
+        ids = _pendientes_vencidas(Transferencia, ahora, lote)
+        if not ids:
+            return 0
+        cantidades = {}
+        for mid, cantidad in (LineaTransferencia.objects.filter(transferencia_id__in=ids)
+                              .values_list('medicamento_origen_id', 'cantidad')):
+            cantidades[mid] = cantidades.get(mid, 0) + cantidad
+        _liberar(cantidades)
+        _cancelar(Transferencia, ids, ahora)
+        outbox.registrar('reservas_expiradas', modelo='Transferencia', ids=ids, unidades=sum(cantidades.values()))
+    return len(ids)
+
+
+def liberar_vencidas(ahora=None, lote=LOTE):
+    """Cancela las solicitudes pendientes vencidas y libera su reserva.
+
+    Retorna {'prestamos': n, 'transferencias': n}.
+    """
+    ahora = ahora or timezone.now()
+    totales = {'prestamos': 0, 'transferencias': 0}
+    for clave, procesar in (('prestamos', _lote_prestamos), ('transferencias', _lote_transferencias)):
+        while n := procesar(ahora, lote):
+            totales[clave] += n
+    return totales
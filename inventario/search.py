@@ -0,0 +1,147 @@
+"""Búsqueda de texto del catálogo de medicamentos con backends intercambiables.
+
+- ``FTS5Backend`` (SQLite): índice FTS5 de contenido externo sobre
+  inventario_medicamento, sincronizado por triggers en cada INSERT/UPDATE/DELETE
+  (también para bulk_create y UPDATE masivos). El tokenizador elimina tildes,
+  así "acetaminofen" encuentra "acetaminofén", y los resultados se ordenan por
+  relevancia (bm25 con más peso para nombre y código de barras).
+- ``IcontainsBackend``: OR de ``icontains`` sin índice; respaldo para motores
+  sin FTS5.
+
+El backend se elige con ``settings.INVENTARIO_SEARCH_BACKEND`` (ruta importable);
+por defecto FTS5 en SQLite e icontains en el resto.
+"""
+import re
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Lookup, Q
+from django.utils.module_loading import import_string
+
+from .models import MedicamentoBusqueda
+
+TABLA_FTS = MedicamentoBusqueda._meta.db_table
+COLUMNAS = ('nombre', 'descripcion', 'codigo_barra', 'lote', 'proveedor')
+# pesos bm25 en el orden de COLUMNAS
+PESOS = (10.0, 1.0, 8.0, 2.0, 1.0)
+
+
+class Match(Lookup):
+    """``indice__match=<expresión FTS5>`` → ``<tabla> MATCH %s``."""
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+
+MedicamentoBusqueda._meta.get_field('indice').register_lookup(Match)
+
+
+def tokens(termino):
+    return re.findall(r'\w+', termino or '')
+
+
+def expresion_fts(termino, columnas=None):
+    """Convierte texto libre en una expresión FTS5: cada palabra como prefijo, unidas con AND."""
+    partes = tokens(termino)
+    if not partes:
+        return None
+    expr = ' AND '.join(f'"{p}"*' for p in partes)
+    columnas = [c for c in (columnas or ()) if c in COLUMNAS]
+    if columnas and len(columnas) < len(COLUMNAS):
+        expr = '{%s} : (%s)' % (' '.join(columnas), expr)
+    return expr
+
+
+class BackendBusqueda:
+    def buscar(self, qs, termino, columnas=None):
+        """Filtra ``qs`` (Medicamento) por ``termino`` en ``columnas`` (todas si None)."""
+        raise NotImplementedError
+
+    def preparar(self, connection):
+        """Crea o repara las estructuras del índice (llamado tras migrate)."""
+
+
+class IcontainsBackend(BackendBusqueda):
+    def buscar(self, qs, termino, columnas=None):
+        columnas = [c for c in (columnas or COLUMNAS) if c in COLUMNAS]
+        return qs.filter(reduce(or_, (Q(**{f'{c}__icontains': termino}) for c in columnas)))
+
+
+class FTS5Backend(BackendBusqueda):
+    def buscar(self, qs, termino, columnas=None):
+        expr = expresion_fts(termino, columnas)
+        if expr is None:
+            return qs
+        return qs.filter(busqueda__indice__match=expr).order_by('busqueda__rank', 'id')
+
+    def _triggers(self):
+        tabla = 'inventario_medicamento'
+        cols = ', '.join(COLUMNAS)
+        nuevos = ', '.join(f'new.{c}' for c in COLUMNAS)
+        viejos = ', '.join(f'old.{c}' for c in COLUMNAS)
+        borrar = (f"INSERT INTO {TABLA_FTS}({TABLA_FTS}, rowid, {cols}) "
+                  f"VALUES ('delete', old.id, {viejos});")
+        insertar = f"INSERT INTO {TABLA_FTS}(rowid, {cols}) VALUES (new.id, {nuevos});"
+        return {
+            f'{TABLA_FTS}_ai': f"CREATE TRIGGER IF NOT EXISTS {TABLA_FTS}_ai AFTER INSERT ON {tabla} BEGIN {insertar} END",
+            f'{TABLA_FTS}_ad': f"CREATE TRIGGER IF NOT EXISTS {TABLA_FTS}_ad AFTER DELETE ON {tabla} BEGIN {borrar} END",
+            # solo columnas indexadas: los UPDATE de stock no tocan el índice
+            f'{TABLA_FTS}_au': (f"CREATE TRIGGER IF NOT EXISTS {TABLA_FTS}_au AFTER UPDATE OF {cols} ON {tabla} "
+                                f"BEGIN {borrar} {insertar} END"),
+        }
+
+    def preparar(self, connection):
+        """Asegura tabla virtual y triggers.
+
+        Django reconstruye la tabla de medicamentos en SQLite con algunos
+        AlterField (crea una nueva, copia y borra la anterior), lo que elimina los
+        triggers; si faltan se recrean y el índice se reconstruye completo.
+        """
+        if connection.vendor != 'sqlite':
+            return
+        triggers = self._triggers()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'inventario_medicamento'"
+            )
+            existentes = {row[0] for row in cursor.fetchall()}
+            if set(triggers) <= existentes:
+                return
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA_FTS} USING fts5("
+                f"{', '.join(COLUMNAS)}, content='inventario_medicamento', content_rowid='id', "
+                f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            )
+            cursor.execute(
+                f"INSERT INTO {TABLA_FTS}({TABLA_FTS}, rank) VALUES ('rank', 'bm25({', '.join(map(str, PESOS))})')"
+            )
+            for sql in triggers.values():
+                cursor.execute(sql)
+            cursor.execute(f"INSERT INTO {TABLA_FTS}({TABLA_FTS}) VALUES ('rebuild')")
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        ruta = getattr(settings, 'INVENTARIO_SEARCH_BACKEND', None)
+        if ruta:
+            _backend = import_string(ruta)()
+        elif connection.vendor == 'sqlite':
+            _backend = FTS5Backend()
+        else:
+            _backend = IcontainsBackend()
+    return _backend
+
+
+def preparar_indice(sender, using='default', **kwargs):
+    """Receptor de post_migrate."""
+    from django.db import connections
+    get_backend().preparar(connections[using])
@@ -1,7 +1,11 @@
+from decimal import Decimal
+
 from rest_framework import serializers
-from .models import Medicamento, Categoria, MovimientoInventario
+from .models import Medicamento, Categoria, MovimientoInventario, Proveedor, ImportacionMedicamentos, LoteMedicamento
 from droguerias.models import Drogueria
 
+CENTAVO = Decimal('0.01')
+
 
 class CategoriaSerializer(serializers.ModelSerializer):
     class Meta:
@@ -22,6 +26,9 @@ class MedicamentoSerializer(serializers.ModelSerializer):
     drogueria = DrogueriaNestedSerializer(read_only=True)
     drogueria_id = serializers.PrimaryKeyRelatedField(queryset=Drogueria.objects.all(), source='drogueria', write_only=True, required=False, allow_null=True)
 
+    # maestro de productos: lo asigna la señal de alta o ``manage.py agrupar_productos``
+    producto = serializers.PrimaryKeyRelatedField(read_only=True)
+
     # exposiciones de propiedades calculadas
     stock_disponible = serializers.IntegerField(read_only=True)
     valor_total = serializers.SerializerMethodField(read_only=True)
@@ -35,7 +42,7 @@ class MedicamentoSerializer(serializers.ModelSerializer):
             'id', 'nombre', 'descripcion', 'precio_venta', 'costo_compra',
             'stock_actual', 'stock_reservado', 'stock_minimo', 'categoria', 'categoria_id',
             'fecha_vencimiento', 'estado', 'imagen_url', 'drogueria', 'drogueria_id',
-            'lote', 'fecha_ingreso', 'proveedor', 'codigo_barra', 'ubicacion',
+            'lote', 'fecha_ingreso', 'proveedor', 'codigo_barra', 'ubicacion', 'producto',
             # calculados
             'stock_disponible', 'valor_total', 'costo_total', 'esta_vencido', 'stock_status'
         ]
@@ -63,7 +70,42 @@ class MedicamentoSerializer(serializers.ModelSerializer):
         return instance.verificar_stock()
 
 
+class MedicamentoListSerializer(MedicamentoSerializer):
+    """Lectura de listados: misma salida que MedicamentoSerializer, pero los
+    calculados vienen anotados por ``Medicamento.objects.para_listado()``."""
+    stock_disponible = serializers.IntegerField(source='stock_disponible_db', read_only=True)
+    esta_vencido = serializers.BooleanField(source='esta_vencido_db', read_only=True)
+    stock_status = serializers.CharField(source='stock_status_db', read_only=True)
+
+    def get_valor_total(self, instance):
+        return _centavos(instance.valor_total_db)
+
+    def get_costo_total(self, instance):
+        return _centavos(instance.costo_total_db)
+
+
+def _centavos(valor):
+    # SQLite devuelve el producto como REAL; se normaliza a 2 decimales como el cálculo en Python
+    return str(Decimal(valor or 0).quantize(CENTAVO))
+
+
+class ProveedorSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Proveedor
+        fields = ['id', 'nombre', 'medicamentos']
+
+
+class ImportacionMedicamentosSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ImportacionMedicamentos
+        fields = ['id', 'archivo', 'drogueria', 'estado', 'filas_procesadas', 'creados', 'actualizados',
+                  'con_error', 'errores', 'creado_en', 'finalizado_en']
+        read_only_fields = fields
+
+
 class MovimientoInventarioSerializer(serializers.ModelSerializer):
+    """Movimiento del libro de stock. ``cantidad``: unidades en entradas y salidas;
+    en un ajuste, la diferencia con signo sobre el stock (no el valor contado)."""
     medicamento = MedicamentoSerializer(read_only=True)
     medicamento_id = serializers.PrimaryKeyRelatedField(
         queryset=Medicamento.objects.all(), source='medicamento', write_only=True, required=True
@@ -80,9 +122,49 @@ class MovimientoInventarioSerializer(serializers.ModelSerializer):
         model = MovimientoInventario
         fields = [
             'id', 'tipo_movimiento', 'cantidad', 'fecha_movimiento',
-            'medicamento', 'medicamento_id', 'drogueria', 'drogueria_id'
+            'medicamento', 'medicamento_id', 'drogueria', 'drogueria_id',
+            'lote', 'fecha_vencimiento',
         ]
 
+    def validate(self, data):
+        validar_cantidad(data.get('tipo_movimiento'), data.get('cantidad'))
+        if data.get('lote') and data.get('tipo_movimiento') != 'entrada':
+            # las salidas y ajustes se asignan a los lotes por vencimiento (FEFO)
+            raise serializers.ValidationError({'lote': 'Solo las entradas indican lote'})
+        return data
+
+
+def validar_cantidad(tipo_movimiento, cantidad):
+    """Entradas y salidas llevan unidades (>= 0); el ajuste es una diferencia con signo (≠ 0)."""
+    if cantidad is None:
+        return
+    if tipo_movimiento == 'ajuste':
+        if cantidad == 0:
+            raise serializers.ValidationError({'cantidad': 'El ajuste debe ser distinto de 0'})
+    elif cantidad < 0:
+        raise serializers.ValidationError({'cantidad': 'Solo los ajustes admiten cantidades negativas'})
+
+
+class MovimientoLoteSerializer(serializers.Serializer):
+    """Fila de la ingesta en lote: ids planos para validar sin una consulta por fila."""
+    medicamento_id = serializers.IntegerField(min_value=1)
+    drogueria_id = serializers.IntegerField(min_value=1, required=False, allow_null=True)
+    tipo_movimiento = serializers.ChoiceField(choices=MovimientoInventario.TIPO_MOVIMIENTO)
+    # ajuste: diferencia con signo respecto del stock registrado
+    cantidad = serializers.IntegerField()
+    fecha_movimiento = serializers.DateTimeField(required=False)
+    observacion = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+    def validate(self, data):
+        validar_cantidad(data['tipo_movimiento'], data['cantidad'])
+        return data
+
+
+class LoteMedicamentoSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = LoteMedicamento
+        fields = ['id', 'codigo', 'fecha_vencimiento', 'cantidad', 'creado_en']
+
 
 class CategoriaConMedicamentosSerializer(serializers.ModelSerializer):
     medicamentos = MedicamentoSerializer(many=True, read_only=True)
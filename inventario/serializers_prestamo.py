@@ -11,8 +11,8 @@ class PrestamoSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Prestamo
-        fields = ['id', 'medicamento_origen', 'medicamento_destino', 'cantidad', 'origen', 'destino', 'estado', 'solicitante', 'respondedor', 'fecha_solicitud', 'fecha_respuesta', 'nota']
-        read_only_fields = ('estado', 'solicitante', 'respondedor', 'fecha_solicitud', 'fecha_respuesta')
+        fields = ['id', 'medicamento_origen', 'medicamento_destino', 'cantidad', 'origen', 'destino', 'estado', 'solicitante', 'respondedor', 'fecha_solicitud', 'fecha_respuesta', 'expira_en', 'nota']
+        read_only_fields = ('estado', 'solicitante', 'respondedor', 'fecha_solicitud', 'fecha_respuesta', 'expira_en')
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
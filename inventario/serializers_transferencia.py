@@ -0,0 +1,48 @@
+from rest_framework import serializers
+from .models import Transferencia, LineaTransferencia, Medicamento
+from . import transferencias
+from droguerias.models import Drogueria
+
+
+class LineaTransferenciaSerializer(serializers.ModelSerializer):
+    medicamento_origen = serializers.PrimaryKeyRelatedField(queryset=Medicamento.objects.all())
+    medicamento_destino = serializers.PrimaryKeyRelatedField(queryset=Medicamento.objects.all(), required=False, allow_null=True)
+    nombre = serializers.CharField(source='medicamento_origen.nombre', read_only=True)
+    cantidad = serializers.IntegerField(min_value=1)
+
+    class Meta:
+        model = LineaTransferencia
+        fields = ['id', 'medicamento_origen', 'medicamento_destino', 'nombre', 'cantidad']
+
+
+class TransferenciaSerializer(serializers.ModelSerializer):
+    origen = serializers.PrimaryKeyRelatedField(queryset=Drogueria.objects.all())
+    destino = serializers.PrimaryKeyRelatedField(queryset=Drogueria.objects.all())
+    lineas = LineaTransferenciaSerializer(many=True)
+
+    class Meta:
+        model = Transferencia
+        fields = ['id', 'origen', 'destino', 'estado', 'lineas', 'solicitante', 'respondedor', 'fecha_solicitud', 'fecha_respuesta', 'expira_en', 'nota']
+        read_only_fields = ('estado', 'solicitante', 'respondedor', 'fecha_solicitud', 'fecha_respuesta', 'expira_en')
+
+    def create(self, validated_data):
+        request = self.context.get('request')
+        lineas = [
+            {
+                'medicamento_origen': l['medicamento_origen'].id,
+                'medicamento_destino': l['medicamento_destino'].id if l.get('medicamento_destino') else None,
+                'cantidad': l['cantidad'],
+            }
+            for l in validated_data['lineas']
+        ]
+        try:
+            # reserva el stock de todas las líneas en la misma transacción
+            return transferencias.crear(
+                validated_data['origen'],
+                validated_data['destino'],
+                lineas,
+                solicitante=getattr(request, 'user', None),
+                nota=validated_data.get('nota'),
+            )
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
@@ -1,7 +1,16 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
-from django.utils import timezone
-from .models import MovimientoInventario, Medicamento, Alerta, Prestamo, AuditLog
+from droguerias.models import Drogueria, InventarioDrogueria
+from .models import Categoria, MovimientoInventario, Medicamento, Prestamo
+from . import alertas, cache, derivados, outbox
+from .stock import stock_cambiado
+
+# Los receptores solo escriben un EventoOutbox compacto en la misma transacción;
+# las auditorías y alertas se materializan con `manage.py drenar_outbox`.
+# Si el INSERT del evento falla, falla el cambio completo (no se silencian errores).
+# Los índices derivados de Medicamento no pasan por el outbox: ver inventario.derivados
+# (agregados y lotes en la misma transacción, el resto al confirmarla).
 
 
 @receiver(post_save, sender=MovimientoInventario)
@@ -11,93 +20,97 @@ def movimiento_post_save(sender, instance: MovimientoInventario, created, **kwar
         return
 
     med = instance.medicamento
-
-    # registrar auditoría básica del movimiento
-    try:
-        AuditLog.objects.create(
-            action='movimiento_creado',
-            model_name='MovimientoInventario',
-            object_id=instance.pk,
-            user=instance.usuario,
-            message=f"Movimiento {instance.tipo_movimiento} {instance.cantidad} para {med.nombre}",
-            data={'medicamento': med.id, 'drogueria': instance.drogueria.id if instance.drogueria else None}
-        )
-    except Exception:
-        pass
-    # verificar stock bajo
-    try:
-        if med.stock_actual <= med.stock_minimo:
-            # evitar duplicados: si ya existe una alerta no leída del mismo tipo para este medicamento
-            exists = Alerta.objects.filter(tipo='low_stock', medicamento=med, leido=False).exists()
-            if not exists:
-                Alerta.objects.create(
-                    tipo='low_stock',
-                    nivel='warning',
-                    mensaje=f"Stock bajo para {med.nombre}: {med.stock_actual} <= {med.stock_minimo}",
-                    medicamento=med,
-                    drogueria=instance.drogueria
-                )
-                # (la auditoría del movimiento ya se registró arriba)
-    except Exception:
-        # no queremos que una excepción en alerts rompa el flujo
-        pass
+    outbox.registrar('movimiento', **outbox.datos_movimiento(instance, med.nombre, med.stock_actual, med.stock_minimo))
 
 
-@receiver(post_save, sender=Medicamento)
-def medicamento_post_save(sender, instance: Medicamento, created, **kwargs):
-    # verificación expiración
-    try:
-        if instance.esta_vencido():
-            exists = Alerta.objects.filter(tipo='vencido', medicamento=instance, leido=False).exists()
-            if not exists:
-                Alerta.objects.create(
-                    tipo='vencido',
-                    nivel='danger',
-                    mensaje=f"{instance.nombre} está vencido o su fecha de vencimiento ha pasado.",
-                    medicamento=instance,
-                    drogueria=instance.drogueria
-                )
-    except Exception:
-        pass
+# Los vencimientos ya no se revisan al guardar: ver inventario.vencimientos
+# (`manage.py barrer_vencimientos`).
 
 
 @receiver(post_save, sender=Prestamo)
 def prestamo_post_save(sender, instance: Prestamo, created, **kwargs):
-    # si un prestamo fue aceptado, crear alerta informativa en la drogueria destino
-    if not created and instance.estado == 'accepted':
-        try:
-            Alerta.objects.create(
-                tipo='prestamo',
-                nivel='info',
-                mensaje=f"Préstamo aceptado: {instance.medicamento_origen.nombre} x{instance.cantidad} {instance.origen.codigo} → {instance.destino.codigo}",
-                medicamento=instance.medicamento_destino,
-                drogueria=instance.destino
-            )
-            # auditoria del prestamo aceptado
-            try:
-                AuditLog.objects.create(
-                    action='prestamo_aceptado',
-                    model_name='Prestamo',
-                    object_id=instance.pk,
-                    user=instance.respondedor,
-                    message=f"Prestamo {instance.id} aceptado: {instance.medicamento_origen.nombre} x{instance.cantidad}",
-                    data={'origen': instance.origen.id, 'destino': instance.destino.id}
-                )
-            except Exception:
-                pass
-        except Exception:
-            # no queremos que una excepción aquí impida que otros handlers se ejecuten
-            pass
-    # si el prestamo fue rechazado
-    if not created and instance.estado == 'rejected':
-        try:
-            AuditLog.objects.create(
-                action='prestamo_rechazado',
-                model_name='Prestamo',
-                object_id=instance.pk,
-                user=instance.respondedor,
-                message=f"Prestamo {instance.id} rechazado: {instance.medicamento_origen.nombre} x{instance.cantidad}",
-                data={'origen': instance.origen.id, 'destino': instance.destino.id}
-            )
-        except Exception:
-            pass
+    # si un prestamo fue aceptado o rechazado, registrar alerta/auditoría vía outbox
+    if created or instance.estado not in ('accepted', 'rejected'):
+        return
+    outbox.registrar(
+        'prestamo_aceptado' if instance.estado == 'accepted' else 'prestamo_rechazado',
+        prestamo=instance.pk,
+        usuario=instance.respondedor_id,
+        medicamento=instance.medicamento_destino_id,
+        origen=instance.origen_id,
+        destino=instance.destino_id,
+        origen_codigo=instance.origen.codigo,
+        destino_codigo=instance.destino.codigo,
+        nombre=instance.medicamento_origen.nombre,
+        cantidad=instance.cantidad,
+    )
+
+
+# =========================
+# 🔄 Índices derivados de Medicamento (inventario.derivados)
+# =========================
+# Los receptores solo anotan el cambio; productos, lotes, agregados, proveedores,
+# disponibilidad, alertas y cachés se actualizan en un lote al confirmar.
+@receiver(pre_save, sender=Medicamento)
+def medicamento_valores_anteriores(sender, instance: Medicamento, update_fields=None, **kwargs):
+    # droguería, proveedor, stock, precio y costo de la fila antes de guardar: los leídos
+    # con la instancia (Medicamento.from_db), salvo que la fila se haya escrito después
+    anterior = getattr(instance, '_valores_db', None)
+    if instance.pk and (anterior is None or derivados.escrito(instance.pk)):
+        escritos = None if update_fields is None else {
+            Medicamento._meta.get_field(campo).attname for campo in update_fields}
+        if escritos is None or escritos & set(Medicamento.VALORES_SEGUIDOS):
+            anterior = Medicamento.objects.filter(pk=instance.pk).values(*Medicamento.VALORES_SEGUIDOS).first()
+    instance._valores_anteriores = anterior
+
+
+@receiver(post_save, sender=Medicamento)
+def medicamento_derivados(sender, instance: Medicamento, created, update_fields=None, **kwargs):
+    anterior = None if created else instance.__dict__.pop('_valores_anteriores', None)
+    if not created and anterior is None:
+        # fila existente sin valores conocidos: solo cambiaron columnas no seguidas
+        anterior = {campo: getattr(instance, campo) for campo in Medicamento.VALORES_SEGUIDOS}
+    instance._valores_db = derivados.guardado(instance, anterior, update_fields)
+
+
+@receiver(post_delete, sender=Medicamento)
+def medicamento_borrado_derivados(sender, instance: Medicamento, **kwargs):
+    derivados.borrado(instance)
+
+
+@receiver(stock_cambiado)
+def stock_derivados(sender, cambios, **kwargs):
+    derivados.stock(cambios)
+
+
+# =========================
+# 🗂️ Invalidación de la caché del catálogo
+# =========================
+# Medicamento y el libro de stock invalidan desde su lote de derivados
+@receiver(post_save, sender=Categoria)
+@receiver(post_delete, sender=Categoria)
+@receiver(post_save, sender=Drogueria)
+@receiver(post_delete, sender=Drogueria)
+def catalogo_invalidar(sender, **kwargs):
+    # ahora y de nuevo al confirmar: una lectura concurrente pudo cachear el valor previo
+    cache.invalidar('catalogo')
+    transaction.on_commit(lambda: cache.invalidar('catalogo'))
+
+
+# =========================
+# 🚨 Refresco del snapshot de alertas
+# =========================
+@receiver(post_save, sender=Categoria)
+def categoria_invalidar_alertas(sender, created, **kwargs):
+    # los items guardan el nombre de la categoría
+    if not created:
+        alertas.invalidar_todo()
+
+
+# =========================
+# 🏪 Agregados por droguería (InventarioDrogueria)
+# =========================
+@receiver(post_save, sender=Drogueria)
+def drogueria_crear_inventario(sender, instance: Drogueria, created, **kwargs):
+    if created:
+        InventarioDrogueria.objects.get_or_create(drogueria=instance)
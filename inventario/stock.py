@@ -0,0 +1,316 @@
+"""Libro de stock: aplica movimientos con UPDATE condicionales en la base de datos.
+
+Cada operación es una única sentencia
+``UPDATE ... SET stock_actual = stock_actual ± n WHERE id = ... AND <guardas>``
+que la base de datos serializa, de modo que escritores concurrentes no pierden
+actualizaciones (el patrón anterior leía el medicamento, sumaba en Python y
+guardaba la fila completa). Las operaciones que dejarían el stock disponible
+en negativo se rechazan con ``StockInsuficienteError`` en lugar de recortarse a 0.
+
+Cuando el motor soporta ``UPDATE ... RETURNING`` (SQLite >= 3.35, PostgreSQL) el
+nuevo stock se obtiene en la misma sentencia, sin un segundo SELECT.
+"""
+from django.db import connection, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.dispatch import Signal
+from django.utils import timezone
+
+from . import outbox
+from .models import Medicamento, MovimientoInventario
+
+# Se emite una vez por sentencia de este módulo, dentro de su transacción.
+# kwargs: cambios, lista de dicts con medicamento_id, delta, reservado_delta,
+# stock_actual (None si no se conoce) y, cuando delta != 0, drogueria_id,
+# precio_venta y costo_compra leídos en el mismo UPDATE
+stock_cambiado = Signal()
+# columnas que devuelve cada UPDATE del libro (stock_actual primero)
+COLUMNAS_DEVUELTAS = ('stock_actual', 'drogueria_id', 'precio_venta', 'costo_compra')
+
+class StockInsuficienteError(ValueError):
+    """La operación dejaría el stock (o la reserva) por debajo de cero."""
+
+
+def _tabla():
+    return Medicamento._meta.db_table
+
+
+def _soporta_returning():
+    if connection.vendor == 'postgresql':
+        return True
+    # can_return_columns_from_insert equivale a SQLite >= 3.35, que es la misma
+    # versión que introdujo RETURNING también para UPDATE
+    return connection.vendor == 'sqlite' and connection.features.can_return_columns_from_insert
+
+
+def _ejecutar_update(sets, condiciones, params, medicamento_id):
+    """Ejecuta el UPDATE y devuelve la fila de ``COLUMNAS_DEVUELTAS`` o None si no afectó filas."""
+    qn = connection.ops.quote_name
+    sql = 'UPDATE {} SET {} WHERE {} = %s{}'.format(
+        qn(_tabla()),
+        ', '.join(sets),
+        qn('id'),
+        ''.join(' AND ' + c for c in condiciones),
+    )
+    with connection.cursor() as cursor:
+        if _soporta_returning():
+            cursor.execute(sql + ' RETURNING ' + ', '.join(map(qn, COLUMNAS_DEVUELTAS)), params)
+            return cursor.fetchone()
+        cursor.execute(sql, params)
+        if cursor.rowcount == 0:
+            return None
+        # motores sin RETURNING (MySQL/MariaDB): la fila sigue bloqueada por el UPDATE
+        cursor.execute(
+            'SELECT {} FROM {} WHERE {} = %s'.format(', '.join(map(qn, COLUMNAS_DEVUELTAS)), qn(_tabla()), qn('id')),
+            [medicamento_id],
+        )
+        return cursor.fetchone()
+
+
+def _cambio(medicamento_id, delta, reservado_delta, fila):
+    return dict(zip(COLUMNAS_DEVUELTAS, fila), medicamento_id=medicamento_id,
+                delta=delta, reservado_delta=reservado_delta)
+
+
+def _rechazar(medicamento_id, mensaje):
+    if not Medicamento.objects.filter(pk=medicamento_id).exists():
+        raise Medicamento.DoesNotExist(f'Medicamento {medicamento_id} no existe')
+    raise StockInsuficienteError(mensaje)
+
+
+def aplicar_delta(medicamento_id, delta=0, reservado_delta=0, validar_disponible=True, condicion_stock=None):
+    """Suma ``delta`` a stock_actual y ``reservado_delta`` a stock_reservado en un solo UPDATE.
+
+    Guardas aplicadas en el WHERE:
+    - stock_actual y stock_reservado nunca quedan negativos;
+    - si la operación reduce el stock disponible (stock_actual - stock_reservado),
+      el disponible actual debe cubrirla (desactivable con ``validar_disponible``);
+    - ``condicion_stock``: exige que stock_actual valga exactamente ese valor
+      (control optimista de la ingesta en lote).
+
+    Retorna el nuevo stock_actual. Lanza ``StockInsuficienteError`` si alguna
+    guarda falla y ``Medicamento.DoesNotExist`` si el id no existe.
+    """
+    qn = connection.ops.quote_name
+    actual, reservado = qn('stock_actual'), qn('stock_reservado')
+    sets = [f'{actual} = {actual} + %s', f'{reservado} = {reservado} + %s']
+    params = [delta, reservado_delta, medicamento_id]
+    condiciones = []
+    if delta < 0:
+        condiciones.append(f'{actual} >= %s')
+        params.append(-delta)
+    if reservado_delta < 0:
+        condiciones.append(f'{reservado} >= %s')
+        params.append(-reservado_delta)
+    if validar_disponible and delta - reservado_delta < 0:
+        condiciones.append(f'{actual} - {reservado} >= %s')
+        params.append(reservado_delta - delta)
+    if condicion_stock is not None:
+        condiciones.append(f'{actual} = %s')
+        params.append(condicion_stock)
+
+    # sin savepoint: los derivados transaccionales (inventario.derivados) se escriben en la
+    # transacción del llamador y un error en ellos la revierte junto con el UPDATE
+    with transaction.atomic(savepoint=False):
+        fila = _ejecutar_update(sets, condiciones, params, medicamento_id)
+        if fila is not None:
+            stock_cambiado.send(sender=Medicamento,
+                                cambios=[_cambio(medicamento_id, delta, reservado_delta, fila)])
+    if fila is None:
+        _rechazar(medicamento_id, 'Stock insuficiente para la operación solicitada')
+    return fila[0]
+
+
+def aplicar_deltas(deltas):
+    """Aplica los deltas de varios medicamentos en un único UPDATE con ``CASE id``.
+
+    ``deltas``: {medicamento_id: (delta, reservado_delta)}. Cada fila debe cumplir
+    las mismas guardas que ``aplicar_delta``; si alguna no las cumple se lanza
+    ``StockInsuficienteError`` y no se aplica ninguna. Retorna {medicamento_id: stock_actual}.
+    """
+    deltas = {mid: d for mid, d in deltas.items() if d[0] or d[1]}
+    if not deltas:
+        return {}
+    qn = connection.ops.quote_name
+    actual, reservado, id_ = qn('stock_actual'), qn('stock_reservado'), qn('id')
+    ids = sorted(deltas)
+
+    def caso(valor):
+        sql = 'CASE {} {} ELSE 0 END'.format(id_, ' '.join(['WHEN %s THEN %s'] * len(ids)))
+        return sql, [p for mid in ids for p in (mid, valor(deltas[mid]))]
+
+    suma, p_suma = caso(lambda d: d[0])
+    res, p_res = caso(lambda d: d[1])
+    disp, p_disp = caso(lambda d: d[0] - d[1])
+    sql = (
+        'UPDATE {t} SET {a} = {a} + {suma}, {r} = {r} + {res} '
+        'WHERE {id} IN ({ids}) AND {a} + {suma} >= 0 AND {r} + {res} >= 0 '
+        'AND ({disp} >= 0 OR {a} + {suma} - ({r} + {res}) >= 0)'
+    ).format(t=qn(_tabla()), a=actual, r=reservado, id=id_, ids=', '.join(['%s'] * len(ids)),
+             suma=suma, res=res, disp=disp)
+    params = p_suma + p_res + ids + p_suma + p_res + p_disp + p_suma + p_res
+
+    with transaction.atomic(savepoint=False):
+        with connection.cursor() as cursor:
+            columnas = ', '.join(map(qn, ('id',) + COLUMNAS_DEVUELTAS))
+            if _soporta_returning():
+                cursor.execute(sql + ' RETURNING ' + columnas, params)
+                filas = {fila[0]: fila[1:] for fila in cursor.fetchall()}
+            else:
+                cursor.execute(sql, params)
+                filas = {}
+                if cursor.rowcount == len(ids):
+                    cursor.execute('SELECT {} FROM {} WHERE {} IN ({})'.format(
+                        columnas, qn(_tabla()), id_, ', '.join(['%s'] * len(ids))), ids)
+                    filas = {fila[0]: fila[1:] for fila in cursor.fetchall()}
+        if len(filas) != len(ids):
+            # revierte las filas que sí se actualizaron (toda la transacción del llamador)
+            raise StockInsuficienteError('Stock insuficiente para la operación solicitada')
+        stock_cambiado.send(sender=Medicamento, cambios=[
+            _cambio(mid, deltas[mid][0], deltas[mid][1], filas[mid]) for mid in ids
+        ])
+    return {mid: fila[0] for mid, fila in filas.items()}
+
+
+def aplicar_movimiento(medicamento_id, tipo_movimiento, cantidad, consumir_reserva=False):
+    """Aplica un movimiento de inventario y devuelve el nuevo stock_actual.
+
+    - entrada: suma ``cantidad``.
+    - salida: resta ``cantidad`` si el stock disponible alcanza; con
+      ``consumir_reserva`` descuenta también la reserva (despacho de un préstamo).
+    - ajuste: suma ``cantidad`` con signo (conteo físico: diferencia contada,
+      p. ej. -3 por merma); el stock no puede quedar negativo.
+    """
+    if tipo_movimiento == 'ajuste':
+        if not cantidad:
+            raise ValueError('El ajuste debe ser distinto de 0')
+        return aplicar_delta(medicamento_id, cantidad, validar_disponible=False)
+    if cantidad < 0:
+        raise ValueError('La cantidad debe ser positiva')
+    if tipo_movimiento == 'entrada':
+        return aplicar_delta(medicamento_id, cantidad)
+    if tipo_movimiento == 'salida':
+        if consumir_reserva:
+            return aplicar_delta(medicamento_id, -cantidad, reservado_delta=-cantidad)
+        return aplicar_delta(medicamento_id, -cantidad)
+    raise ValueError(f'Tipo de movimiento desconocido: {tipo_movimiento}')
+
+
+def reservar(medicamento_id, cantidad):
+    """Aumenta stock_reservado si el disponible alcanza. Devuelve stock_actual."""
+    return aplicar_delta(medicamento_id, reservado_delta=cantidad)
+
+
+def liberar_reserva(medicamento_id, cantidad):
+    """Reduce stock_reservado sin bajar de 0 (libera reservas de préstamos)."""
+    with transaction.atomic(savepoint=False):
+        Medicamento.objects.filter(pk=medicamento_id).update(
+            stock_reservado=Greatest(F('stock_reservado') - Value(cantidad), Value(0))
+        )
+        stock_cambiado.send(sender=Medicamento, cambios=[
+            {'medicamento_id': medicamento_id, 'delta': 0, 'reservado_delta': -cantidad, 'stock_actual': None},
+        ])
+
+
+# =========================
+# 📥 INGESTA DE MOVIMIENTOS EN LOTE
+# =========================
+MAX_REINTENTOS_LOTE = 3
+BULK_BATCH_SIZE = 500
+
+
+def _simular(filas, stocks):
+    """Recorre las filas en orden sobre una copia del stock y decide cuáles se aplican.
+
+    ``stocks``: {medicamento_id: [stock_actual, stock_reservado]} (se modifica).
+    Retorna la lista de filas aceptadas; las rechazadas quedan marcadas en ``fila['error']``.
+    """
+    aceptadas = []
+    for fila in filas:
+        actual, reservado = stocks[fila['medicamento_id']]
+        cantidad = fila['cantidad']
+        if fila['tipo_movimiento'] == 'entrada':
+            actual += cantidad
+        elif fila['tipo_movimiento'] == 'salida':
+            if actual - reservado < cantidad:
+                fila['error'] = f'Stock insuficiente: disponible {max(actual - reservado, 0)}, solicitado {cantidad}'
+                continue
+            actual -= cantidad
+        else:  # ajuste con signo
+            if actual + cantidad < 0:
+                fila['error'] = f'El ajuste dejaría el stock negativo: stock {actual}, ajuste {cantidad}'
+                continue
+            actual += cantidad
+        stocks[fila['medicamento_id']] = [actual, reservado]
+        aceptadas.append(fila)
+    return aceptadas
+
+
+def registrar_lote(filas, usuario=None):
+    """Registra muchos movimientos en una sola transacción.
+
+    ``filas``: dicts ya validados con medicamento_id, tipo_movimiento, cantidad y
+    opcionalmente drogueria_id, fecha_movimiento, observacion.
+
+    - Bloquea los medicamentos afectados en orden de id (orden estable entre lotes
+      concurrentes, evita deadlocks).
+    - Simula las filas en orden; una salida que excede el disponible se rechaza
+      sin afectar al resto del lote.
+    - Aplica un único UPDATE por medicamento con el delta neto, condicionado al
+      stock leído (en motores sin SELECT FOR UPDATE detecta escrituras concurrentes
+      y reintenta el lote).
+    - Inserta los movimientos con bulk_create (sin save() por fila ni señales) y
+      sus eventos de outbox, también en bloque.
+
+    Retorna {medicamento_id: stock_final} y deja en cada fila ``movimiento`` o ``error``.
+    """
+    ids = sorted({f['medicamento_id'] for f in filas})
+    for intento in range(MAX_REINTENTOS_LOTE):
+        for fila in filas:
+            fila.pop('error', None)
+            fila.pop('movimiento', None)
+        try:
+            with transaction.atomic():
+                bloqueados = (Medicamento.objects.select_for_update()
+                              .filter(id__in=ids).order_by('id')
+                              .values_list('id', 'stock_actual', 'stock_reservado', 'drogueria_id',
+                                           'nombre', 'stock_minimo'))
+                stocks, iniciales, info = {}, {}, {}
+                for mid, actual, reservado, drogueria_id, nombre, minimo in bloqueados:
+                    stocks[mid] = [actual, reservado]
+                    iniciales[mid] = actual
+                    info[mid] = (drogueria_id, nombre, minimo)
+
+                aceptadas = _simular(filas, stocks)
+
+                for mid in ids:
+                    delta = stocks[mid][0] - iniciales[mid]
+                    if delta:
+                        aplicar_delta(mid, delta, validar_disponible=False, condicion_stock=iniciales[mid])
+
+                ahora = timezone.now()
+                movimientos = [
+                    MovimientoInventario(
+                        medicamento_id=f['medicamento_id'],
+                        drogueria_id=f.get('drogueria_id') or info[f['medicamento_id']][0],
+                        tipo_movimiento=f['tipo_movimiento'],
+                        cantidad=f['cantidad'],
+                        fecha_movimiento=f.get('fecha_movimiento') or ahora,
+                        usuario=usuario,
+                        observacion=f.get('observacion'),
+                    )
+                    for f in aceptadas
+                ]
+                MovimientoInventario.objects.bulk_create(movimientos, batch_size=BULK_BATCH_SIZE)
+                for fila, mov in zip(aceptadas, movimientos):
+                    fila['movimiento'] = mov
+                outbox.registrar_varios([
+                    ('movimiento', outbox.datos_movimiento(
+                        mov, info[mov.medicamento_id][1], stocks[mov.medicamento_id][0], info[mov.medicamento_id][2]))
+                    for mov in movimientos
+                ])
+            return {mid: stocks[mid][0] for mid in ids}
+        except StockInsuficienteError:
+            # el stock cambió entre la lectura y el UPDATE (solo posible sin SELECT FOR UPDATE)
+            if intento == MAX_REINTENTOS_LOTE - 1:
+                raise
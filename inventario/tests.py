@@ -1,7 +1,26 @@
+import importlib.util
+import threading
+from datetime import timedelta
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.core.cache import cache as django_cache
+from django.db import connection, transaction
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
 from rest_framework.test import APITestCase
 from usuarios.models import Usuario
-from droguerias.models import Drogueria
-from .models import Medicamento, MovimientoInventario, Alerta, AuditLog, Prestamo
+from droguerias.models import Drogueria, InventarioDrogueria
+from .models import (Categoria, Medicamento, MovimientoInventario, Alerta, AuditLog, Prestamo, StockCheckpoint, Transferencia,
+                     ImportacionMedicamentos, LoteMedicamento, PronosticoDemanda, Producto, Proveedor,
+                     DisponibilidadProducto)
+from . import cache as cache_inventario
+from . import (agregados, barcode, disponibilidad, exportacion, historico, importacion, lotes, productos, pronostico,
+               proveedores, reservas, vencimientos)
+from .barcode import buscar_por_codigo
+from .outbox import drenar
+from .serializer import MedicamentoSerializer
+from .stock import aplicar_movimiento, StockInsuficienteError
 
 
 class InventarioFilterTests(APITestCase):
@@ -149,6 +168,7 @@ class PrestamoFlowTests(APITestCase):
         prestamo = Prestamo.objects.create(medicamento_origen=self.m1, cantidad=2, origen=self.d1, destino=self.d2, solicitante=self.user)
         prestamo.reservar()
         prestamo.aceptar(user=self.user)
+        drenar()
         assert AuditLog.objects.filter(action='prestamo_aceptado', model_name='Prestamo', object_id=prestamo.id).exists()
 
     def test_accept_requires_permission(self):
@@ -198,6 +218,144 @@ class PrestamoFlowTests(APITestCase):
         assert any(p['id'] == p1_id for p in items)
 
 
+class TransferenciaTests(APITestCase):
+    URL = '/api/inventario/transferencias/'
+
+    def setUp(self):
+        self.user = Usuario.objects.create_user(username='transf', password='x', email='transf@example.com')
+        self.d1 = Drogueria.objects.create(codigo='T1', nombre='Transf 1', propietario=self.user)
+        self.d2 = Drogueria.objects.create(codigo='T2', nombre='Transf 2', propietario=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.origen = [Medicamento.objects.create(nombre=f'T med {i}', precio_venta=5, stock_actual=10,
+                                                      proveedor='Genfar', drogueria=self.d1) for i in range(5)]
+            # solo el primero ya existe en destino
+            self.existente = Medicamento.objects.create(nombre='T med 0', precio_venta=5, stock_actual=1,
+                                                        drogueria=self.d2)
+        self.client.force_authenticate(self.user)
+
+    def _crear(self, cantidad=3):
+        resp = self.client.post(self.URL, {
+            'origen': self.d1.id, 'destino': self.d2.id,
+            'lineas': [{'medicamento_origen': m.id, 'cantidad': cantidad} for m in self.origen],
+        }, format='json')
+        self.assertEqual(resp.status_code, 201, resp.content)
+        return resp.json()['id']
+
+    def test_create_reserves_and_accept_moves_all_lines(self):
+        tid = self._crear()
+        self.assertEqual(list(Medicamento.objects.filter(drogueria=self.d1).values_list('stock_reservado', flat=True)), [3] * 5)
+
+        resp = self.client.post(f'{self.URL}{tid}/accept/')
+        self.assertEqual(resp.status_code, 200, resp.content)
+        self.assertEqual(set(Medicamento.objects.filter(drogueria=self.d1).values_list('stock_actual', 'stock_reservado')), {(7, 0)})
+        destino = dict(Medicamento.objects.filter(drogueria=self.d2).values_list('nombre', 'stock_actual'))
+        self.assertEqual(destino, {f'T med {i}': 4 if i == 0 else 3 for i in range(5)})
+        self.assertEqual(MovimientoInventario.objects.filter(observacion=f'Transferencia {tid}').count(), 10)
+        self.assertEqual(self.client.post(f'{self.URL}{tid}/accept/').status_code, 400)
+
+        drenar()
+        self.assertTrue(AuditLog.objects.filter(action='transferencia_aceptada', object_id=tid).exists())
+
+    def test_insufficient_line_rolls_back_whole_document(self):
+        Medicamento.objects.filter(pk=self.origen[-1].pk).update(stock_reservado=9)
+        resp = self.client.post(self.URL, {
+            'origen': self.d1.id, 'destino': self.d2.id,
+            'lineas': [{'medicamento_origen': m.id, 'cantidad': 2} for m in self.origen],
+        }, format='json')
+        self.assertEqual(resp.status_code, 400)
+        self.assertFalse(Transferencia.objects.exists())
+        self.assertEqual(Medicamento.objects.get(pk=self.origen[0].pk).stock_reservado, 0)
+
+    def test_reject_releases_reservations(self):
+        tid = self._crear(cantidad=4)
+        self.assertEqual(self.client.post(f'{self.URL}{tid}/reject/', {'nota': 'no'}).status_code, 200)
+        self.assertEqual(set(Medicamento.objects.filter(drogueria=self.d1).values_list('stock_actual', 'stock_reservado')), {(10, 0)})
+        self.assertEqual(Transferencia.objects.get(pk=tid).estado, 'rejected')
+
+    def _aceptar(self, lineas):
+        from . import transferencias
+        resp = self.client.post(self.URL, {
+            'origen': self.d1.id, 'destino': self.d2.id,
+            'lineas': [{'medicamento_origen': m.id, 'cantidad': 1} for m in lineas],
+        }, format='json')
+        transferencia = Transferencia.objects.get(pk=resp.json()['id'])
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx, self.captureOnCommitCallbacks(execute=True):
+            transferencias.aceptar(transferencia, usuario=self.user)
+        return ctx.captured_queries
+
+    def test_accept_query_count_does_not_grow_per_line(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Medicamento.objects.bulk_create([Medicamento(nombre=f'T med {i}', precio_venta=5, drogueria=self.d2)
+                                             for i in range(1, 5)])
+        una, todas = self._aceptar(self.origen[:1]), self._aceptar(self.origen)
+        # total de la aceptación, mantenimiento de índices al confirmar incluido
+        self.assertEqual((len(una), len(todas)), (25, 25))
+
+    def test_missing_destinations_are_created_in_bulk(self):
+        una, tres = self._aceptar(self.origen[1:2]), self._aceptar(self.origen[2:])
+        # un INSERT de medicamentos y un solo lote de mantenimiento, sin importar cuántos se crean
+        self.assertEqual((len(una), len(tres)), (34, 34))
+        self.assertEqual(sum(q['sql'].startswith('INSERT INTO "inventario_medicamento"') for q in tres), 1)
+        self.assertEqual(InventarioDrogueria.objects.get(drogueria=self.d2).cantidad_medicamentos, 5)
+        self.assertEqual(proveedores.buscar('genfar').get().medicamentos, 9)
+        self.assertEqual(DisponibilidadProducto.objects.filter(drogueria=self.d2).count(), 5)
+
+
+class ReservasVencidasTests(APITestCase):
+    def setUp(self):
+        self.user = Usuario.objects.create_user(username='reserv', password='x', email='reserv@example.com')
+        self.d1 = Drogueria.objects.create(codigo='R1', nombre='Reserv 1', propietario=self.user)
+        self.d2 = Drogueria.objects.create(codigo='R2', nombre='Reserv 2', propietario=self.user)
+        self.m1 = Medicamento.objects.create(nombre='R med', precio_venta=5, stock_actual=20, drogueria=self.d1)
+        self.m2 = Medicamento.objects.create(nombre='R med 2', precio_venta=5, stock_actual=20, drogueria=self.d1)
+
+    def _prestamo(self, med, cantidad, **extra):
+        p = Prestamo.objects.create(medicamento_origen=med, cantidad=cantidad, origen=self.d1, destino=self.d2,
+                                    solicitante=self.user, **extra)
+        p.reservar()
+        return p
+
+    def test_reject_after_sweep_does_not_release_twice(self):
+        vencido = self._prestamo(self.m1, 5, expira_en=timezone.now() - timedelta(hours=1))
+        self._prestamo(self.m1, 3)
+        reservas.liberar_vencidas()
+        # la instancia en memoria sigue 'pending'; la fila ya la canceló el barrido
+        with self.assertRaises(ValueError):
+            vencido.rechazar(user=self.user)
+        self.m1.refresh_from_db()
+        self.assertEqual(self.m1.stock_reservado, 3)  # la reserva vigente sigue intacta
+        self.assertEqual(Prestamo.objects.get(pk=vencido.pk).estado, 'cancelled')
+
+    def test_sweep_releases_expired_and_cancels_in_batches(self):
+        pasado = timezone.now() - timedelta(hours=1)
+        vencidos = [self._prestamo(self.m1, 2, expira_en=pasado) for _ in range(3)] + [self._prestamo(self.m2, 4, expira_en=pasado)]
+        vigente = self._prestamo(self.m1, 1)
+        self.assertGreater(vigente.expira_en, timezone.now())
+
+        self.assertEqual(reservas.liberar_vencidas(lote=2), {'prestamos': 4, 'transferencias': 0})
+        self.assertEqual(set(Prestamo.objects.filter(id__in=[p.id for p in vencidos]).values_list('estado', flat=True)), {'cancelled'})
+        self.assertEqual(Prestamo.objects.get(pk=vigente.pk).estado, 'pending')
+        self.m1.refresh_from_db()
+        self.m2.refresh_from_db()
+        self.assertEqual((self.m1.stock_reservado, self.m2.stock_reservado), (1, 0))
+
+        drenar()
+        self.assertEqual(AuditLog.objects.filter(action='reservas_expiradas').count(), 2)  # un registro por lote
+        with self.assertRaises(ValueError):
+            vencidos[0].aceptar(user=self.user)
+        self.assertEqual(reservas.liberar_vencidas(), {'prestamos': 0, 'transferencias': 0})
+
+    def test_sweep_expires_transferencias(self):
+        from . import transferencias
+        t = transferencias.crear(self.d1, self.d2, [{'medicamento_origen': self.m1.id, 'cantidad': 3},
+                                                     {'medicamento_origen': self.m2.id, 'cantidad': 5}])
+        Transferencia.objects.filter(pk=t.pk).update(expira_en=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(reservas.liberar_vencidas(), {'prestamos': 0, 'transferencias': 1})
+        self.assertEqual(list(Medicamento.objects.filter(drogueria=self.d1).values_list('stock_reservado', flat=True)), [0, 0])
+        self.assertEqual(Transferencia.objects.get(pk=t.pk).estado, 'cancelled')
+
+
 class MedicamentoSerializerTests(APITestCase):
     def test_medicamento_serializer_includes_computed_fields(self):
         from .serializer import MedicamentoSerializer
@@ -227,6 +385,7 @@ class AlertaSignalsTests(APITestCase):
         med = Medicamento.objects.create(nombre='AlertaMed', precio_venta=5.0, stock_actual=5, stock_minimo=3, drogueria=self.d1)
         # salida que reduce stock a 3 (igual a minimo) -> should create alert
         MovimientoInventario.objects.create(medicamento=med, drogueria=self.d1, tipo_movimiento='salida', cantidad=2)
+        drenar()
 
         # check alert exists
         from .models import Alerta
@@ -236,12 +395,14 @@ class AlertaSignalsTests(APITestCase):
     def test_auditlog_created_on_movimiento(self):
         med = Medicamento.objects.create(nombre='AuditMed', precio_venta=4.0, stock_actual=4, stock_minimo=3, drogueria=self.d1)
         MovimientoInventario.objects.create(medicamento=med, drogueria=self.d1, tipo_movimiento='salida', cantidad=1)
+        drenar()
         assert AuditLog.objects.filter(action='movimiento_creado', model_name='MovimientoInventario').exists()
 
     def test_alerts_api_list_and_mark_read(self):
         # create med and movement to produce alert
         med = Medicamento.objects.create(nombre='ApiAlert', precio_venta=4.0, stock_actual=3, stock_minimo=3, drogueria=self.d1)
         MovimientoInventario.objects.create(medicamento=med, drogueria=self.d1, tipo_movimiento='salida', cantidad=1)
+        drenar()
 
         # owner should see alert via API
         self.client.force_authenticate(self.user)
@@ -265,6 +426,7 @@ class AlertaSignalsTests(APITestCase):
         # create an audit by creating a movement
         med = Medicamento.objects.create(nombre='Alog', precio_venta=1.0, stock_actual=3, stock_minimo=3, drogueria=self.d1)
         MovimientoInventario.objects.create(medicamento=med, drogueria=self.d1, tipo_movimiento='salida', cantidad=1)
+        drenar()
 
         # non-admin should get empty list (queryset returns none)
         self.client.force_authenticate(self.user)
@@ -293,3 +455,1391 @@ class AlertaSignalsTests(APITestCase):
 from django.test import TestCase
 
 # Create your tests here.
+
+
+class BusquedaCatalogoTests(APITestCase):
+    def setUp(self):
+        self.a = Medicamento.objects.create(nombre='Acetaminofén 500mg', descripcion='Analgésico', precio_venta=1.0, codigo_barra='7701001')
+        self.b = Medicamento.objects.create(nombre='Ibuprofeno', descripcion='Alternativa al acetaminofen', precio_venta=1.0)
+        self.c = Medicamento.objects.create(nombre='Loratadina', descripcion='Antialérgico', precio_venta=1.0, proveedor='Acetaminofen Labs')
+
+    def _nombres(self, url):
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200, resp.content)
+        data = resp.json()
+        return [i['nombre'] for i in (data['results'] if isinstance(data, dict) else data)]
+
+    def test_catalogo_q_is_accent_insensitive_and_ranked(self):
+        # nombre pesa más que descripcion; proveedor no participa en `q`
+        self.assertEqual(self._nombres('/api/inventario/catalogo/?q=acetaminofen'), ['Acetaminofén 500mg', 'Ibuprofeno'])
+        self.assertEqual(self._nombres('/api/inventario/catalogo/?q=ANALGESICO'), ['Acetaminofén 500mg'])
+        # prefijos por palabra (búsqueda mientras se escribe)
+        self.assertEqual(self._nombres('/api/inventario/catalogo/?q=acetam 500'), ['Acetaminofén 500mg'])
+
+    def test_index_follows_medicamento_writes(self):
+        self.c.nombre = 'Cetirizina'
+        self.c.save()
+        self.assertEqual(self._nombres('/api/inventario/catalogo/?q=cetiriz'), ['Cetirizina'])
+        self.assertEqual(self._nombres('/api/inventario/catalogo/?q=loratadina'), [])
+        self.b.delete()
+        self.assertEqual(self._nombres('/api/inventario/catalogo/?q=ibuprofeno'), [])
+
+    def test_medicamentos_crud_search_param(self):
+        emp = Usuario.objects.create_user(username='srch', password='x', email='srch@example.com', rol='empleado')
+        self.client.force_authenticate(emp)
+        self.assertEqual(self._nombres('/api/inventario/medicamentos-crud/?search=7701001'), ['Acetaminofén 500mg'])
+        # el orden explícito reemplaza al de relevancia
+        self.assertEqual(self._nombres('/api/inventario/medicamentos-crud/?search=acetaminofen&ordering=nombre'),
+                         ['Acetaminofén 500mg', 'Ibuprofeno'])
+
+
+class OutboxTests(APITestCase):
+    def setUp(self):
+        self.user = Usuario.objects.create_user(username='ob', password='x', email='ob@example.com')
+        self.d1 = Drogueria.objects.create(codigo='O1', nombre='Outbox', propietario=self.user)
+        self.med = Medicamento.objects.create(nombre='OutboxMed', precio_venta=1.0, stock_actual=5, stock_minimo=3, drogueria=self.d1)
+
+    def test_movimiento_only_writes_outbox_event(self):
+        from .models import EventoOutbox
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            MovimientoInventario.objects.create(medicamento=self.med, drogueria=self.d1, tipo_movimiento='salida', cantidad=3)
+        sql = ' '.join(q['sql'] for q in ctx.captured_queries)
+        self.assertNotIn('inventario_alerta', sql)
+        self.assertNotIn('inventario_auditlog', sql)
+        self.assertEqual(EventoOutbox.objects.filter(tipo='movimiento').count(), 1)
+        self.assertFalse(AuditLog.objects.exists())
+
+    def test_drain_batches_audits_and_deduplicates_alerts(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from .models import EventoOutbox
+        for _ in range(3):
+            MovimientoInventario.objects.create(medicamento=self.med, drogueria=self.d1, tipo_movimiento='salida', cantidad=1)
+        call_command('drenar_outbox', stdout=StringIO())
+        self.assertEqual(AuditLog.objects.filter(action='movimiento_creado').count(), 3)
+        self.assertEqual(Alerta.objects.filter(tipo='low_stock', medicamento=self.med).count(), 1)
+        self.assertFalse(EventoOutbox.objects.exists())
+
+        # una alerta no leída existente evita duplicados en drenajes posteriores
+        MovimientoInventario.objects.create(medicamento=self.med, drogueria=self.d1, tipo_movimiento='salida', cantidad=1)
+        self.assertEqual(drenar(), 1)
+        self.assertEqual(Alerta.objects.filter(tipo='low_stock', medicamento=self.med).count(), 1)
+
+    def test_audit_keeps_event_timestamp(self):
+        from .models import EventoOutbox
+        MovimientoInventario.objects.create(medicamento=self.med, drogueria=self.d1, tipo_movimiento='entrada', cantidad=1)
+        creado = EventoOutbox.objects.get().creado_en
+        drenar()
+        self.assertEqual(AuditLog.objects.get().created_at, creado)
+
+
+class StockLedgerTests(APITestCase):
+    def setUp(self):
+        self.user = Usuario.objects.create_user(username='led', password='x', email='led@example.com')
+        self.d1 = Drogueria.objects.create(codigo='L1', nombre='Ledger', propietario=self.user)
+        self.med = Medicamento.objects.create(nombre='LedgerMed', precio_venta=1.0, stock_actual=10, drogueria=self.d1)
+
+    def test_aplicar_movimiento_returns_new_stock(self):
+        self.assertEqual(aplicar_movimiento(self.med.id, 'entrada', 5), 15)
+        self.assertEqual(aplicar_movimiento(self.med.id, 'salida', 15), 0)
+        self.med.refresh_from_db()
+        self.assertEqual(self.med.stock_actual, 0)
+
+    def test_salida_oversell_is_rejected(self):
+        with self.assertRaises(StockInsuficienteError):
+            MovimientoInventario.objects.create(medicamento=self.med, drogueria=self.d1, tipo_movimiento='salida', cantidad=11)
+        self.med.refresh_from_db()
+        self.assertEqual(self.med.stock_actual, 10)
+        self.assertFalse(MovimientoInventario.objects.filter(medicamento=self.med).exists())
+
+    def test_salida_respects_reserved_stock(self):
+        Medicamento.objects.filter(pk=self.med.pk).update(stock_reservado=8)
+        with self.assertRaises(StockInsuficienteError):
+            aplicar_movimiento(self.med.id, 'salida', 3)
+        # el despacho de la reserva sí puede consumirla
+        self.assertEqual(aplicar_movimiento(self.med.id, 'salida', 8, consumir_reserva=True), 2)
+        self.med.refresh_from_db()
+        self.assertEqual(self.med.stock_reservado, 0)
+
+    def test_ajuste_applies_signed_delta(self):
+        MovimientoInventario.objects.create(medicamento=self.med, drogueria=self.d1, tipo_movimiento='ajuste', cantidad=-6)
+        self.assertEqual(aplicar_movimiento(self.med.id, 'ajuste', 2), 6)
+        with self.assertRaises(StockInsuficienteError):
+            aplicar_movimiento(self.med.id, 'ajuste', -7)
+        self.med.refresh_from_db()
+        self.assertEqual(self.med.stock_actual, 6)
+
+    def test_api_rejects_negative_quantity_outside_ajuste(self):
+        emp = Usuario.objects.create_user(username='ledneg', password='x', email='ledneg@example.com', rol='empleado')
+        self.client.force_authenticate(emp)
+        datos = {'medicamento_id': self.med.id, 'drogueria_id': self.d1.id, 'tipo_movimiento': 'entrada', 'cantidad': -3}
+        self.assertEqual(self.client.post('/api/inventario/movimientos/', datos, format='json').status_code, 400)
+        datos['tipo_movimiento'] = 'ajuste'
+        self.assertEqual(self.client.post('/api/inventario/movimientos/', datos, format='json').status_code, 201)
+        self.med.refresh_from_db()
+        self.assertEqual(self.med.stock_actual, 7)
+
+    def test_api_oversell_returns_400(self):
+        emp = Usuario.objects.create_user(username='ledemp', password='x', email='ledemp@example.com', rol='empleado')
+        self.client.force_authenticate(emp)
+        resp = self.client.post('/api/inventario/movimientos/', data={
+            'medicamento_id': self.med.id, 'drogueria_id': self.d1.id, 'tipo_movimiento': 'salida', 'cantidad': 50,
+        }, format='json')
+        self.assertEqual(resp.status_code, 400, resp.content)
+        self.med.refresh_from_db()
+        self.assertEqual(self.med.stock_actual, 10)
+
+
+class MovimientoBulkTests(APITestCase):
+    def setUp(self):
+        self.user = Usuario.objects.create_user(username='bulk', password='x', email='bulk@example.com', rol='empleado')
+        self.d1 = Drogueria.objects.create(codigo='B1', nombre='Bulk', propietario=self.user)
+        self.m1 = Medicamento.objects.create(nombre='BulkA', precio_venta=1.0, stock_actual=5, stock_minimo=2, drogueria=self.d1)
+        self.m2 = Medicamento.objects.create(nombre='BulkB', precio_venta=1.0, stock_actual=0, drogueria=self.d1)
+        self.client.force_authenticate(self.user)
+
+    def test_bulk_reports_status_per_row(self):
+        resp = self.client.post('/api/inventario/movimientos/bulk/', data=[
+            {'medicamento_id': self.m1.id, 'tipo_movimiento': 'salida', 'cantidad': 4},
+            {'medicamento_id': self.m1.id, 'tipo_movimiento': 'salida', 'cantidad': 4},
+            {'medicamento_id': self.m2.id, 'tipo_movimiento': 'entrada', 'cantidad': 7},
+            {'medicamento_id': 999999, 'tipo_movimiento': 'entrada', 'cantidad': 1},
+            {'medicamento_id': self.m2.id, 'tipo_movimiento': 'otro', 'cantidad': 1},
+        ], format='json')
+        self.assertEqual(resp.status_code, 200, resp.content)
+        data = resp.json()
+        self.assertEqual([r['estado'] for r in data['resultados']],
+                         ['creado', 'rechazado', 'creado', 'invalido', 'invalido'])
+        self.assertEqual((data['creados'], data['rechazados'], data['invalidos']), (2, 1, 2))
+        self.m1.refresh_from_db()
+        self.m2.refresh_from_db()
+        self.assertEqual(self.m1.stock_actual, 1)
+        self.assertEqual(self.m2.stock_actual, 7)
+        self.assertEqual(MovimientoInventario.objects.filter(medicamento__in=[self.m1, self.m2]).count(), 2)
+        # la drogueria se toma del medicamento si no viene en la fila
+        self.assertTrue(MovimientoInventario.objects.filter(medicamento=self.m2, drogueria=self.d1).exists())
+
+    def test_bulk_answers_409_when_retries_are_exhausted(self):
+        from . import stock as libro
+        conflicto = StockInsuficienteError('Stock insuficiente para la operación solicitada')
+        # el stock cambia en cada intento entre la lectura y el UPDATE condicional
+        with mock.patch.object(libro, 'aplicar_delta', side_effect=conflicto) as aplicar:
+            resp = self.client.post('/api/inventario/movimientos/bulk/', data=[
+                {'medicamento_id': self.m1.id, 'tipo_movimiento': 'entrada', 'cantidad': 1},
+            ], format='json')
+        self.assertEqual(resp.status_code, 409, resp.content)
+        self.assertEqual(aplicar.call_count, libro.MAX_REINTENTOS_LOTE)
+        self.assertFalse(MovimientoInventario.objects.filter(medicamento=self.m1).exists())
+
+    def test_bulk_query_count_does_not_grow_with_rows(self):
+        from django.test.utils import CaptureQueriesContext
+
+        def post(n):
+            filas = [{'medicamento_id': self.m1.id if i % 2 else self.m2.id, 'tipo_movimiento': 'entrada', 'cantidad': 1}
+                     for i in range(n)]
+            with CaptureQueriesContext(connection) as ctx:
+                resp = self.client.post('/api/inventario/movimientos/bulk/', data={'movimientos': filas}, format='json')
+            self.assertEqual(resp.json()['creados'], n)
+            return len(ctx.captured_queries)
+
+        # solo crecen los lotes de bulk_create (límite de parámetros del motor), no las filas
+        self.assertLessEqual(post(400) - post(10), 4)
+
+
+class LotesFefoTests(APITestCase):
+    URL = '/api/inventario/movimientos/'
+
+    def setUp(self):
+        self.user = Usuario.objects.create_user(username='fefo', password='x', email='fefo@example.com', rol='empleado')
+        self.d1 = Drogueria.objects.create(codigo='FE1', nombre='Fefo', propietario=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.med = Medicamento.objects.create(nombre='Amoxicilina', precio_venta=1, stock_actual=4, lote='L0',
+                                                  fecha_vencimiento='2031-06-30', drogueria=self.d1)
+        self.client.force_authenticate(self.user)
+
+    def _entrada(self, cantidad, lote=None, vence=None):
+        datos = {'medicamento_id': self.med.id, 'tipo_movimiento': 'entrada', 'cantidad': cantidad}
+        if lote:
+            datos.update(lote=lote, fecha_vencimiento=vence)
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.post(self.URL, datos, format='json')
+        self.assertEqual(resp.status_code, 201, resp.content)
+
+    def _lotes(self):
+        return [(l['codigo'], l['cantidad']) for l in self.client.get(f'/api/inventario/medicamentos-crud/{self.med.id}/lotes/').json()]
+
+    def test_entries_keep_separate_lots_and_exits_consume_first_expiry(self):
+        from django.test.utils import CaptureQueriesContext
+        self._entrada(5, 'L1', '2030-01-31')
+        self._entrada(6, 'L2', '2032-01-31')
+        self._entrada(2, 'L1', '2030-01-31')
+        self._entrada(3)  # sin lote
+        self.med.refresh_from_db()
+        self.assertEqual((self.med.stock_actual, self.med.lote, str(self.med.fecha_vencimiento)), (20, 'L1', '2030-01-31'))
+        self.assertEqual(self._lotes(), [('L1', 7), ('L0', 4), ('L2', 6)])
+
+        with CaptureQueriesContext(connection) as ctx, self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.URL, {'medicamento_id': self.med.id, 'tipo_movimiento': 'salida', 'cantidad': 9},
+                             format='json')
+        tabla = LoteMedicamento._meta.db_table
+        self.assertEqual(sum(1 for q in ctx.captured_queries if q['sql'].startswith('WITH') and tabla in q['sql']), 1)
+        self.assertEqual(self._lotes(), [('L0', 2), ('L2', 6)])
+        self.med.refresh_from_db()
+        self.assertEqual((self.med.stock_actual, self.med.lote, str(self.med.fecha_vencimiento)), (11, 'L0', '2031-06-30'))
+
+        # el stock sin lote (3) se consume después de todos los lotes
+        with self.captureOnCommitCallbacks(execute=True):
+            aplicar_movimiento(self.med.id, 'salida', 10)
+        self.assertEqual(self._lotes(), [])
+        self.assertEqual(Medicamento.objects.get(pk=self.med.pk).stock_actual, 1)
+
+    def test_lots_never_exceed_total_when_stock_changes_outside_ledger(self):
+        self._entrada(5, 'L1', '2029-05-31')
+        self.med.stock_actual = 6
+        with self.captureOnCommitCallbacks(execute=True):
+            self.med.save()
+        # 9 unidades en lotes y el total baja a 6: se recortan 3 del lote que vence antes
+        self.assertEqual(self._lotes(), [('L1', 2), ('L0', 4)])
+
+    def test_exits_allocate_lots_in_the_writing_transaction(self):
+        self._entrada(5, 'L1', '2030-01-31')
+        with transaction.atomic():
+            aplicar_movimiento(self.med.id, 'salida', 7)
+            # antes de confirmar, los lotes ya cuadran con el stock
+            self.assertEqual(list(LoteMedicamento.objects.filter(medicamento=self.med, cantidad__gt=0)
+                                  .values_list('codigo', 'cantidad')), [('L0', 2)])
+        with mock.patch.object(lotes, 'consumir', side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                aplicar_movimiento(self.med.id, 'salida', 1)
+        # el fallo al asignar los lotes revierte la salida
+        self.assertEqual(Medicamento.objects.get(pk=self.med.pk).stock_actual, 2)
+        self.assertEqual(self._lotes(), [('L0', 2)])
+
+    def test_only_entries_name_a_lot(self):
+        resp = self.client.post(self.URL, {'medicamento_id': self.med.id, 'tipo_movimiento': 'salida',
+                                           'cantidad': 1, 'lote': 'L0'}, format='json')
+        self.assertEqual(resp.status_code, 400)
+
+
+class MedicamentoListQueryTests(APITestCase):
+    ENDPOINTS = {
+        '/api/inventario/medicamentos-crud/': 2,  # COUNT + página
+        '/api/inventario/catalogo/': 2,
+        '/api/inventario/medicamentos/': 1,
+        '/api/inventario/by-drogueria/': 1,
+    }
+
+    def setUp(self):
+        self.emp = Usuario.objects.create_user(username='lq', password='x', email='lq@example.com', rol='empleado')
+        self.drog = Drogueria.objects.create(codigo='LQ', nombre='Listado', propietario=self.emp)
+        self.client.force_authenticate(self.emp)
+
+    def _crear(self, n, desde=0):
+        for i in range(desde, desde + n):
+            cat = Categoria.objects.create(nombre=f'Cat LQ {i}')
+            Medicamento.objects.create(nombre=f'LQ {i}', precio_venta='2.50', costo_compra='1.10',
+                                       stock_actual=i, stock_reservado=1 if i else 0, stock_minimo=3,
+                                       categoria=cat, drogueria=self.drog,
+                                       fecha_vencimiento=timezone.now().date() - timedelta(days=1 - i % 2))
+
+    def test_list_endpoints_run_constant_queries(self):
+        for filas in (3, 40):
+            with self.captureOnCommitCallbacks(execute=True):
+                self._crear(filas - Medicamento.objects.count(), Medicamento.objects.count())
+            for url, consultas in self.ENDPOINTS.items():
+                with self.subTest(url=url, filas=filas), self.assertNumQueries(consultas):
+                    self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_expiry_flag_uses_request_date(self):
+        self._crear(2)  # uno vencido ayer y otro que vence hoy
+        with mock.patch('inventario.models.timezone.now', return_value=timezone.now() + timedelta(days=1)):
+            data = self.client.get('/api/inventario/medicamentos/').json()
+        self.assertEqual([m['esta_vencido'] for m in data], [True, True])
+
+    def test_list_payload_matches_detail_serializer(self):
+        self._crear(4)
+        resp = self.client.get('/api/inventario/medicamentos/')
+        for item in resp.json():
+            self.assertEqual(item, MedicamentoSerializer(Medicamento.objects.get(pk=item['id'])).data)
+
+
+class CategoriaArbolTests(APITestCase):
+    URL = '/api/inventario/catalogo/categorias-con-medicamentos/'
+
+    def setUp(self):
+        django_cache.clear()
+        self.cat = Categoria.objects.create(nombre='Arbol A')
+        self.vacia = Categoria.objects.create(nombre='Arbol B')
+        Categoria.objects.create(nombre='Arbol inactiva', activo=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(5):
+                Medicamento.objects.create(nombre=f'Arbol {i}', precio_venta=1.0, categoria=self.cat)
+            Medicamento.objects.create(nombre='Arbol oculto', precio_venta=1.0, categoria=self.cat, estado=False)
+
+    def test_caps_per_category_and_continues_with_cursor(self):
+        data = self.client.get(self.URL, {'por_categoria': 2}).json()
+        self.assertEqual([c['nombre'] for c in data], ['Arbol A', 'Arbol B'])
+        cat = data[0]
+        nombres = [m['nombre'] for m in cat['medicamentos']]
+        cursor = cat['medicamentos_siguiente']
+        while cursor:
+            pagina = self.client.get(self.URL, {'categoria': self.cat.id, 'cursor': cursor, 'por_categoria': 2}).json()
+            nombres += [m['nombre'] for m in pagina['medicamentos']]
+            cursor = pagina['medicamentos_siguiente']
+        self.assertEqual(nombres, [f'Arbol {i}' for i in range(5)])
+        self.assertEqual((data[1]['medicamentos'], data[1]['medicamentos_siguiente']), ([], None))
+        self.assertEqual(self.client.get(self.URL, {'categoria': self.cat.id, 'cursor': '!!'}).status_code, 400)
+
+    def test_snapshot_cached_and_invalidated_on_writes(self):
+        self.client.get(self.URL)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.URL).status_code, 200)
+        Medicamento.objects.filter(nombre='Arbol 0').update(precio_venta=9)  # sin señal: sigue cacheado
+        m = Medicamento.objects.get(nombre='Arbol 1')
+        m.nombre = 'Arbol 1b'
+        with self.captureOnCommitCallbacks(execute=True):
+            m.save()
+        nombres = [x['nombre'] for x in self.client.get(self.URL).json()[0]['medicamentos']]
+        self.assertIn('Arbol 1b', nombres)
+        self.cat.nombre = 'Arbol A2'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cat.save()
+        self.assertEqual(self.client.get(self.URL).json()[0]['nombre'], 'Arbol A2')
+        with self.captureOnCommitCallbacks(execute=True):
+            aplicar_movimiento(m.id, 'entrada', 4)
+        fila = next(x for x in self.client.get(self.URL).json()[0]['medicamentos'] if x['id'] == m.id)
+        self.assertEqual(fila['stock_actual'], 4)
+
+
+class CatalogoCondicionalTests(APITestCase):
+    URLS = ('/api/inventario/catalogo/', '/api/inventario/catalogo/categorias/', '/api/inventario/catalogo/droguerias/')
+
+    def setUp(self):
+        django_cache.clear()
+        self.owner = Usuario.objects.create_user(username='etag', password='x', email='etag@example.com')
+        self.drog = Drogueria.objects.create(codigo='ET', nombre='Etag', propietario=self.owner)
+        self.cat = Categoria.objects.create(nombre='Etag cat')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.med = Medicamento.objects.create(nombre='Etag med', precio_venta=1.0, categoria=self.cat, drogueria=self.drog)
+
+    def test_revalidation_returns_304_without_queries(self):
+        ahora = cache_inventario.time.time() + 2  # el segundo de la última invalidación ya terminó
+        for url in self.URLS:
+            with mock.patch.object(cache_inventario, 'time') as reloj:
+                reloj.time.return_value = ahora
+                resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 200)
+            etag = resp['ETag']
+            with self.subTest(url=url), self.assertNumQueries(0):
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+                self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=resp['Last-Modified']).status_code, 304)
+
+    def test_cached_body_keyed_by_normalized_params(self):
+        primera = self.client.get(f'/api/inventario/catalogo/?page_size=5&categoria={self.cat.id}')
+        with self.assertNumQueries(0):
+            segunda = self.client.get(f'/api/inventario/catalogo/?categoria={self.cat.id}&page_size=5')
+        self.assertEqual(primera.json(), segunda.json())
+        self.assertEqual(segunda.json()['results'][0]['nombre'], 'Etag med')
+        # texto libre: sin caché, pero la revalidación por ETag sigue sin consultas
+        resp = self.client.get('/api/inventario/catalogo/?q=etag')
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get('/api/inventario/catalogo/?q=etag').json(), resp.json())
+        self.assertTrue(ctx.captured_queries)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/inventario/catalogo/?q=etag',
+                                             HTTP_IF_NONE_MATCH=resp['ETag']).status_code, 304)
+
+    def test_writes_bump_version(self):
+        for escribir in (lambda: self.drog.save(), lambda: self.cat.save(), lambda: self.med.save(),
+                         lambda: aplicar_movimiento(self.med.id, 'entrada', 1)):
+            etag = self.client.get(self.URLS[0])['ETag']
+            with self.captureOnCommitCallbacks(execute=True):
+                escribir()
+            resp = self.client.get(self.URLS[0], HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(resp.status_code, 200)
+            self.assertNotEqual(resp['ETag'], etag)
+
+    def test_if_modified_since_sees_writes_within_the_same_second(self):
+        with mock.patch.object(cache_inventario, 'time') as reloj:
+            ahora = reloj.time
+            ahora.return_value = 1_700_000_000.2
+            cache_inventario.invalidar('catalogo')
+            self.assertNotIn('Last-Modified', self.client.get(self.URLS[0]))  # segundo en curso
+            ahora.return_value = 1_700_000_001.0
+            ultima = self.client.get(self.URLS[0])['Last-Modified']
+            self.assertEqual(self.client.get(self.URLS[0], HTTP_IF_MODIFIED_SINCE=ultima).status_code, 304)
+            cache_inventario.invalidar('catalogo')  # en el segundo que anunció Last-Modified
+            self.assertEqual(self.client.get(self.URLS[0], HTTP_IF_MODIFIED_SINCE=ultima).status_code, 200)
+
+    def test_versions_survive_culling_of_cached_responses(self):
+        pequena = {**settings.CACHES['default'], 'OPTIONS': {'MAX_ENTRIES': 10}}
+        with override_settings(CACHES={**settings.CACHES, 'default': pequena}):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.med.save()
+            etag = self.client.get(self.URLS[0])['ETag']
+            for i in range(50):
+                django_cache.set(f'relleno:{i}', i)
+            self.assertEqual(self.client.get(self.URLS[0], HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+class FacetasCatalogoTests(APITestCase):
+    URL = '/api/inventario/catalogo/facetas/'
+
+    def setUp(self):
+        django_cache.clear()
+        self.owner = Usuario.objects.create_user(username='fac', password='x', email='fac@example.com')
+        self.drog = Drogueria.objects.create(codigo='FC', nombre='Facetas', propietario=self.owner)
+        self.analg = Categoria.objects.create(nombre='Analgésicos')
+        self.antib = Categoria.objects.create(nombre='Antibióticos')
+        with self.captureOnCommitCallbacks(execute=True):
+            for nombre, precio, stock, cat in (('Dolex', 3000, 10, self.analg), ('Advil', 12000, 0, self.analg),
+                                               ('Naproxeno', 60000, 4, self.analg), ('Amoxicilina', 8500, 5, self.antib),
+                                               ('Suero', 5000, 1, None)):
+                Medicamento.objects.create(nombre=nombre, precio_venta=precio, stock_actual=stock, categoria=cat,
+                                           drogueria=self.drog)
+            Medicamento.objects.create(nombre='Inactivo', precio_venta=1, stock_actual=9, categoria=self.antib,
+                                       drogueria=self.drog, estado=False)
+
+    def test_counts_all_facets_in_one_query(self):
+        with self.assertNumQueries(1):
+            data = self.client.get(self.URL).json()
+        self.assertEqual(data['total'], 5)
+        self.assertEqual([(c['nombre'], c['total']) for c in data['categorias']],
+                         [('Analgésicos', 3), ('Antibióticos', 1), (None, 1)])
+        self.assertEqual([(p['desde'], p['hasta'], p['total']) for p in data['precios']],
+                         [(None, '5000', 1), ('5000', '20000', 3), ('20000', '50000', 0), ('50000', None, 1)])
+        self.assertEqual(data['disponibilidad'], {'disponible': 4, 'agotado': 1})
+
+    def test_applies_catalog_filters_and_custom_ranges(self):
+        data = self.client.get(self.URL, {'categoria': self.analg.id, 'disponible': 'true', 'rangos': '10000'}).json()
+        self.assertEqual(data['total'], 2)
+        self.assertEqual([p['total'] for p in data['precios']], [1, 1])
+        for rangos in ('abc', 'nan', 'Infinity', '5000,-inf'):
+            self.assertEqual(self.client.get(self.URL, {'rangos': rangos}).status_code, 400)
+
+    def test_cached_by_normalized_filters_and_invalidated_on_writes(self):
+        primera = self.client.get(self.URL, {'disponible': 'true', 'precio_min': '4000', 'page': 2}).json()
+        with self.assertNumQueries(0):
+            segunda = self.client.get(self.URL, {'precio_min': '4000', 'disponible': '1'}).json()
+        self.assertEqual(primera, segunda)
+        with self.captureOnCommitCallbacks(execute=True):
+            aplicar_movimiento(Medicamento.objects.get(nombre='Advil').id, 'entrada', 3)
+        self.assertEqual(self.client.get(self.URL, {'disponible': '1', 'precio_min': '4000'}).json()['total'], 4)
+
+    def test_free_text_searches_are_not_cached(self):
+        for params in ({'q': 'dol'}, {'search': 'dol'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.URL, params).json()['total'], 1)
+                with self.assertNumQueries(1):
+                    self.client.get(self.URL, params)
+
+
+class AlertasSnapshotTests(APITestCase):
+    URL = '/api/inventario/alertas/'
+
+    def setUp(self):
+        self.emp = Usuario.objects.create_user(username='alr', password='x', email='alr@example.com', rol='empleado')
+        self.d1 = Drogueria.objects.create(codigo='AL1', nombre='Alertas 1', propietario=self.emp)
+        self.d2 = Drogueria.objects.create(codigo='AL2', nombre='Alertas 2', propietario=self.emp)
+        hoy = timezone.now().date()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bajo = Medicamento.objects.create(nombre='AL bajo', precio_venta=1, stock_actual=2, stock_minimo=5, drogueria=self.d1)
+            self.pronto = Medicamento.objects.create(nombre='AL pronto', precio_venta=1, stock_actual=50, drogueria=self.d1,
+                                                     fecha_vencimiento=hoy + timedelta(days=3), lote='L1')
+            self.vencido = Medicamento.objects.create(nombre='AL vencido', precio_venta=1, stock_actual=50, drogueria=self.d1,
+                                                      fecha_vencimiento=hoy - timedelta(days=1))
+            self.ok = Medicamento.objects.create(nombre='AL ok', precio_venta=1, stock_actual=50, drogueria=self.d1,
+                                                 fecha_vencimiento=hoy + timedelta(days=20))
+            Medicamento.objects.create(nombre='AL otra', precio_venta=1, stock_actual=0, drogueria=self.d2)
+        self.emp.active_drogueria = self.d1
+        self.emp.save()
+        self.client.force_authenticate(self.emp)
+
+    def _ids(self, data, seccion):
+        return [m['id'] for m in data[seccion]['medicamentos']]
+
+    def test_snapshot_matches_sets_and_reads_in_one_query(self):
+        data = self.client.get(self.URL).json()
+        self.assertEqual(self._ids(data, 'stock_bajo'), [self.bajo.id])
+        self.assertEqual(self._ids(data, 'proximo_vencimiento'), [self.pronto.id])
+        self.assertEqual(data['vencidos']['cantidad'], 1)
+        self.assertTrue(data['critico'])
+        with self.assertNumQueries(1):
+            data = self.client.get(self.URL, {'dias': 30}).json()
+        self.assertEqual(self._ids(data, 'proximo_vencimiento'), [self.pronto.id, self.ok.id])
+        # sin droguería activa: todo el inventario
+        self.emp.active_drogueria = None
+        self.emp.save()
+        self.assertEqual(self.client.get(self.URL).json()['stock_bajo']['cantidad'], 2)
+
+    def test_stock_and_date_changes_patch_snapshot(self):
+        self.client.get(self.URL)
+        with self.captureOnCommitCallbacks(execute=True):
+            MovimientoInventario.objects.create(medicamento=self.bajo, tipo_movimiento='entrada', cantidad=10)
+            aplicar_movimiento(self.ok.id, 'ajuste', -49)
+        data = self.client.get(self.URL).json()
+        self.assertEqual(self._ids(data, 'stock_bajo'), [self.ok.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pronto.fecha_vencimiento = timezone.now().date() + timedelta(days=60)
+            self.pronto.save()
+            self.vencido.drogueria = self.d2
+            self.vencido.save()
+        data = self.client.get(self.URL).json()
+        self.assertEqual(self._ids(data, 'proximo_vencimiento'), [])
+        self.assertEqual(data['vencidos']['cantidad'], 0)
+        self.assertEqual(self.client.get(self.URL, {'drogueria': self.d2.id}).json()['vencidos']['cantidad'], 1)
+
+    def test_malformed_params_return_400(self):
+        for params in ({'drogueria': 'abc'}, {'drogueria': '-1'}, {'dias': 'x'}):
+            self.assertEqual(self.client.get(self.URL, params).status_code, 400, params)
+
+
+class BarridoVencimientosTests(APITestCase):
+    def setUp(self):
+        self.owner = Usuario.objects.create_user(username='venc', password='x', email='venc@example.com')
+        self.d1 = Drogueria.objects.create(codigo='V1', nombre='Venc 1', propietario=self.owner)
+        self.d2 = Drogueria.objects.create(codigo='V2', nombre='Venc 2', propietario=self.owner)
+        self.hoy = timezone.now().date()
+
+    def _med(self, nombre, dias, drogueria):
+        return Medicamento.objects.create(nombre=nombre, precio_venta=1, drogueria=drogueria,
+                                          fecha_vencimiento=self.hoy + timedelta(days=dias))
+
+    def _alertas(self, tipo):
+        return set(Alerta.objects.filter(tipo=tipo).values_list('medicamento__nombre', flat=True))
+
+    def test_save_no_longer_creates_expiry_alerts(self):
+        self._med('V pasado', -3, self.d1)
+        drenar()
+        self.assertFalse(Alerta.objects.filter(tipo='vencido').exists())
+
+    def test_sweep_only_picks_threshold_crossings_since_last_run(self):
+        self._med('V pasado', -3, self.d1)
+        self._med('V pronto', 2, self.d2)
+        manana = self._med('V manana', 1, self.d1)
+        self._med('V lejos', 8, self.d1)
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(vencimientos.barrer(hoy=self.hoy), {'vencido': 1, 'por_vencer': 2})
+        # un INSERT por droguería
+        self.assertEqual(sum(q['sql'].startswith('INSERT INTO "inventario_alerta"') for q in ctx.captured_queries), 2)
+        self.assertEqual(self._alertas('vencido'), {'V pasado'})
+        self.assertEqual(self._alertas('por_vencer'), {'V pronto', 'V manana'})
+        # mismo día: nada nuevo
+        self.assertEqual(vencimientos.barrer(hoy=self.hoy), {'vencido': 0, 'por_vencer': 0})
+        # dos días después: "manana" venció y "lejos" entra en la ventana de aviso
+        self.assertEqual(vencimientos.barrer(hoy=self.hoy + timedelta(days=2)), {'vencido': 1, 'por_vencer': 1})
+        self.assertIn('V lejos', self._alertas('por_vencer'))
+        self.assertTrue(Alerta.objects.filter(tipo='vencido', medicamento=manana).exists())
+        # alertas no leídas del mismo tipo no se duplican en un barrido completo
+        self.assertEqual(vencimientos.barrer(hoy=self.hoy + timedelta(days=2), completo=True),
+                         {'vencido': 0, 'por_vencer': 0})
+
+    def test_sweep_picks_dates_changed_since_last_run(self):
+        editado = self._med('V editado', 30, self.d1)
+        con_lote = self._med('V lote', 40, self.d2)
+        vencimientos.barrer(hoy=self.hoy)
+        # fechas que ya caen dentro de la ventana sin cruzar un umbral desde el barrido anterior
+        self._med('V nuevo', 3, self.d1)
+        editado.fecha_vencimiento = self.hoy - timedelta(days=1)
+        editado.save(update_fields=['fecha_vencimiento'])
+        lotes.ingresar(con_lote.id, 5, 'L-pronto', self.hoy + timedelta(days=2))
+        registro = ImportacionMedicamentos.objects.create(drogueria=self.d2, archivo='x.csv')
+        import io
+        csv = f'nombre,precio,vencimiento\nV importado,1,{(self.hoy + timedelta(days=4)).isoformat()}\n'
+        importacion.importar(registro, io.BytesIO(csv.encode()))
+        self.assertEqual(vencimientos.barrer(hoy=self.hoy), {'vencido': 1, 'por_vencer': 3})
+        self.assertEqual(self._alertas('vencido'), {'V editado'})
+        self.assertEqual(self._alertas('por_vencer'), {'V nuevo', 'V lote', 'V importado'})
+        self.assertFalse(Medicamento.objects.filter(revisar_vencimiento=True).exists())
+
+
+class ProveedoresIndexTests(APITestCase):
+    URL = '/api/inventario/catalogo/proveedores/'
+
+    def setUp(self):
+        self.emp = Usuario.objects.create_user(username='prov', password='x', email='prov@example.com', rol='empleado')
+        self.client.force_authenticate(self.emp)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.a = Medicamento.objects.create(nombre='P1', precio_venta=1, proveedor='Genfar  S.A.')
+            Medicamento.objects.create(nombre='P2', precio_venta=1, proveedor=' genfar s.a. ')
+            Medicamento.objects.create(nombre='P3', precio_venta=1, proveedor='Tecnoquímicas')
+            Medicamento.objects.create(nombre='P4', precio_venta=1, proveedor='')
+
+    def _listar(self, **params):
+        data = self.client.get(self.URL, params).json()
+        return [(p['nombre'], p['medicamentos']) for p in data['results']]
+
+    def test_normalized_counts_and_prefix_search(self):
+        self.assertEqual(self._listar(), [('Genfar S.A.', 2), ('Tecnoquímicas', 1)])
+        self.assertEqual(self._listar(q='  GEN'), [('Genfar S.A.', 2)])
+        self.assertEqual(self._listar(q='far'), [])
+        with self.assertNumQueries(2):  # COUNT + página, ambas sobre la tabla de proveedores
+            self.client.get(self.URL, {'q': 'tec'})
+
+    def test_counters_follow_medicamento_writes(self):
+        self.a.proveedor = 'Tecnoquimicas'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.a.save()
+        self.assertEqual(self._listar(), [('Genfar S.A.', 1), ('Tecnoquimicas', 1), ('Tecnoquímicas', 1)])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.a.delete()
+        Medicamento.objects.filter(nombre='P3').update(proveedor='Genfar S.A.')  # sin señales
+        proveedores.recalcular()
+        self.assertEqual(self._listar(), [('Genfar S.A.', 2)])
+
+    def test_counters_apply_the_net_of_the_transaction_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                for nombre in ('Tecnoquímicas', 'MK', 'Genfar S.A.'):
+                    self.a.proveedor = nombre
+                    self.a.save()
+                self.assertFalse(Proveedor.objects.filter(nombre_normalizado='mk').exists())
+        # neto cero: ni un UPDATE ni un proveedor nuevo
+        self.assertEqual(self._listar(), [('Genfar S.A.', 2), ('Tecnoquímicas', 1)])
+        self.assertFalse(Proveedor.objects.filter(nombre_normalizado='mk').exists())
+
+        self.a.proveedor = 'MK'
+        with mock.patch.object(proveedores, 'ajustar', side_effect=RuntimeError), self.assertLogs('django', 'ERROR'):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.a.save()
+        # el fallo del contador no revierte la edición; recalcular lo repara
+        self.assertEqual(Medicamento.objects.get(pk=self.a.pk).proveedor, 'MK')
+        proveedores.recalcular()
+        self.assertEqual(self._listar(), [('Genfar S.A.', 1), ('MK', 1), ('Tecnoquímicas', 1)])
+
+    def test_counter_decrement_is_clamped_at_zero(self):
+        Proveedor.objects.filter(nombre_normalizado='tecnoquímicas').update(medicamentos=0)  # desfasado
+        with self.captureOnCommitCallbacks(execute=True):
+            Medicamento.objects.get(nombre='P3').delete()
+        self.assertEqual(Proveedor.objects.get(nombre_normalizado='tecnoquímicas').medicamentos, 0)
+
+
+class StockHistoricoTests(APITestCase):
+    URL = '/api/inventario/stock-historico/'
+
+    def setUp(self):
+        self.emp = Usuario.objects.create_user(username='histo', password='x', email='histo@example.com', rol='empleado')
+        self.drog = Drogueria.objects.create(codigo='HS', nombre='Historico', propietario=self.emp)
+        self.client.force_authenticate(self.emp)
+        self.ahora = timezone.now()
+        self.med = Medicamento.objects.create(nombre='HS med', precio_venta=1, stock_actual=15, drogueria=self.drog)
+        self.otro = Medicamento.objects.create(nombre='HS otro', precio_venta=1, stock_actual=7, drogueria=self.drog)
+        self.sin_base = Medicamento.objects.create(nombre='HS ajustado', precio_venta=1, stock_actual=4, drogueria=self.drog)
+        StockCheckpoint.objects.create(medicamento=self.med, drogueria=self.drog, fecha=self._dias(-10), stock_actual=10)
+        MovimientoInventario.objects.bulk_create([
+            self._mov(self.med, 'entrada', 5, -8),
+            self._mov(self.med, 'salida', 3, -6),
+            self._mov(self.med, 'ajuste', 8, -4),
+            self._mov(self.med, 'salida', 5, -2),
+            self._mov(self.otro, 'entrada', 2, -1),
+            self._mov(self.sin_base, 'ajuste', -1, -1),
+        ])
+
+    def _dias(self, n):
+        return self.ahora + timedelta(days=n)
+
+    def _mov(self, med, tipo, cantidad, dias):
+        return MovimientoInventario(medicamento=med, drogueria=self.drog, tipo_movimiento=tipo,
+                                    cantidad=cantidad, fecha_movimiento=self._dias(dias))
+
+    def _stock(self, dias, med=None):
+        resp = self.client.get(self.URL, {'fecha': self._dias(dias).isoformat(), 'drogueria': self.drog.id})
+        self.assertEqual(resp.status_code, 200, resp.content)
+        filas = {f['medicamento']: (f['stock'], f['base']) for f in resp.json()['results']}
+        return filas[(med or self.med).id]
+
+    def test_forward_from_checkpoint_and_adjustments(self):
+        self.assertEqual(self._stock(-9), (10, 'checkpoint'))
+        self.assertEqual(self._stock(-5), (12, 'checkpoint'))
+        self.assertEqual(self._stock(-3), (20, 'checkpoint'))
+        self.assertEqual(self._stock(0), (15, 'checkpoint'))
+
+    def test_backward_when_no_earlier_anchor(self):
+        self.assertEqual(self._stock(-11), (10, 'posterior'))
+        self.assertEqual(self._stock(-3, self.otro), (5, 'actual'))
+        # los ajustes son deltas: también se deshacen hacia atrás
+        self.assertEqual(self._stock(-3, self.sin_base), (5, 'actual'))
+
+    def test_generar_checkpoints_and_bounded_queries(self):
+        self.assertEqual(historico.generar_checkpoints(), 3)
+        self.assertEqual(StockCheckpoint.objects.filter(medicamento=self.otro).get().stock_actual, 7)
+        self.assertEqual(self._stock(1, self.otro), (7, 'checkpoint'))
+        with self.assertNumQueries(2):  # COUNT + página, sin importar el largo del historial
+            self.client.get(self.URL, {'fecha': self.ahora.date().isoformat(), 'drogueria': self.drog.id})
+        self.assertEqual(self.client.get(self.URL, {'fecha': 'ayer'}).status_code, 400)
+        self.assertEqual(self.client.get(self.URL, {'fecha': '2025-02-30'}).status_code, 400)
+        for params in ({'medicamento': 'x'}, {'drogueria': '1.5'}):
+            resp = self.client.get(self.URL, {'fecha': self.ahora.date().isoformat(), **params})
+            self.assertEqual(resp.status_code, 400)
+
+    def test_stock_written_outside_the_ledger_leaves_an_adjustment(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.patch(f'/api/inventario/medicamentos-crud/{self.otro.id}/', {'stock_actual': 12},
+                                     format='json')
+        self.assertEqual(resp.status_code, 200, resp.content)
+        ajuste = MovimientoInventario.objects.get(medicamento=self.otro, observacion='Edición del medicamento')
+        self.assertEqual((ajuste.tipo_movimiento, ajuste.cantidad, ajuste.usuario_id), ('ajuste', 5, self.emp.id))
+        import io
+        registro = ImportacionMedicamentos.objects.create(usuario=self.emp, drogueria=self.drog, archivo='x.csv')
+        importacion.importar(registro, io.BytesIO('nombre,precio,stock\nHS otro,1,3\n'.encode()))
+        self.assertEqual(MovimientoInventario.objects.get(medicamento=self.otro, observacion='Importación masiva')
+                         .cantidad, -9)
+        # antes de la edición y de la importación el stock reconstruido es el de entonces
+        self.assertEqual(self._stock(-0.5, self.otro), (7, 'actual'))
+        self.assertEqual(self._stock(0.5, self.otro), (3, 'actual'))
+
+    def test_detail_view_edit_also_leaves_an_adjustment(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.patch(f'/api/inventario/medicamentos/{self.otro.id}/', {'stock_actual': 4},
+                                     format='json')
+        self.assertEqual(resp.status_code, 200, resp.content)
+        ajuste = MovimientoInventario.objects.get(medicamento=self.otro, observacion='Edición del medicamento')
+        self.assertEqual((ajuste.tipo_movimiento, ajuste.cantidad, ajuste.usuario_id), ('ajuste', -3, self.emp.id))
+        self.assertEqual(self._stock(-0.5, self.otro), (7, 'actual'))
+
+
+class ValoracionInventarioTests(APITestCase):
+    URL = '/api/inventario/valoracion/'
+
+    def setUp(self):
+        self.emp = Usuario.objects.create_user(username='valor', password='x', email='valor@example.com', rol='empleado')
+        self.d1 = Drogueria.objects.create(codigo='VA1', nombre='Valor 1', propietario=self.emp)
+        self.d2 = Drogueria.objects.create(codigo='VA2', nombre='Valor 2', propietario=self.emp)
+        self.cat = Categoria.objects.create(nombre='Valor cat')
+        hoy = timezone.now().date()
+        # precios que en coma flotante no suman exacto (0.1 + 0.2 ...)
+        Medicamento.objects.create(nombre='VA a', precio_venta='0.10', costo_compra='0.07', stock_actual=3,
+                                   drogueria=self.d1, categoria=self.cat, proveedor='Genfar', fecha_ingreso=hoy)
+        Medicamento.objects.create(nombre='VA b', precio_venta='0.20', costo_compra='0.15', stock_actual=1,
+                                   drogueria=self.d1, proveedor='Genfar', fecha_ingreso=hoy - timedelta(days=40))
+        Medicamento.objects.create(nombre='VA c', precio_venta='12345678.99', costo_compra='1.01', stock_actual=7,
+                                   drogueria=self.d2, categoria=self.cat)
+        Medicamento.objects.create(nombre='VA inactivo', precio_venta='5', stock_actual=5, drogueria=self.d2, estado=False)
+        self.client.force_authenticate(self.emp)
+
+    def test_totals_are_decimal_exact_in_one_query(self):
+        with self.assertNumQueries(1):
+            data = self.client.get(self.URL).json()
+        self.assertEqual(data['total'], {'medicamentos': 3, 'unidades': 11, 'valor_total': '86419753.43',
+                                         'costo_total': '7.43', 'margen': '86419746.00'})
+
+    def test_grouping_and_filters(self):
+        data = self.client.get(self.URL, {'agrupar': 'drogueria,proveedor'}).json()
+        self.assertEqual(
+            [(g['drogueria_id'], g['proveedor'], g['valor_total'], g['costo_total']) for g in data['grupos']],
+            [(self.d1.id, 'Genfar', '0.50', '0.36'), (self.d2.id, None, '86419752.93', '7.07')],
+        )
+        data = self.client.get(self.URL, {'agrupar': 'categoria', 'ingreso_desde': timezone.now().date().isoformat()}).json()
+        self.assertEqual([(g['categoria_nombre'], g['valor_total']) for g in data['grupos']], [('Valor cat', '0.30')])
+        self.assertEqual(self.client.get(self.URL, {'agrupar': 'color'}).status_code, 400)
+
+    def test_malformed_params_return_400(self):
+        for params in ({'drogueria': 'x'}, {'categoria': '2,3'}, {'vence_hasta': '2025-02-30'},
+                       {'ingreso_desde': 'ayer'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.URL, params).status_code, 400)
+
+
+class InventarioDrogueriaAgregadosTests(APITestCase):
+    def setUp(self):
+        self.emp = Usuario.objects.create_user(username='agreg', password='x', email='agreg@example.com', rol='empleado')
+        self.d1 = Drogueria.objects.create(codigo='AG1', nombre='Agreg 1', propietario=self.emp)
+        self.d2 = Drogueria.objects.create(codigo='AG2', nombre='Agreg 2', propietario=self.emp)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.med = Medicamento.objects.create(nombre='AG a', precio_venta='2.50', costo_compra='1.10',
+                                                  stock_actual=4, drogueria=self.d1)
+
+    def _inv(self, drogueria):
+        inv = InventarioDrogueria.objects.get(drogueria=drogueria)
+        return (str(inv.valor_total_inventario), str(inv.valor_venta_total),
+                inv.cantidad_medicamentos, inv.cantidad_stock_total)
+
+    def test_deltas_follow_stock_price_and_moves(self):
+        self.assertEqual(self._inv(self.d1), ('4.40', '10.00', 1, 4))
+        with self.captureOnCommitCallbacks(execute=True):
+            MovimientoInventario.objects.create(medicamento=self.med, drogueria=self.d1, tipo_movimiento='salida', cantidad=3)
+        self.assertEqual(self._inv(self.d1), ('1.10', '2.50', 1, 1))
+
+        self.med.refresh_from_db()
+        self.med.precio_venta = '3.00'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.med.save(update_fields=['precio_venta'])
+        self.assertEqual(self._inv(self.d1), ('1.10', '3.00', 1, 1))
+
+        self.med.drogueria = self.d2
+        with self.captureOnCommitCallbacks(execute=True):
+            self.med.save()
+        self.assertEqual(self._inv(self.d1), ('0.00', '0.00', 0, 0))
+        self.assertEqual(self._inv(self.d2), ('1.10', '3.00', 1, 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.med.delete()
+        self.assertEqual(self._inv(self.d2), ('0.00', '0.00', 0, 0))
+
+    def test_aggregates_are_written_in_the_writing_transaction(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with transaction.atomic():
+                self.med.precio_venta = '3.00'
+                # sin SELECT previo: el UPDATE de la fila, el recorte de lotes y el del agregado
+                with self.assertNumQueries(3):
+                    self.med.save()
+                for _ in range(3):
+                    with self.assertNumQueries(2):  # el UPDATE del libro y el del agregado
+                        aplicar_movimiento(self.med.id, 'entrada', 1)
+                # antes de confirmar, el agregado ya cuadra con el stock
+                self.assertEqual(self._inv(self.d1), ('7.70', '21.00', 1, 7))
+                with self.assertRaises(StockInsuficienteError), transaction.atomic():
+                    aplicar_movimiento(self.med.id, 'entrada', 100)
+                    aplicar_movimiento(self.med.id, 'salida', 500)
+                # el savepoint revertido se lleva el UPDATE del agregado y su lote diferido
+                self.assertEqual(self._inv(self.d1), ('7.70', '21.00', 1, 7))
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(self._inv(self.d1), ('7.70', '21.00', 1, 7))
+
+    def test_rolled_back_movement_leaves_aggregates_untouched(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            aplicar_movimiento(self.med.id, 'entrada', 5)
+            self.assertEqual(self._inv(self.d1)[3], 9)
+            raise RuntimeError
+        self.assertEqual(self._inv(self.d1), ('4.40', '10.00', 1, 4))
+
+    def test_recalcular_repairs_bulk_changes(self):
+        Medicamento.objects.bulk_create([Medicamento(nombre='AG bulk', precio_venta='0.10', stock_actual=3, drogueria=self.d2)])
+        Medicamento.objects.filter(pk=self.med.pk).update(stock_actual=10)
+        self.assertEqual(self._inv(self.d2), ('0.00', '0.00', 0, 0))
+
+        self.assertEqual(sorted(agregados.recalcular()), [self.d1.id, self.d2.id])
+        self.assertEqual(self._inv(self.d1), ('11.00', '25.00', 1, 10))
+        self.assertEqual(self._inv(self.d2), ('0.00', '0.30', 1, 3))
+        self.assertEqual(agregados.recalcular(), [])
+
+    def test_list_endpoint_reads_stored_rows(self):
+        self.client.force_authenticate(self.emp)
+        with self.assertNumQueries(1):
+            resp = self.client.get('/api/droguerias/inventarios/', {'drogueria': self.d1.id})
+        fila = resp.json()[0]
+        self.assertEqual((fila['drogueria_nombre'], fila['cantidad_stock_total']), ('Agreg 1', 4))
+
+    def test_resumen_is_one_aggregate_cached_per_scope(self):
+        otro = Usuario.objects.create_user(username='agreg2', password='x', email='agreg2@example.com', rol='empleado')
+        Drogueria.objects.create(codigo='AG3', nombre='Ajena', propietario=otro)
+        with self.captureOnCommitCallbacks(execute=True):
+            Medicamento.objects.create(nombre='AG b', precio_venta='1.00', costo_compra='0.50', stock_actual=2,
+                                       drogueria=self.d2)
+        django_cache.clear()
+        self.client.force_authenticate(self.emp)
+        url = '/api/droguerias/inventarios/resumen/'
+        with self.assertNumQueries(2):  # alcance + agregado
+            data = self.client.get(url).json()
+        self.assertEqual((data['total_droguerias'], data['cantidad_total_stock'], data['cantidad_total_medicamentos']), (2, 6, 2))
+        with self.assertNumQueries(1):  # solo el alcance; el agregado sale de la caché
+            self.client.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            MovimientoInventario.objects.create(medicamento=self.med, drogueria=self.d1, tipo_movimiento='entrada', cantidad=5)
+        self.assertEqual(self.client.get(url).json()['cantidad_total_stock'], 11)
+
+
+@skipUnless(importlib.util.find_spec('numpy'), 'requiere numpy')
+class PronosticoDemandaTests(APITestCase):
+    def setUp(self):
+        self.hoy = timezone.localdate()
+        self.user = Usuario.objects.create_user(username='pron', password='x', email='pron@example.com', rol='empleado')
+        self.d1 = Drogueria.objects.create(codigo='PR1', nombre='Pron', propietario=self.user)
+        self.estable = Medicamento.objects.create(nombre='Estable', precio_venta=1, stock_actual=10_000, drogueria=self.d1)
+        self.variable = Medicamento.objects.create(nombre='Variable', precio_venta=1, stock_actual=10_000, drogueria=self.d1)
+        self.quieto = Medicamento.objects.create(nombre='Quieto', precio_venta=1, stock_actual=5, stock_minimo=3,
+                                                 drogueria=self.d1)
+        movimientos = []
+        for atras in range(1, 29):
+            fecha = timezone.now() - timedelta(days=atras)
+            movimientos.append(MovimientoInventario(medicamento=self.estable, tipo_movimiento='salida',
+                                                    cantidad=2, fecha_movimiento=fecha))
+            movimientos.append(MovimientoInventario(medicamento=self.estable, tipo_movimiento='salida',
+                                                    cantidad=1, fecha_movimiento=fecha))
+            if atras % 2:
+                movimientos.append(MovimientoInventario(medicamento=self.variable, tipo_movimiento='salida',
+                                                        cantidad=10, fecha_movimiento=fecha))
+        # las entradas y las salidas de hoy (día incompleto) no cuentan
+        movimientos.append(MovimientoInventario(medicamento=self.estable, tipo_movimiento='entrada', cantidad=500,
+                                                fecha_movimiento=timezone.now() - timedelta(days=3)))
+        movimientos.append(MovimientoInventario(medicamento=self.estable, tipo_movimiento='salida', cantidad=500,
+                                                fecha_movimiento=timezone.now()))
+        MovimientoInventario.objects.bulk_create(movimientos)
+
+    def test_moving_average_safety_stock_and_reorder_point(self):
+        resultado = pronostico.pronosticar(dias=28, ventana=28, plazo=4, servicio=0.95, hoy=self.hoy)
+        self.assertEqual(resultado, {'medicamentos': 3, 'con_demanda': 2, 'aplicados': 0})
+        estable = self.estable.pronostico
+        self.assertAlmostEqual(estable.demanda_diaria, 3)
+        self.assertEqual((estable.stock_seguridad, estable.punto_reorden, estable.dias_con_demanda), (0, 12, 28))
+        variable = self.variable.pronostico
+        self.assertAlmostEqual(variable.demanda_diaria, 5)
+        # z(0.95) · σ · √4 = 1.645 · 5.09 · 2 -> 17
+        self.assertEqual((variable.stock_seguridad, variable.punto_reorden), (17, 37))
+        self.assertEqual((self.quieto.pronostico.demanda_diaria, self.quieto.pronostico.punto_reorden), (0, 0))
+
+    def test_exponential_smoothing_and_apply_to_stock_minimo(self):
+        resultado = pronostico.pronosticar(dias=28, metodo='suavizado', alfa=0.5, plazo=2, hoy=self.hoy, aplicar=True)
+        self.assertEqual(resultado['aplicados'], 2)
+        estable = PronosticoDemanda.objects.get(medicamento=self.estable)
+        self.assertEqual((estable.metodo, estable.demanda_diaria, estable.desviacion, estable.punto_reorden),
+                         ('suavizado', 3, 0, 6))
+        self.estable.refresh_from_db()
+        self.quieto.refresh_from_db()
+        # sin demanda registrada se conserva el stock_minimo cargado a mano
+        self.assertEqual((self.estable.stock_minimo, self.quieto.stock_minimo), (6, 3))
+        self.assertEqual(Medicamento.objects.get(pk=self.variable.pk).stock_minimo,
+                         PronosticoDemanda.objects.get(medicamento=self.variable).punto_reorden)
+
+    def test_reads_history_with_a_single_grouped_query(self):
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            pronostico.pronosticar(dias=28, hoy=self.hoy)
+        tabla = MovimientoInventario._meta.db_table
+        self.assertEqual(sum(1 for q in ctx.captured_queries if tabla in q['sql']), 1)
+
+
+class DisponibilidadProductoTests(APITestCase):
+    URL = '/api/inventario/disponibilidad/'
+
+    def setUp(self):
+        self.emp = Usuario.objects.create_user(username='disp', password='x', email='disp@example.com', rol='empleado')
+        self.d1 = Drogueria.objects.create(codigo='DS1', nombre='Norte', propietario=self.emp)
+        self.d2 = Drogueria.objects.create(codigo='DS2', nombre='Sur', propietario=self.emp)
+        self.d3 = Drogueria.objects.create(codigo='DS3', nombre='Centro', propietario=self.emp)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.m1 = Medicamento.objects.create(nombre='Losartán 50', precio_venta=1, stock_actual=30, stock_minimo=10,
+                                                 codigo_barra='7701', drogueria=self.d1)
+            self.m2 = Medicamento.objects.create(nombre='losartán  50', precio_venta=1, stock_actual=8, stock_minimo=5,
+                                                 drogueria=self.d2)
+            self.m3 = Medicamento.objects.create(nombre='LOSARTÁN 50', precio_venta=1, stock_actual=2, stock_minimo=5,
+                                                 drogueria=self.d3)
+            Medicamento.objects.create(nombre='Otro', precio_venta=1, stock_actual=99, drogueria=self.d2)
+        self.client.force_authenticate(self.emp)
+
+    def _excedentes(self, **params):
+        resp = self.client.get(self.URL, params)
+        self.assertEqual(resp.status_code, 200, resp.content)
+        return [(f['codigo'], f['stock_disponible'], f['excedente']) for f in resp.json()['droguerias']]
+
+    def test_ranks_branches_by_surplus_in_one_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.URL, {'nombre': ' losartán 50'}).status_code, 200)
+        esperado = [('DS1', 30, 20), ('DS2', 8, 3), ('DS3', 2, -3)]
+        self.assertEqual(self._excedentes(nombre='Losartán 50'), esperado)
+        self.assertEqual(self._excedentes(codigo_barra='7701'), esperado)
+        self.assertEqual(self._excedentes(medicamento=self.m3.id, excluir_drogueria=self.d3.id, solo_excedente='true'),
+                         esperado[:2])
+        self.assertEqual(self.client.get(self.URL).status_code, 400)
+
+    def test_index_follows_stock_reservations_and_edits(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            aplicar_movimiento(self.m1.id, 'salida', 25)
+            Prestamo.objects.create(medicamento_origen=self.m2, cantidad=3, origen=self.d2, destino=self.d3).reservar()
+            self.m3.stock_minimo = 1
+            self.m3.save()
+        self.assertEqual(self._excedentes(nombre='losartán 50'), [('DS3', 2, 1), ('DS2', 5, 0), ('DS1', 5, -5)])
+
+        self.m3.estado = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.m3.save()
+        Medicamento.objects.filter(pk=self.m2.pk).update(stock_actual=50)  # sin señales
+        self.assertEqual(disponibilidad.reconstruir(), 3)
+        self.assertEqual(self._excedentes(nombre='losartán 50'), [('DS2', 47, 42), ('DS1', 5, -5)])
+
+
+    def test_index_is_synced_on_commit_without_rolled_back_writes(self):
+        def disponible():
+            return DisponibilidadProducto.objects.get(medicamento=self.m1).disponible
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                aplicar_movimiento(self.m1.id, 'salida', 5)
+                self.assertEqual(disponible(), 30)  # se sincroniza al confirmar
+                with self.assertRaises(StockInsuficienteError), transaction.atomic():
+                    aplicar_movimiento(self.m1.id, 'entrada', 40)
+                    aplicar_movimiento(self.m1.id, 'salida', 100)
+        self.assertEqual(disponible(), 25)
+
+        with mock.patch.object(disponibilidad, 'sincronizar', side_effect=RuntimeError), \
+                self.assertLogs('django', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+            aplicar_movimiento(self.m1.id, 'salida', 5)
+        # la salida queda confirmada; el índice desfasado se reconstruye
+        self.assertEqual((Medicamento.objects.get(pk=self.m1.pk).stock_actual, disponible()), (20, 25))
+        disponibilidad.reconstruir(medicamento_ids=[self.m1.id])
+        self.assertEqual(disponible(), 20)
+
+
+class ProductosMaestroTests(APITestCase):
+    def setUp(self):
+        self.emp = Usuario.objects.create_user(username='sku', password='x', email='sku@example.com', rol='empleado')
+        self.d1 = Drogueria.objects.create(codigo='PM1', nombre='Norte', propietario=self.emp)
+        self.d2 = Drogueria.objects.create(codigo='PM2', nombre='Sur', propietario=self.emp)
+        self.d3 = Drogueria.objects.create(codigo='PM3', nombre='Centro', propietario=self.emp)
+
+    def test_alta_reuses_product_by_barcode_or_name(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            a = Medicamento.objects.create(nombre='Amoxicilina 500', precio_venta=1, codigo_barra='7702', drogueria=self.d1)
+            b = Medicamento.objects.create(nombre='Amoxi 500 cápsulas', precio_venta=1, codigo_barra='7702',
+                                           drogueria=self.d2)
+            c = Medicamento.objects.create(nombre='AMOXICILINA  500', precio_venta=1, drogueria=self.d3)
+        a, b, c = (Medicamento.objects.get(pk=m.pk) for m in (a, b, c))
+        self.assertIsNotNone(a.producto_id)
+        self.assertEqual({b.producto_id, c.producto_id}, {a.producto_id})
+        self.assertEqual(Producto.objects.get().sku, f'P{a.producto_id:06d}')
+
+    def test_product_is_assigned_on_commit_and_repaired_by_agrupar(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                a = Medicamento.objects.create(nombre='Ibuprofeno 400', precio_venta=1, drogueria=self.d1)
+                self.assertIsNone(Medicamento.objects.get(pk=a.pk).producto_id)  # se asigna al confirmar
+        producto = Medicamento.objects.get(pk=a.pk).producto_id
+        self.assertIsNotNone(producto)
+
+        with mock.patch.object(productos, 'asignar', side_effect=RuntimeError), \
+                self.assertLogs('django', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+            b = Medicamento.objects.create(nombre='IBUPROFENO  400', precio_venta=1, drogueria=self.d2)
+        # el alta queda confirmada sin producto; agrupar_productos la completa
+        self.assertIsNone(Medicamento.objects.get(pk=b.pk).producto_id)
+        self.assertEqual(productos.agrupar(), {'asignados': 1, 'creados': 0})
+        self.assertEqual(Medicamento.objects.get(pk=b.pk).producto_id, producto)
+
+    def test_agrupar_clusters_transitively_and_keeps_existing_products(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            a = Medicamento.objects.create(nombre='Acetaminofén 500', precio_venta=1, codigo_barra='111', drogueria=self.d1)
+            b = Medicamento.objects.create(nombre='Acetaminofen 500mg', precio_venta=1, codigo_barra='111',
+                                           drogueria=self.d2)
+            c = Medicamento.objects.create(nombre='ACETAMINOFEN 500MG', precio_venta=1, drogueria=self.d3)
+            d = Medicamento.objects.create(nombre='Otro', precio_venta=1, drogueria=self.d2)
+        Producto.objects.all().delete()  # medicamentos previos al maestro
+        existente = Producto.objects.create(sku='EXT-1', nombre='Otro', nombre_normalizado=productos.clave_producto('Otro'))
+
+        self.assertEqual(productos.agrupar(), {'asignados': 4, 'creados': 1})
+        asignado = dict(Medicamento.objects.values_list('id', 'producto_id'))
+        # a~b por código de barras, b~c por nombre normalizado
+        self.assertEqual(asignado[a.id], asignado[b.id])
+        self.assertEqual(asignado[b.id], asignado[c.id])
+        self.assertEqual(asignado[d.id], existente.id)
+        self.assertTrue(Producto.objects.get(pk=asignado[a.id]).sku.startswith('P'))
+        self.assertEqual(DisponibilidadProducto.objects.get(medicamento=c).producto_id, asignado[a.id])
+        self.assertEqual(productos.agrupar(), {'asignados': 0, 'creados': 0})
+
+    def test_prestamo_y_localizador_por_producto(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            origen = Medicamento.objects.create(nombre='Metformina 850', precio_venta=1, stock_actual=20,
+                                                codigo_barra='7703', drogueria=self.d1)
+            destino = Medicamento.objects.create(nombre='Metformina clorhidrato 850 mg', precio_venta=1,
+                                                 codigo_barra='7703', drogueria=self.d2)
+        origen.refresh_from_db()  # producto asignado al confirmar el alta
+        prestamo = Prestamo.objects.create(medicamento_origen=origen, cantidad=5, origen=self.d1, destino=self.d2)
+        with self.captureOnCommitCallbacks(execute=True):
+            prestamo.reservar()
+            prestamo.aceptar()
+        prestamo.refresh_from_db()
+        self.assertEqual(prestamo.medicamento_destino_id, destino.id)
+        self.assertEqual(Medicamento.objects.filter(nombre__startswith='Metformina').count(), 2)
+
+        sku = Producto.objects.get(pk=origen.producto_id).sku
+        filas = [(f['drogueria__codigo'], f['total_disponible']) for f in disponibilidad.localizar(sku=sku)]
+        self.assertEqual(filas, [('PM1', 15), ('PM2', 5)])
+        self.client.force_authenticate(self.emp)
+        resp = self.client.get('/api/inventario/disponibilidad/', {'sku': sku})
+        self.assertEqual(resp.status_code, 200, resp.content)
+        self.assertEqual(len(resp.json()['droguerias']), 2)
+
+
+class ImportacionMedicamentosTests(APITestCase):
+    URL = '/api/inventario/importaciones/'
+
+    def setUp(self):
+        self.emp = Usuario.objects.create_user(username='import', password='x', email='import@example.com', rol='empleado')
+        self.d1 = Drogueria.objects.create(codigo='IM1', nombre='Import 1', propietario=self.emp)
+        self.d2 = Drogueria.objects.create(codigo='IM2', nombre='Import 2', propietario=self.emp)
+        Categoria.objects.create(nombre='Analgésicos')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.existente = Medicamento.objects.create(nombre='Ibuprofeno 400', precio_venta=1, stock_actual=9,
+                                                        stock_minimo=3, drogueria=self.d1, proveedor='Viejo')
+        self.client.force_authenticate(self.emp)
+
+    def _subir(self, contenido, nombre='catalogo.csv', **extra):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        archivo = SimpleUploadedFile(nombre, contenido.encode('utf-8'), content_type='text/csv')
+        return self.client.post(self.URL, {'archivo': archivo, **extra}, format='multipart')
+
+    def test_empty_numeric_cells_keep_stored_values(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Medicamento.objects.create(nombre='Otro', precio_venta=1, stock_actual=4, drogueria=self.d1, proveedor='Viejo')
+        Proveedor.objects.create(nombre='Desfasado', nombre_normalizado='desfasado', medicamentos=5)
+        resp = self._subir('nombre,precio,stock,stock_minimo,proveedor\n'
+                           'Ibuprofeno 400,2,,,Genfar\n'
+                           'Otro,3,7,,\n', drogueria=self.d1.id)
+        self.assertEqual(resp.json()['actualizados'], 2, resp.content)
+        filas = dict((n, (str(p), s, m)) for n, p, s, m in Medicamento.objects.values_list(
+            'nombre', 'precio_venta', 'stock_actual', 'stock_minimo'))
+        self.assertEqual(filas, {'Ibuprofeno 400': ('2.00', 9, 3), 'Otro': ('3.00', 7, 10)})
+        # solo se ajustan los proveedores que tocó la importación
+        self.assertEqual([(p.nombre, p.medicamentos) for p in proveedores.buscar()], [('Desfasado', 5), ('Genfar', 1)])
+
+    def test_upsert_resolves_names_and_reports_row_errors(self):
+        resp = self._subir(
+            'Nombre;Precio;Stock;Categoria;Drogueria;Proveedor;Vencimiento\n'
+            'Ibuprofeno 400;2,50;20;analgésicos;;Genfar;2030-01-31\n'
+            'Acetaminofén 500;1.10;5;Antigripales;IM2;Genfar;\n'
+            'Sin precio;;1;;;;\n'
+            'Dipirona;3;-1;;;;\n'
+            'Loratadina;4;2;;Desconocida;;\n',
+            drogueria=self.d1.id,
+        )
+        self.assertEqual(resp.status_code, 201, resp.content)
+        data = resp.json()
+        self.assertEqual((data['filas_procesadas'], data['creados'], data['actualizados'], data['con_error']), (5, 1, 1, 3))
+        self.assertEqual([e['fila'] for e in data['errores']], [4, 5, 6])
+
+        self.existente.refresh_from_db()
+        self.assertEqual((str(self.existente.precio_venta), self.existente.stock_actual, self.existente.stock_minimo,
+                          self.existente.categoria.nombre, self.existente.proveedor), ('2.50', 20, 3, 'Analgésicos', 'Genfar'))
+        nuevo = Medicamento.objects.get(nombre='Acetaminofén 500')
+        self.assertEqual((nuevo.drogueria_id, nuevo.categoria.nombre), (self.d2.id, 'Antigripales'))
+        # señales omitidas por el bulk: se recalculan al final
+        self.assertEqual(list(proveedores.buscar('genfar').values_list('medicamentos', flat=True)), [2])
+        self.assertEqual(InventarioDrogueria.objects.get(drogueria=self.d2).cantidad_medicamentos, 1)
+        self.assertEqual(self.client.get(f"{self.URL}{data['id']}/").json()['estado'], 'completada')
+
+    def test_progress_is_committed_per_block_and_queries_do_not_grow_per_row(self):
+        filas = ''.join(f'Med {i},{i % 50 + 1},{i % 7}\n' for i in range(250))
+        registro = ImportacionMedicamentos.objects.create(usuario=self.emp, drogueria=self.d1, archivo='x.csv')
+        import io
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            registro = importacion.importar(registro, io.BytesIO(('nombre,precio,stock\n' + filas).encode()), bloque=100)
+        self.assertEqual((registro.creados, registro.filas_procesadas), (250, 250))
+        progreso = [q for q in ctx.captured_queries if 'UPDATE "inventario_importacionmedicamentos"' in q['sql']]
+        self.assertEqual(len(progreso), 1 + 3 + 1)  # procesando, un UPDATE por bloque, final
+        self.assertLess(len(ctx.captured_queries), 60)
+
+    def test_missing_required_column_fails(self):
+        resp = self._subir('nombre,stock\nA,1\n', drogueria=self.d1.id)
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.json()['estado'], 'fallida')
+        self.assertIn('precio_venta', resp.json()['errores'][0]['error'])
+
+
+class ExportacionMedicamentosTests(APITestCase):
+    URL = '/api/inventario/medicamentos/exportar/'
+
+    def setUp(self):
+        self.emp = Usuario.objects.create_user(username='export', password='x', email='export@example.com', rol='empleado')
+        self.d1 = Drogueria.objects.create(codigo='EX1', nombre='Export 1', propietario=self.emp)
+        self.d2 = Drogueria.objects.create(codigo='EX2', nombre='Export 2', propietario=self.emp)
+        cat = Categoria.objects.create(nombre='Analgésicos')
+        Medicamento.objects.create(nombre='Ibuprofeno, 400', precio_venta=2.5, costo_compra=1, stock_actual=7,
+                                   categoria=cat, drogueria=self.d1)
+        Medicamento.objects.create(nombre='Loratadina', precio_venta=4, stock_actual=3, drogueria=self.d2)
+        self.client.force_authenticate(self.emp)
+
+    def _contenido(self, resp):
+        return b''.join(resp.streaming_content)
+
+    def test_csv_streams_header_and_rows(self):
+        import csv
+        import io
+        resp = self.client.get(self.URL)
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.streaming)
+        self.assertIn('attachment;', resp['Content-Disposition'])
+        filas = list(csv.reader(io.StringIO(self._contenido(resp).decode('utf-8-sig'))))
+        self.assertEqual(filas[0][:6], ['id', 'nombre', 'descripcion', 'categoria', 'drogueria', 'precio_venta'])
+        self.assertEqual([(f[1], f[3], f[4], f[5], f[7]) for f in filas[1:]],
+                         [('Ibuprofeno, 400', 'Analgésicos', 'EX1', '2.50', '7'), ('Loratadina', '', 'EX2', '4.00', '3')])
+
+    def test_jsonl_respects_listing_filters(self):
+        import json
+        resp = self.client.get(self.URL, {'formato': 'jsonl', 'drogueria': self.d2.id})
+        self.assertEqual(resp.status_code, 200)
+        lineas = self._contenido(resp).decode('utf-8').splitlines()
+        self.assertEqual(len(lineas), 1)
+        self.assertEqual(json.loads(lineas[0])['nombre'], 'Loratadina')
+        self.assertEqual(self.client.get(self.URL, {'formato': 'xml'}).status_code, 400)
+
+    def test_gzip_round_trip(self):
+        import gzip
+        import json
+        resp = self.client.get(self.URL, {'formato': 'jsonl', 'comprimir': 'gzip'})
+        self.assertEqual(resp['Content-Type'], 'application/gzip')
+        self.assertIn('.jsonl.gz', resp['Content-Disposition'])
+        lineas = gzip.decompress(self._contenido(resp)).decode('utf-8').splitlines()
+        self.assertEqual([json.loads(l)['drogueria'] for l in lineas], ['EX1', 'EX2'])
+
+    def test_query_count_does_not_grow_with_rows(self):
+        from django.test.utils import CaptureQueriesContext
+
+        def consultas():
+            with CaptureQueriesContext(connection) as ctx:
+                self._contenido(self.client.get(self.URL))
+            return len(ctx.captured_queries)
+
+        base = consultas()
+        Medicamento.objects.bulk_create([Medicamento(nombre=f'Masivo {i}', precio_venta=1, drogueria=self.d1)
+                                         for i in range(30)])
+        with mock.patch.object(exportacion, 'FILAS_POR_TROZO', 7):
+            self.assertEqual(consultas(), base)
+
+
+class HistorialCursorTests(APITestCase):
+    def setUp(self):
+        self.admin = Usuario.objects.create_user(username='hist', password='x', email='hist@example.com', rol='admin')
+        self.med = Medicamento.objects.create(nombre='Hist', precio_venta=1.0)
+        base = timezone.now()
+        # varios movimientos con la misma fecha: el id desempata
+        MovimientoInventario.objects.bulk_create(
+            MovimientoInventario(medicamento=self.med, tipo_movimiento='entrada', cantidad=1,
+                                 fecha_movimiento=base - timedelta(minutes=i // 3))
+            for i in range(25)
+        )
+        AuditLog.objects.bulk_create(
+            AuditLog(action='x', model_name='M', object_id=str(i), created_at=base - timedelta(seconds=i % 4))
+            for i in range(12)
+        )
+        self.client.force_authenticate(self.admin)
+
+    def _recorrer(self, url):
+        vistos, paginas = [], 0
+        while url:
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 200, resp.content)
+            data = resp.json()
+            self.assertNotIn('count', data)
+            vistos += [r['id'] for r in data['results']]
+            url, paginas = data['next'], paginas + 1
+        return vistos, paginas
+
+    def test_movimientos_cursor_walks_everything_once_in_order(self):
+        vistos, paginas = self._recorrer('/api/inventario/movimientos/?cursor=&page_size=10')
+        esperado = list(MovimientoInventario.objects.order_by('-fecha_movimiento', '-id').values_list('id', flat=True))
+        self.assertEqual(vistos, esperado)
+        self.assertEqual(paginas, 3)
+        asc, _ = self._recorrer('/api/inventario/movimientos/?cursor=&ordering=fecha_movimiento&page_size=7')
+        self.assertEqual(asc, esperado[::-1])
+
+    def test_auditlogs_cursor_and_filters(self):
+        vistos, _ = self._recorrer('/api/inventario/auditlogs/?cursor=&page_size=5&model_name=M')
+        self.assertEqual(vistos, list(AuditLog.objects.order_by('-created_at', '-id').values_list('id', flat=True)))
+
+    def test_deep_page_costs_same_as_first(self):
+        from django.test.utils import CaptureQueriesContext
+        primera = self.client.get('/api/inventario/movimientos/?cursor=&page_size=2').json()
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(primera['next'])
+        sqls = [q['sql'] for q in ctx.captured_queries]
+        self.assertFalse(any('COUNT(' in q or 'OFFSET' in q for q in sqls), sqls)
+
+    def test_offset_pagination_still_available_and_bad_cursor(self):
+        data = self.client.get('/api/inventario/movimientos/?page=2').json()
+        self.assertEqual(data['count'], 25)
+        self.assertEqual(len(data['results']), 10)
+        self.assertEqual(self.client.get('/api/inventario/movimientos/?cursor=zzz').status_code, 404)
+
+
+class CodigoBarraLookupTests(APITestCase):
+    def setUp(self):
+        barcode.cache.limpiar()
+        self.user = Usuario.objects.create_user(username='caja', password='x', email='caja@example.com', rol='empleado')
+        self.d1 = Drogueria.objects.create(codigo='CB1', nombre='Caja1', propietario=self.user)
+        self.d2 = Drogueria.objects.create(codigo='CB2', nombre='Caja2', propietario=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.m1 = Medicamento.objects.create(nombre='Scan', precio_venta=2500, stock_actual=8, stock_reservado=3,
+                                                 codigo_barra='7700001', drogueria=self.d1)
+            Medicamento.objects.create(nombre='Scan', precio_venta=9999, stock_actual=1, codigo_barra='7700001', drogueria=self.d2)
+        self.user.active_drogueria = self.d1
+        self.user.save()
+        self.client.force_authenticate(self.user)
+
+    def test_exact_match_scoped_to_active_drogueria(self):
+        resp = self.client.get('/api/inventario/medicamentos/codigo-barra/7700001/')
+        self.assertEqual(resp.status_code, 200, resp.content)
+        self.assertEqual(resp.json(), {'id': self.m1.id, 'nombre': 'Scan', 'precio': '2500.00', 'stock_disponible': 5})
+        # sin coincidencias parciales
+        self.assertEqual(self.client.get('/api/inventario/medicamentos/codigo-barra/77000/').status_code, 404)
+
+    def test_requires_active_drogueria(self):
+        self.user.active_drogueria = None
+        self.user.save()
+        self.assertEqual(self.client.get('/api/inventario/medicamentos/codigo-barra/7700001/').status_code, 400)
+
+    def test_cache_hit_and_invalidation_on_writes(self):
+        url = '/api/inventario/medicamentos/codigo-barra/7700001/'
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            buscar_por_codigo(self.d1.id, '7700001')
+        # movimiento (libro de stock) invalida la entrada
+        with self.captureOnCommitCallbacks(execute=True):
+            MovimientoInventario.objects.create(medicamento=self.m1, drogueria=self.d1, tipo_movimiento='entrada',
+                                                cantidad=2)
+        self.assertEqual(self.client.get(url).json()['stock_disponible'], 7)
+        # save() del medicamento también
+        self.m1.refresh_from_db()
+        self.m1.precio_venta = 3000
+        with self.captureOnCommitCallbacks(execute=True):
+            self.m1.save()
+        self.assertEqual(self.client.get(url).json()['precio'], '3000.00')
+
+    def test_negative_entry_invalidated_by_new_product(self):
+        self.assertIsNone(buscar_por_codigo(self.d1.id, '7709999'))
+        with self.captureOnCommitCallbacks(execute=True):
+            Medicamento.objects.create(nombre='Nuevo', precio_venta=1, codigo_barra='7709999', drogueria=self.d1)
+        self.assertEqual(buscar_por_codigo(self.d1.id, '7709999')['nombre'], 'Nuevo')
+
+
+class StockConcurrencyTests(TransactionTestCase):
+    """Escritores concurrentes sobre el mismo medicamento no pierden actualizaciones."""
+    WRITERS = 60
+
+    def _run_concurrently(self, fn):
+        barrier = threading.Barrier(self.WRITERS)
+        results = []
+        lock = threading.Lock()
+
+        def worker():
+            try:
+                barrier.wait()
+                try:
+                    outcome = fn()
+                except StockInsuficienteError:
+                    outcome = 'rechazado'
+                with lock:
+                    results.append(outcome)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.WRITERS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+
+    def test_no_lost_updates_under_concurrent_writers(self):
+        med = Medicamento.objects.create(nombre='Concurrente', precio_venta=1.0, stock_actual=1000)
+
+        def escribir():
+            for _ in range(5):
+                aplicar_movimiento(med.id, 'salida', 1)
+                aplicar_movimiento(med.id, 'entrada', 2)
+            return 'ok'
+
+        results = self._run_concurrently(escribir)
+        self.assertEqual(results.count('ok'), self.WRITERS)
+        med.refresh_from_db()
+        self.assertEqual(med.stock_actual, 1000 + self.WRITERS * 5)
+
+    def test_concurrent_oversell_is_rejected_not_clamped(self):
+        med = Medicamento.objects.create(nombre='Escaso', precio_venta=1.0, stock_actual=25)
+        results = self._run_concurrently(lambda: aplicar_movimiento(med.id, 'salida', 1))
+        self.assertEqual(len([r for r in results if r != 'rechazado']), 25)
+        self.assertEqual(results.count('rechazado'), self.WRITERS - 25)
+        med.refresh_from_db()
+        self.assertEqual(med.stock_actual, 0)
@@ -0,0 +1,182 @@
+"""Transferencias con varias líneas entre droguerías.
+
+- ``crear``: valida las líneas y reserva todo el stock de origen con un único
+  UPDATE (``stock.aplicar_deltas``) en la misma transacción que el documento.
+- ``aceptar``: en una transacción bloquea los medicamentos de origen y destino
+  en orden de id (dos sucursales que se transfieren entre sí no se bloquean
+  mutuamente), resuelve (por producto del maestro) o crea en bloque los medicamentos destino, aplica
+  salidas y entradas con un único UPDATE e inserta los movimientos y sus eventos
+  de outbox en bloque.
+- ``rechazar``: libera las reservas, también con un único UPDATE.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from . import derivados, outbox, productos
+from .models import LineaTransferencia, Medicamento, MovimientoInventario, Transferencia
+from .stock import BULK_BATCH_SIZE, aplicar_deltas
+
+
+def crear(origen, destino, lineas, solicitante=None, nota=None):
+    """Crea la transferencia y reserva el stock de origen.
+
+    ``lineas``: lista de dicts con medicamento_origen (id), cantidad y
+    opcionalmente medicamento_destino (id). Lanza ValueError si alguna no es
+    válida y ``StockInsuficienteError`` si el disponible no alcanza.
+    """
+    if origen.pk == destino.pk:
+        raise ValueError('La droguería origen y destino deben ser distintas')
+    if not lineas:
+        raise ValueError('La transferencia debe tener al menos una línea')
+    ids_origen = [l['medicamento_origen'] for l in lineas]
+    if len(set(ids_origen)) != len(ids_origen):
+        raise ValueError('Cada medicamento solo puede aparecer en una línea')
+    if any(l['cantidad'] <= 0 for l in lineas):
+        raise ValueError('La cantidad debe ser mayor que 0')
+
+    ids_destino = {l['medicamento_destino'] for l in lineas if l.get('medicamento_destino')}
+    droguerias = dict(Medicamento.objects.filter(id__in=set(ids_origen) | ids_destino).values_list('id', 'drogueria_id'))
+    for l in lineas:
+        if droguerias.get(l['medicamento_origen']) != origen.pk:
+            raise ValueError(f"El medicamento {l['medicamento_origen']} no pertenece a la droguería origen")
+        if l.get('medicamento_destino') and droguerias.get(l['medicamento_destino']) != destino.pk:
+            raise ValueError(f"El medicamento {l['medicamento_destino']} no pertenece a la droguería destino")
+
+    with transaction.atomic():
+        transferencia = Transferencia.objects.create(origen=origen, destino=destino, solicitante=solicitante, nota=nota)
+        LineaTransferencia.objects.bulk_create([
+            LineaTransferencia(
+                transferencia=transferencia,
+                medicamento_origen_id=l['medicamento_origen'],
+                medicamento_destino_id=l.get('medicamento_destino'),
+                cantidad=l['cantidad'],
+            ) for l in lineas
+        ], batch_size=BULK_BATCH_SIZE)
+        aplicar_deltas({l['medicamento_origen']: (0, l['cantidad']) for l in lineas})
+    return transferencia
+
+
+def _bloquear_pendiente(transferencia):
+    bloqueada = Transferencia.objects.select_for_update().get(pk=transferencia.pk)
+    if bloqueada.estado != 'pending':
+        raise ValueError('Solo transferencias pendientes pueden responderse')
+    return bloqueada
+
+
+def _resolver_destinos(transferencia, lineas):
+    """Completa medicamento_destino: mismo producto del maestro en la droguería destino,
+    si no por nombre, o creándolo."""
+    faltantes = [l for l in lineas if l.medicamento_destino_id is None]
+    if not faltantes:
+        return
+    por_producto = productos.equivalentes([l.medicamento_origen for l in faltantes], transferencia.destino_id)
+    existentes = {}
+    for mid, nombre in (Medicamento.objects
+                        .filter(drogueria_id=transferencia.destino_id,
+                                nombre__in={l.medicamento_origen.nombre for l in faltantes})
+                        .order_by('id').values_list('id', 'nombre')):
+        existentes.setdefault(nombre, mid)
+    nuevos = {}
+    for linea in faltantes:
+        med = linea.medicamento_origen
+        if med.producto_id not in por_producto and med.nombre not in existentes and med.nombre not in nuevos:
+            nuevos[med.nombre] = Medicamento(
+                nombre=med.nombre,
+                descripcion=med.descripcion,
+                categoria_id=med.categoria_id,
+                precio_venta=med.precio_venta,
+                costo_compra=med.costo_compra,
+                proveedor=med.proveedor,
+                producto_id=med.producto_id,
+                stock_actual=0,
+                drogueria_id=transferencia.destino_id,
+            )
+    if nuevos:
+        Medicamento.objects.bulk_create(list(nuevos.values()), batch_size=BULK_BATCH_SIZE)
+        # sin señales: contadores, índices y cachés se anotan en el lote de la transacción
+        derivados.creados(nuevos.values())
+        existentes.update({nombre: med.id for nombre, med in nuevos.items()})
+    for linea in faltantes:
+        med = linea.medicamento_origen
+        if med.producto_id in por_producto:
+            linea.medicamento_destino_id = por_producto[med.producto_id]
+        else:
+            linea.medicamento_destino_id = existentes[med.nombre]
+    LineaTransferencia.objects.bulk_update(faltantes, ['medicamento_destino'], batch_size=BULK_BATCH_SIZE)
+
+
+def aceptar(transferencia, usuario=None):
+    """Acepta todas las líneas en una transacción. Retorna la transferencia actualizada."""
+    with transaction.atomic():
+        transferencia = _bloquear_pendiente(transferencia)
+        lineas = list(transferencia.lineas.select_related('medicamento_origen').order_by('id'))
+        _resolver_destinos(transferencia, lineas)
+
+        # orden de id estable: evita deadlocks entre transferencias cruzadas
+        ids = sorted({l.medicamento_origen_id for l in lineas} | {l.medicamento_destino_id for l in lineas})
+        info = {mid: (nombre, minimo) for mid, nombre, minimo in
+                Medicamento.objects.select_for_update().filter(id__in=ids).order_by('id')
+                .values_list('id', 'nombre', 'stock_minimo')}
+
+        deltas = {}
+        for l in lineas:
+            # salida en origen consumiendo la reserva; entrada en destino
+            d, r = deltas.get(l.medicamento_origen_id, (0, 0))
+            deltas[l.medicamento_origen_id] = (d - l.cantidad, r - l.cantidad)
+            d, r = deltas.get(l.medicamento_destino_id, (0, 0))
+            deltas[l.medicamento_destino_id] = (d + l.cantidad, r)
+        stocks = aplicar_deltas(deltas)
+
+        ahora = timezone.now()
+        movimientos = []
+        for l in lineas:
+            movimientos.append(MovimientoInventario(
+                medicamento_id=l.medicamento_origen_id, drogueria_id=transferencia.origen_id,
+                tipo_movimiento='salida', cantidad=l.cantidad, fecha_movimiento=ahora, usuario=usuario,
+                observacion=f'Transferencia {transferencia.pk}',
+            ))
+            movimientos.append(MovimientoInventario(
+                medicamento_id=l.medicamento_destino_id, drogueria_id=transferencia.destino_id,
+                tipo_movimiento='entrada', cantidad=l.cantidad, fecha_movimiento=ahora, usuario=usuario,
+                observacion=f'Transferencia {transferencia.pk}',
+            ))
+        MovimientoInventario.objects.bulk_create(movimientos, batch_size=BULK_BATCH_SIZE)
+
+        transferencia.estado = 'accepted'
+        transferencia.respondedor = usuario
+        transferencia.fecha_respuesta = ahora
+        transferencia.save(update_fields=['estado', 'respondedor', 'fecha_respuesta'])
+
+        outbox.registrar_varios(
+            [('movimiento', outbox.datos_movimiento(
+                mov, info[mov.medicamento_id][0], stocks[mov.medicamento_id], info[mov.medicamento_id][1]))
+             for mov in movimientos]
+            + [('transferencia_aceptada', _datos(transferencia, lineas, usuario))]
+        )
+    return transferencia
+
+
+def rechazar(transferencia, usuario=None, nota=None):
+    """Rechaza la transferencia y libera las reservas de origen."""
+    with transaction.atomic():
+        transferencia = _bloquear_pendiente(transferencia)
+        lineas = list(transferencia.lineas.order_by('id'))
+        aplicar_deltas({l.medicamento_origen_id: (0, -l.cantidad) for l in lineas})
+        transferencia.estado = 'rejected'
+        transferencia.respondedor = usuario
+        transferencia.nota = nota or transferencia.nota
+        transferencia.fecha_respuesta = timezone.now()
+        transferencia.save(update_fields=['estado', 'respondedor', 'nota', 'fecha_respuesta'])
+        outbox.registrar('transferencia_rechazada', **_datos(transferencia, lineas, usuario))
+    return transferencia
+
+
+def _datos(transferencia, lineas, usuario):
+    return {
+        'transferencia': transferencia.pk,
+        'usuario': usuario.pk if usuario else None,
+        'origen': transferencia.origen_id,
+        'destino': transferencia.destino_id,
+        'lineas': len(lineas),
+        'unidades': sum(l.cantidad for l in lineas),
+    }
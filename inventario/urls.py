@@ -14,11 +14,19 @@ from .views import (
     ProveedoresListView,
     DrogueriasListPublicAPIView,
     PrestamoViewSet,
+    TransferenciaViewSet,
+    ImportacionMedicamentosViewSet,
     AlertaViewSet,
     AuditLogViewSet,
     MedicamentosDisponiblesView,
     AlertasMedicamentosView,
-    DetallesMedicamentoView
+    DetallesMedicamentoView,
+    MedicamentoPorCodigoView,
+    StockHistoricoView,
+    ValoracionInventarioView,
+    ExportarMedicamentosView,
+    DisponibilidadProductoView,
+    FacetasCatalogoView,
 )
 
 
@@ -30,6 +38,8 @@ router.register(r'categorias', CategoriaViewSet, basename='categoria')
 router.register(r'medicamentos-crud', MedicamentoViewSet, basename='medicamento-crud')
 router.register(r'movimientos', MovimientoInventarioViewSet, basename='movimiento-inventario')
 router.register(r'prestamos', PrestamoViewSet, basename='prestamo')
+router.register(r'transferencias', TransferenciaViewSet, basename='transferencia')
+router.register(r'importaciones', ImportacionMedicamentosViewSet, basename='importacion-medicamentos')
 router.register(r'alerts', AlertaViewSet, basename='alerta')
 router.register(r'auditlogs', AuditLogViewSet, basename='auditlog')
 
@@ -41,6 +51,12 @@ urlpatterns = [
     path("medicamentos/", MedicamentoListView.as_view(), name="medicamentos_lista"),
     path("medicamentos/crear/", MedicamentoCreateView.as_view(), name="medicamento_crear"),
     path("medicamentos/<int:pk>/", MedicamentoDetailView.as_view(), name="medicamento_detalle"),
+    path("medicamentos/codigo-barra/<str:codigo>/", MedicamentoPorCodigoView.as_view(), name="medicamento_por_codigo"),
+    path("alertas/", AlertasMedicamentosView.as_view(), name="alertas_medicamentos"),
+    path("stock-historico/", StockHistoricoView.as_view(), name="stock_historico"),
+    path("valoracion/", ValoracionInventarioView.as_view(), name="valoracion_inventario"),
+    path("medicamentos/exportar/", ExportarMedicamentosView.as_view(), name="medicamentos_exportar"),
+    path("disponibilidad/", DisponibilidadProductoView.as_view(), name="disponibilidad_producto"),
 
     # 🔹 API pública (catálogo)
     path("catalogo/", MedicamentoListPublicAPIView.as_view(), name="catalogo_api"),
@@ -48,6 +64,7 @@ urlpatterns = [
     path("catalogo/categorias-con-medicamentos/", CategoriaConMedicamentosListAPIView.as_view(), name="catalogo_categorias_anidadas"),
     path("catalogo/proveedores/", ProveedoresListView.as_view(), name="catalogo_proveedores"),
     path("catalogo/droguerias/", DrogueriasListPublicAPIView.as_view(), name="catalogo_droguerias"),
+    path("catalogo/facetas/", FacetasCatalogoView.as_view(), name="catalogo_facetas"),
     path("by-drogueria/", MedicamentosByDrogueriaListAPIView.as_view(), name="medicamentos_by_drogueria"),
 
     # 🔹 Incluye las rutas automáticas del router (CRUD)
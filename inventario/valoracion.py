@@ -0,0 +1,71 @@
+"""Valoración del inventario agregada en la base de datos.
+
+Suma ``precio_venta * stock_actual`` y ``costo_compra * stock_actual`` con un
+GROUP BY por droguería, categoría y/o proveedor en una sola consulta. Los
+productos se calculan en centavos enteros (``ROUND(precio * 100) * stock``):
+SQLite guarda los DecimalField como REAL y una suma de productos en coma
+flotante no es exacta; la suma de enteros sí, y se convierte a Decimal al final.
+"""
+from decimal import Decimal
+
+from django.db.models import BigIntegerField, Count, F, Sum
+from django.db.models.functions import Cast, Coalesce, Round
+
+AGRUPACIONES = {
+    'drogueria': ('drogueria_id', 'drogueria__nombre'),
+    'categoria': ('categoria_id', 'categoria__nombre'),
+    'proveedor': ('proveedor',),
+}
+
+
+def _centavos(campo):
+    return Cast(Round(F(campo) * 100), BigIntegerField()) * F('stock_actual')
+
+
+def a_decimal(centavos):
+    return Decimal(centavos or 0).scaleb(-2).quantize(Decimal('0.01'))
+
+
+def valorizar(queryset, agrupar=()):
+    """Retorna {'grupos': [...], 'total': {...}} para ``queryset`` (Medicamento).
+
+    ``agrupar``: subconjunto ordenado de AGRUPACIONES; vacío = solo el total.
+    """
+    campos = [c for g in agrupar for c in AGRUPACIONES[g]]
+    agregados = {
+        'medicamentos': Count('id'),
+        'unidades': Coalesce(Sum('stock_actual'), 0),
+        'valor_centavos': Coalesce(Sum(_centavos('precio_venta')), 0),
+        'costo_centavos': Coalesce(Sum(_centavos('costo_compra')), 0),
+    }
+    if campos:
+        filas = queryset.order_by().values(*campos).annotate(**agregados).order_by(*campos)
+    else:
+        filas = [queryset.aggregate(**agregados)]
+
+    grupos, total = [], {'medicamentos': 0, 'unidades': 0, 'valor': 0, 'costo': 0}
+    for fila in filas:
+        grupo = {c.replace('__', '_'): fila[c] for c in campos}
+        grupo.update(
+            medicamentos=fila['medicamentos'],
+            unidades=fila['unidades'],
+            valor_total=str(a_decimal(fila['valor_centavos'])),
+            costo_total=str(a_decimal(fila['costo_centavos'])),
+            margen=str(a_decimal(fila['valor_centavos'] - fila['costo_centavos'])),
+        )
+        grupos.append(grupo)
+        total['medicamentos'] += fila['medicamentos']
+        total['unidades'] += fila['unidades']
+        total['valor'] += fila['valor_centavos']
+        total['costo'] += fila['costo_centavos']
+    return {
+        'agrupado_por': list(agrupar),
+        'grupos': grupos,
+        'total': {
+            'medicamentos': total['medicamentos'],
+            'unidades': total['unidades'],
+            'valor_total': str(a_decimal(total['valor'])),
+            'costo_total': str(a_decimal(total['costo'])),
+            'margen': str(a_decimal(total['valor'] - total['costo'])),
+        },
+    }
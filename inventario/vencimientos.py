@@ -0,0 +1,92 @@
+"""Barrido periódico de vencimientos (reemplaza la verificación en cada save).
+
+En cada ejecución solo se consideran los medicamentos que cruzaron un umbral
+desde el último barrido, con rangos sobre el índice de ``fecha_vencimiento``:
+
+- vencido: ``ultima_fecha <= fecha_vencimiento < hoy``
+- por_vencer: ``ultima_fecha + dias < fecha_vencimiento <= hoy + dias``
+
+Además se revisan las filas marcadas con ``revisar_vencimiento``: su fecha
+cambió desde el último barrido (alta, edición, importación o cambio de lote en
+``lotes.refrescar_proximo``) y puede caer ya dentro de la ventana sin haber
+cruzado un umbral. El barrido desmarca las que revisó.
+
+La primera ejecución (o ``completo=True``) barre todo el rango. Los medicamentos
+con una alerta no leída del mismo tipo se omiten, y las nuevas alertas se
+insertan con un bulk_create por droguería. La fecha del último barrido se guarda
+en ``EstadoTarea``.
+"""
+from datetime import date, timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Alerta, EstadoTarea, Medicamento
+
+TAREA = 'barrido_vencimientos'
+DIAS_AVISO = 7
+
+
+def _alerta(fila, tipo, hoy):
+    if tipo == 'vencido':
+        return Alerta(
+            tipo='vencido',
+            nivel='danger',
+            mensaje=f"{fila['nombre']} está vencido o su fecha de vencimiento ha pasado.",
+            medicamento_id=fila['id'],
+            drogueria_id=fila['drogueria_id'],
+        )
+    dias = (fila['fecha_vencimiento'] - hoy).days
+    return Alerta(
+        tipo='por_vencer',
+        nivel='warning',
+        mensaje=f"{fila['nombre']} vence en {dias} día(s) ({fila['fecha_vencimiento'].isoformat()}).",
+        medicamento_id=fila['id'],
+        drogueria_id=fila['drogueria_id'],
+    )
+
+
+def barrer(hoy=None, dias=DIAS_AVISO, completo=False):
+    """Crea las alertas de vencimiento pendientes. Retorna {'vencido': n, 'por_vencer': n}."""
+    hoy = hoy or timezone.now().date()
+    limite = hoy + timedelta(days=dias)
+    with transaction.atomic():
+        # el bloqueo evita dos barridos simultáneos sobre la misma ventana
+        tarea, _ = EstadoTarea.objects.select_for_update().get_or_create(nombre=TAREA)
+        ultima = None if completo or 'fecha' not in tarea.datos else date.fromisoformat(tarea.datos['fecha'])
+
+        vencidos = Q(fecha_vencimiento__lt=hoy)
+        por_vencer = Q(fecha_vencimiento__gte=hoy, fecha_vencimiento__lte=limite)
+        if ultima is not None:
+            vencidos &= Q(fecha_vencimiento__gte=ultima)
+            por_vencer &= Q(fecha_vencimiento__gt=ultima + timedelta(days=tarea.datos.get('dias', dias)))
+        marcados = Q(revisar_vencimiento=True, fecha_vencimiento__lte=limite)
+        # bloqueo: una edición concurrente espera y vuelve a marcar la fila después del desmarcado
+        filas = list(Medicamento.objects
+                     .filter(vencidos | por_vencer | marcados, estado=True)
+                     .select_for_update()
+                     .values('id', 'nombre', 'drogueria_id', 'fecha_vencimiento', 'revisar_vencimiento'))
+
+        existentes = set(Alerta.objects
+                         .filter(tipo__in=('vencido', 'por_vencer'), leido=False,
+                                 medicamento_id__in=[f['id'] for f in filas])
+                         .order_by()
+                         .values_list('tipo', 'medicamento_id'))
+        por_drogueria, totales = {}, {'vencido': 0, 'por_vencer': 0}
+        for fila in filas:
+            tipo = 'vencido' if fila['fecha_vencimiento'] < hoy else 'por_vencer'
+            if (tipo, fila['id']) in existentes:
+                continue
+            por_drogueria.setdefault(fila['drogueria_id'], []).append(_alerta(fila, tipo, hoy))
+            totales[tipo] += 1
+        for nuevas in por_drogueria.values():
+            Alerta.objects.bulk_create(nuevas, batch_size=500)
+        revisados = [f['id'] for f in filas if f['revisar_vencimiento']]
+        for i in range(0, len(revisados), 500):
+            Medicamento.objects.filter(id__in=revisados[i:i + 500]).update(revisar_vencimiento=False)
+
+        tarea.ultima_ejecucion = timezone.now()
+        tarea.datos = {'fecha': hoy.isoformat(), 'dias': dias}
+        tarea.save()
+    return totales
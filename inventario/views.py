@@ -1,10 +1,11 @@
-from rest_framework import viewsets, generics, permissions, filters
+from rest_framework import viewsets, generics, permissions, filters, serializers
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from .models import Medicamento, Categoria, MovimientoInventario, Prestamo
+from .models import Medicamento, Categoria, MovimientoInventario, Prestamo, Transferencia
 from django.db.models import Q
 from usuarios.utils import es_admin
 from .filters import (
+    BusquedaFilter,
     apply_medicamento_filters,
     apply_movimiento_filters,
     apply_prestamo_filters,
@@ -13,22 +14,35 @@ from .filters import (
 )
 from .serializer import (
     MedicamentoSerializer,
+    MedicamentoListSerializer,
     CategoriaSerializer,
-    CategoriaConMedicamentosSerializer,
     MovimientoInventarioSerializer,
+    MovimientoLoteSerializer,
+    ProveedorSerializer,
 )
 from .serializers_prestamo import PrestamoSerializer
+from .serializers_transferencia import TransferenciaSerializer
 from .models import Prestamo
 from .permissions import EsEmpleadoOPermisoAdmin
-from .serializer import AlertaSerializer, AuditLogSerializer
-from .models import Alerta, AuditLog
+from .serializer import AlertaSerializer, AuditLogSerializer, ImportacionMedicamentosSerializer, LoteMedicamentoSerializer
+from .models import Alerta, AuditLog, ImportacionMedicamentos
 from rest_framework import mixins
-from .pagination import StandardResultsSetPagination
+from .pagination import StandardResultsSetPagination, MovimientoPagination, AuditLogPagination
+from .stock import StockInsuficienteError, registrar_lote
+from .barcode import buscar_por_codigo
+from . import (alertas, catalogo, disponibilidad, exportacion, facetas, historico, importacion, proveedores,
+               transferencias, valoracion)
+from .cache import RespuestaCondicionalMixin
 from rest_framework.views import APIView
 from rest_framework import status
+from rest_framework.parsers import FormParser, MultiPartParser
+from django.http import StreamingHttpResponse
 from rest_framework.response import Response
 from .serializer import DrogueriaNestedSerializer
+from datetime import datetime, time
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.db import transaction
 from django.db.models import Q, F
 from rest_framework.response import Response
 from rest_framework.views import APIView
@@ -50,7 +64,21 @@ class CategoriaViewSet(viewsets.ModelViewSet):
 # =========================
 # 💊 CRUD DE MEDICAMENTOS
 # =========================
-class MedicamentoViewSet(viewsets.ModelViewSet):
+class EdicionConAjusteMixin:
+    """PUT/PATCH de medicamentos: un cambio de stock por edición queda como movimiento de ajuste."""
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            anterior = (Medicamento.objects.select_for_update()
+                        .values_list('stock_actual', flat=True).get(pk=serializer.instance.pk))
+            medicamento = serializer.save()
+            historico.registrar_ajustes(
+                [(medicamento.pk, medicamento.drogueria_id, medicamento.stock_actual - anterior)],
+                usuario_id=self.request.user.pk, observacion='Edición del medicamento',
+            )
+
+
+class MedicamentoViewSet(EdicionConAjusteMixin, viewsets.ModelViewSet):
     queryset = Medicamento.objects.all()
     serializer_class = MedicamentoSerializer
     permission_classes = [EsEmpleadoOPermisoAdmin]
@@ -60,13 +88,15 @@ class MedicamentoViewSet(viewsets.ModelViewSet):
         instance.estado = False
         instance.save()
 
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [BusquedaFilter, filters.OrderingFilter]
     search_fields = ['nombre', 'descripcion', 'codigo_barra']
     ordering_fields = ['precio_venta', 'stock_actual', 'nombre']
     pagination_class = StandardResultsSetPagination
 
     def get_queryset(self):
         qs = super().get_queryset()
+        if self.action == 'list':
+            qs = qs.para_listado()
         nombre = self.request.query_params.get('nombre')
         categoria = self.request.query_params.get('categoria')
         drogueria = self.request.query_params.get('drogueria')
@@ -74,6 +104,19 @@ class MedicamentoViewSet(viewsets.ModelViewSet):
 
         return apply_medicamento_filters(qs, self.request.query_params)
 
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return MedicamentoListSerializer
+        return super().get_serializer_class()
+
+    @action(detail=True, methods=['get'])
+    def lotes(self, request, pk=None):
+        """Lotes con stock en el orden en que se consumen (primero el que vence antes)."""
+        medicamento = self.get_object()
+        qs = (medicamento.lotes.filter(cantidad__gt=0)
+              .order_by(F('fecha_vencimiento').asc(nulls_last=True), 'id'))
+        return Response(LoteMedicamentoSerializer(qs, many=True).data)
+
 # =========================
 # 📦 CRUD DE MOVIMIENTOS DE INVENTARIO
 # =========================
@@ -85,7 +128,7 @@ class MovimientoInventarioViewSet(viewsets.ModelViewSet):
     filter_backends = [filters.OrderingFilter]
     ordering_fields = ['fecha_movimiento', 'cantidad']
     ordering = ('-fecha_movimiento',)
-    pagination_class = StandardResultsSetPagination
+    pagination_class = MovimientoPagination
 
     def get_queryset(self):
         qs = super().get_queryset()
@@ -97,6 +140,80 @@ class MovimientoInventarioViewSet(viewsets.ModelViewSet):
 
         return apply_movimiento_filters(qs, self.request.query_params)
 
+    def perform_create(self, serializer):
+        # las salidas sin stock disponible se rechazan (antes se recortaban a 0)
+        try:
+            serializer.save()
+        except StockInsuficienteError as e:
+            raise serializers.ValidationError({'cantidad': str(e)})
+
+    MAX_LOTE = 5000
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """Ingesta en lote de movimientos (sincronizaciones nocturnas de sucursales/proveedores).
+
+        Body: lista de movimientos o {"movimientos": [...]}, cada uno con
+        medicamento_id, tipo_movimiento, cantidad y opcionalmente drogueria_id,
+        fecha_movimiento, observacion.
+
+        Responde con un estado por fila: creado, rechazado (stock insuficiente)
+        o invalido (errores de validación). Si escrituras concurrentes agotan los
+        reintentos no se aplica ninguna fila y se responde 409 (el lote se puede reenviar).
+        """
+        filas = request.data.get('movimientos') if isinstance(request.data, dict) else request.data
+        if not isinstance(filas, list) or not filas:
+            return Response({'detail': 'Se espera una lista de movimientos'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(filas) > self.MAX_LOTE:
+            return Response({'detail': f'Máximo {self.MAX_LOTE} movimientos por lote'}, status=status.HTTP_400_BAD_REQUEST)
+
+        resultados = [None] * len(filas)
+        validas = []
+        # una sola instancia: los campos del serializer se construyen una vez para todo el lote
+        validador = MovimientoLoteSerializer()
+        for indice, fila in enumerate(filas):
+            try:
+                validas.append(dict(validador.run_validation(fila), indice=indice))
+            except serializers.ValidationError as e:
+                resultados[indice] = {'indice': indice, 'estado': 'invalido', 'errores': e.detail}
+
+        # referencias validadas con una consulta por tabla, no por fila
+        med_ids = set(Medicamento.objects.filter(
+            id__in={f['medicamento_id'] for f in validas}).values_list('id', flat=True))
+        drog_ids = set(Drogueria.objects.filter(
+            id__in={f['drogueria_id'] for f in validas if f.get('drogueria_id')}).values_list('id', flat=True))
+        aplicables = []
+        for fila in validas:
+            errores = {}
+            if fila['medicamento_id'] not in med_ids:
+                errores['medicamento_id'] = ['Medicamento no encontrado']
+            if fila.get('drogueria_id') and fila['drogueria_id'] not in drog_ids:
+                errores['drogueria_id'] = ['Droguería no encontrada']
+            if errores:
+                resultados[fila['indice']] = {'indice': fila['indice'], 'estado': 'invalido', 'errores': errores}
+            else:
+                aplicables.append(fila)
+
+        try:
+            stocks = registrar_lote(aplicables, usuario=request.user) if aplicables else {}
+        except StockInsuficienteError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_409_CONFLICT)
+        for fila in aplicables:
+            if 'error' in fila:
+                resultados[fila['indice']] = {'indice': fila['indice'], 'estado': 'rechazado', 'errores': {'cantidad': [fila['error']]}}
+            else:
+                resultados[fila['indice']] = {'indice': fila['indice'], 'estado': 'creado', 'id': fila['movimiento'].pk}
+
+        estados = [r['estado'] for r in resultados]
+        return Response({
+            'total': len(resultados),
+            'creados': estados.count('creado'),
+            'rechazados': estados.count('rechazado'),
+            'invalidos': estados.count('invalido'),
+            'stock_final': {str(mid): stock for mid, stock in stocks.items()},
+            'resultados': resultados,
+        }, status=status.HTTP_200_OK)
+
 
 class PrestamoViewSet(viewsets.ModelViewSet):
     queryset = Prestamo.objects.all()
@@ -165,6 +282,91 @@ class PrestamoViewSet(viewsets.ModelViewSet):
         return Response({'detail': 'Prestamo rechazado'}, status=200)
 
 
+class TransferenciaViewSet(mixins.CreateModelMixin, viewsets.ReadOnlyModelViewSet):
+    """Transferencias con varias líneas entre droguerías.
+
+    - create: reserva el stock de todas las líneas
+    - accept / reject (POST): responden el documento completo en una transacción
+    """
+    serializer_class = TransferenciaSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        user = self.request.user
+        qs = Transferencia.objects.prefetch_related('lineas__medicamento_origen')
+        if not es_admin(user):
+            qs = qs.filter(Q(solicitante=user) | Q(origen__propietario=user) | Q(destino__propietario=user))
+        estado = self.request.query_params.get('estado')
+        if estado:
+            qs = qs.filter(estado=estado)
+        return qs
+
+    def _puede_responder(self, transferencia, user):
+        return (
+            es_admin(user) or
+            transferencia.destino.propietario_id == user.id or
+            transferencia.origen.propietario_id == user.id
+        )
+
+    @action(detail=True, methods=['post'])
+    def accept(self, request, pk=None):
+        transferencia = self.get_object()
+        if not self._puede_responder(transferencia, request.user):
+            return Response({'detail': 'No autorizado para aceptar esta transferencia'}, status=403)
+        try:
+            transferencias.aceptar(transferencia, usuario=request.user)
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=400)
+        return Response({'detail': 'Transferencia aceptada'}, status=200)
+
+    @action(detail=True, methods=['post'])
+    def reject(self, request, pk=None):
+        transferencia = self.get_object()
+        if not self._puede_responder(transferencia, request.user):
+            return Response({'detail': 'No autorizado para rechazar esta transferencia'}, status=403)
+        try:
+            transferencias.rechazar(transferencia, usuario=request.user, nota=request.data.get('nota'))
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=400)
+        return Response({'detail': 'Transferencia rechazada'}, status=200)
+
+
+class ImportacionMedicamentosViewSet(mixins.CreateModelMixin, viewsets.ReadOnlyModelViewSet):
+    """Importación masiva de medicamentos (CSV o XLSX) con upsert por (nombre, droguería).
+
+    - create (multipart): archivo, drogueria (por defecto la activa del usuario) y
+      asincrono=true para procesar en segundo plano y responder 202 de inmediato
+    - retrieve: progreso (filas_procesadas, creados, actualizados, errores)
+    """
+    serializer_class = ImportacionMedicamentosSerializer
+    permission_classes = [EsEmpleadoOPermisoAdmin]
+    parser_classes = [MultiPartParser, FormParser]
+
+    def get_queryset(self):
+        qs = ImportacionMedicamentos.objects.all()
+        if not es_admin(self.request.user):
+            qs = qs.filter(usuario=self.request.user)
+        return qs
+
+    def create(self, request, *args, **kwargs):
+        archivo = request.FILES.get('archivo')
+        if archivo is None:
+            return Response({'error': 'Debe adjuntar un archivo en el campo "archivo"'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        drogueria_id = request.data.get('drogueria') or getattr(request.user, 'active_drogueria_id', None)
+        if drogueria_id and not (str(drogueria_id).isdigit() and Drogueria.objects.filter(pk=drogueria_id).exists()):
+            return Response({'error': 'Droguería no encontrada'}, status=status.HTTP_400_BAD_REQUEST)
+        registro = ImportacionMedicamentos.objects.create(
+            usuario=request.user, drogueria_id=int(drogueria_id) if drogueria_id else None, archivo=archivo.name[:255],
+        )
+        if str(request.data.get('asincrono', '')).lower() == 'true':
+            importacion.importar_en_segundo_plano(registro, archivo)
+            return Response(self.get_serializer(registro).data, status=status.HTTP_202_ACCEPTED)
+        registro = importacion.importar(registro, archivo.file)
+        codigo = status.HTTP_201_CREATED if registro.estado == 'completada' else status.HTTP_400_BAD_REQUEST
+        return Response(self.get_serializer(registro).data, status=codigo)
+
+
 class AlertaViewSet(viewsets.ReadOnlyModelViewSet):
     """List and retrieve alerts; allow marking as read via action.
 
@@ -223,7 +425,7 @@ class AuditLogViewSet(viewsets.ReadOnlyModelViewSet):
         return apply_audit_filters(qs, self.request.query_params)
     filter_backends = [filters.OrderingFilter]
     ordering_fields = ['created_at', 'action', 'model_name']
-    pagination_class = StandardResultsSetPagination
+    pagination_class = AuditLogPagination
     ordering = ('-created_at',)
 
 # =========================
@@ -233,9 +435,13 @@ class AuditLogViewSet(viewsets.ReadOnlyModelViewSet):
 # 🔹 Listar medicamentos (solo empleados o admins)
 class MedicamentoListView(generics.ListAPIView):
     queryset = Medicamento.objects.filter(estado=True)
-    serializer_class = MedicamentoSerializer
+    serializer_class = MedicamentoListSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def get_queryset(self):
+        # por petición: para_listado compara contra la fecha de hoy
+        return super().get_queryset().para_listado()
+
 # 🔹 Crear medicamento
 class MedicamentoCreateView(generics.CreateAPIView):
     queryset = Medicamento.objects.all()
@@ -243,45 +449,83 @@ class MedicamentoCreateView(generics.CreateAPIView):
     permission_classes = [EsEmpleadoOPermisoAdmin]
 
 # 🔹 Ver, actualizar o eliminar medicamento
-class MedicamentoDetailView(generics.RetrieveUpdateDestroyAPIView):
+class MedicamentoDetailView(EdicionConAjusteMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Medicamento.objects.all()
     serializer_class = MedicamentoSerializer
     permission_classes = [EsEmpleadoOPermisoAdmin]
 
-class MedicamentoListPublicAPIView(generics.ListAPIView):
+class MedicamentoListPublicAPIView(RespuestaCondicionalMixin, generics.ListAPIView):
     queryset = Medicamento.objects.filter(estado=True)
-    serializer_class = MedicamentoSerializer
+    serializer_class = MedicamentoListSerializer
     permission_classes = [permissions.AllowAny]
     # permitir búsqueda simple, orden y paginación en el catálogo público
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [BusquedaFilter, filters.OrderingFilter]
     search_fields = ['nombre', 'descripcion', 'codigo_barra', 'proveedor']
     ordering_fields = ['precio_venta', 'stock_actual', 'nombre']
     pagination_class = StandardResultsSetPagination
 
     def get_queryset(self):
-        qs = Medicamento.objects.filter(estado=True)
+        qs = Medicamento.objects.filter(estado=True).para_listado()
         return apply_medicamento_filters(qs, self.request.query_params)
 
 # 🔹 Lista de categorías activas
-class CategoriaListPublicAPIView(generics.ListAPIView):
+class CategoriaListPublicAPIView(RespuestaCondicionalMixin, generics.ListAPIView):
     queryset = Categoria.objects.filter(activo=True)
     serializer_class = CategoriaSerializer
     permission_classes = [permissions.AllowAny]
 
 # 🔹 Opcional: Categorías con sus medicamentos anidados
-class CategoriaConMedicamentosListAPIView(generics.ListAPIView):
-    queryset = Categoria.objects.filter(activo=True)
-    serializer_class = CategoriaConMedicamentosSerializer
+class CategoriaConMedicamentosListAPIView(APIView):
+    """
+    Categorías activas con hasta `por_categoria` medicamentos cada una (defecto 20, máx. 100).
+    Cada categoría incluye `medicamentos_siguiente`; para continuar dentro de ella:
+    ?categoria=<id>&cursor=<medicamentos_siguiente>
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        params = request.query_params
+        try:
+            por_categoria = int(params.get('por_categoria', catalogo.POR_CATEGORIA))
+        except ValueError:
+            return Response({"error": "por_categoria debe ser un entero"}, status=status.HTTP_400_BAD_REQUEST)
+        por_categoria = min(max(por_categoria, 1), catalogo.MAX_POR_CATEGORIA)
+
+        if cursor := params.get('cursor'):
+            try:
+                data = catalogo.continuacion(int(params.get('categoria', '')), cursor, por_categoria)
+            except ValueError:
+                return Response({"error": "Se requiere una categoría y un cursor válidos"},
+                                status=status.HTTP_400_BAD_REQUEST)
+            return Response(data)
+        return Response(catalogo.arbol(por_categoria))
+
+
+class FacetasCatalogoView(APIView):
+    """
+    Conteos para la barra de filtros del catálogo público, en una sola consulta.
+    Acepta los mismos filtros que /catalogo/ (q, search, categoria, precio_min, disponible, ...)
+    y opcionalmente `rangos` (límites de precio separados por coma, p. ej. 5000,20000,50000).
+    Respuesta: total, categorias [{id, nombre, total}], precios [{desde, hasta, total}],
+    disponibilidad {disponible, agotado}.
+    """
     permission_classes = [permissions.AllowAny]
 
+    def get(self, request):
+        try:
+            cortes = facetas.leer_cortes(request.query_params.get('rangos'))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(facetas.facetas(request.query_params, cortes))
+
 
 class MedicamentosByDrogueriaListAPIView(generics.ListAPIView):
     """Lista medicamentos filtrados por drogueria (query param: ?drogueria=<id>)."""
-    serializer_class = MedicamentoSerializer
+    serializer_class = MedicamentoListSerializer
     permission_classes = [permissions.AllowAny]
     
     def get_queryset(self):
-        qs = Medicamento.objects.all()
+        qs = Medicamento.objects.para_listado()
         drogueria_id = self.request.query_params.get('drogueria')
         if drogueria_id:
             qs = qs.filter(drogueria_id=drogueria_id)
@@ -309,11 +553,11 @@ class MedicamentosDisponiblesView(generics.ListAPIView):
     - stock_bajo: si es true, solo mostrar stock bajo
     """
     permission_classes = [EsEmpleado]
-    serializer_class = MedicamentoSerializer
+    serializer_class = MedicamentoListSerializer
     pagination_class = StandardResultsSetPagination
 
     def get_queryset(self):
-        queryset = Medicamento.objects.filter(estado=True).select_related('categoria')
+        queryset = Medicamento.objects.filter(estado=True).para_listado()
         params = self.request.query_params
         
         # Búsqueda por nombre o código
@@ -334,66 +578,224 @@ class MedicamentosDisponiblesView(generics.ListAPIView):
         return queryset.order_by('nombre')
 
 
+class MedicamentoPorCodigoView(APIView):
+    """
+    Lectura de código de barras en caja: coincidencia exacta en la droguería activa.
+    Respuesta mínima: id, nombre, precio, stock_disponible (caché LRU en proceso).
+    """
+    permission_classes = [EsEmpleado]
+
+    def get(self, request, codigo):
+        drogueria_id = getattr(request.user, 'active_drogueria_id', None)
+        if not drogueria_id:
+            return Response({"error": "No hay una droguería activa seleccionada"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        data = buscar_por_codigo(drogueria_id, codigo)
+        if data is None:
+            return Response({"error": "Código de barras no encontrado"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(data)
+
+
 class AlertasMedicamentosView(APIView):
     """
     Obtener alertas de:
     - Medicamentos con stock bajo
-    - Medicamentos próximos a vencer
+    - Medicamentos próximos a vencer (`dias`, por defecto 7, máx. 30)
+    - Cantidad de vencidos
+
+    Se lee del snapshot materializado de la droguería (`drogueria` o la activa
+    del usuario); sin droguería, una consulta agregada sobre todo el inventario.
     """
     permission_classes = [EsEmpleado]
 
     def get(self, request):
         try:
-            hoy = timezone.now().date()
-            fecha_limite = hoy + timezone.timedelta(days=7)
-            
-            medicamentos_stock_bajo = self._get_medicamentos_stock_bajo()
-            medicamentos_vencimiento = self._get_medicamentos_por_vencer(hoy, fecha_limite)
-            medicamentos_vencidos = self._get_medicamentos_vencidos(hoy)
-            
-            return Response(self._format_response(
-                medicamentos_stock_bajo,
-                medicamentos_vencimiento,
-                medicamentos_vencidos
-            ))
-            
+            dias = int(request.query_params.get('dias', alertas.DIAS_POR_DEFECTO))
+        except ValueError:
+            return Response({"error": "dias debe ser un entero"}, status=status.HTTP_400_BAD_REQUEST)
+        dias = min(max(dias, 0), alertas.HORIZONTE_DIAS)
+        drogueria = request.query_params.get('drogueria')
+        if drogueria and not drogueria.isdigit():
+            return Response({"error": "drogueria debe ser un id"}, status=status.HTTP_400_BAD_REQUEST)
+        drogueria_id = drogueria or getattr(request.user, 'active_drogueria_id', None)
+        try:
+            if drogueria_id:
+                return Response(alertas.resumen(int(drogueria_id), dias))
+            return Response(alertas.resumen_global(dias))
         except Exception as e:
             return Response(
                 {"error": "Error al obtener las alertas", "detalle": str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
-    
-    def _get_medicamentos_stock_bajo(self):
-        return (Medicamento.objects
-                .filter(stock_actual__lte=F('stock_minimo'), estado=True)
-                .values('id', 'nombre', 'stock_actual', 'stock_minimo', 'categoria__nombre')
-                .order_by('-stock_actual'))
-    
-    def _get_medicamentos_por_vencer(self, hoy, fecha_limite):
-        return (Medicamento.objects
-                .filter(fecha_vencimiento__range=(hoy, fecha_limite), estado=True)
-                .values('id', 'nombre', 'fecha_vencimiento', 'stock_actual', 'lote')
-                .order_by('fecha_vencimiento'))
-    
-    def _get_medicamentos_vencidos(self, hoy):
-        return (Medicamento.objects
-                .filter(fecha_vencimiento__lt=hoy, estado=True)
-                .count())
-    
-    def _format_response(self, stock_bajo, vencimiento, vencidos):
-        return {
-            "stock_bajo": {
-                "cantidad": stock_bajo.count(),
-                "medicamentos": list(stock_bajo)
-            },
-            "proximo_vencimiento": {
-                "cantidad": vencimiento.count(),
-                "medicamentos": list(vencimiento)
-            },
-            "vencidos": {"cantidad": vencidos},
-            "timestamp": timezone.now().isoformat(),
-            "critico": stock_bajo.exists() or vencimiento.exists()
-        }
+
+
+class StockHistoricoView(generics.ListAPIView):
+    """
+    Stock de medicamentos en una fecha pasada (checkpoint más cercano + movimientos del intervalo).
+    Query params:
+    - fecha (requerido): fecha (fin de ese día) o fecha y hora ISO
+    - medicamento / drogueria: acotan los medicamentos consultados
+    """
+    permission_classes = [EsEmpleadoOPermisoAdmin]
+    pagination_class = StandardResultsSetPagination
+
+    def list(self, request, *args, **kwargs):
+        crudo = request.query_params.get('fecha', '')
+        try:
+            fecha = parse_datetime(crudo)
+            if fecha is None and (dia := parse_date(crudo)):
+                fecha = datetime.combine(dia, time.max)
+        except ValueError:  # bien formada pero imposible (2025-02-30)
+            fecha = None
+        if fecha is None:
+            return Response({"error": "fecha inválida o ausente (AAAA-MM-DD o ISO 8601)"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if timezone.is_naive(fecha):
+            fecha = timezone.make_aware(fecha)
+
+        medicamento = request.query_params.get('medicamento')
+        drogueria = request.query_params.get('drogueria')
+        if (medicamento and not medicamento.isdigit()) or (drogueria and not drogueria.isdigit()):
+            return Response({"error": "medicamento y drogueria deben ser ids"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        qs = Medicamento.objects.order_by('id')
+        if medicamento:
+            qs = qs.filter(pk=medicamento)
+        if drogueria:
+            qs = qs.filter(drogueria_id=drogueria)
+        filas = self.paginate_queryset(
+            historico.stock_en(qs, fecha).values('id', 'nombre', 'drogueria_id', 'stock_historico', 'base_historico')
+        )
+        data = [{
+            'medicamento': f['id'],
+            'nombre': f['nombre'],
+            'drogueria': f['drogueria_id'],
+            'fecha': fecha.isoformat(),
+            'stock': f['stock_historico'],
+            'base': f['base_historico'],
+        } for f in filas]
+        return self.get_paginated_response(data)
+
+
+class ValoracionInventarioView(APIView):
+    """
+    Valoración del inventario (precio y costo por stock) calculada en la base de datos.
+    Query params:
+    - agrupar: lista separada por comas de drogueria, categoria, proveedor (vacío: solo total)
+    - drogueria, categoria: filtros por id
+    - ingreso_desde / ingreso_hasta: rango de fecha_ingreso (AAAA-MM-DD)
+    - vence_desde / vence_hasta: rango de fecha_vencimiento (AAAA-MM-DD)
+    - incluir_inactivos: si es true, incluye medicamentos inactivos
+    """
+    permission_classes = [EsEmpleadoOPermisoAdmin]
+    FILTROS_FECHA = {
+        'ingreso_desde': 'fecha_ingreso__gte',
+        'ingreso_hasta': 'fecha_ingreso__lte',
+        'vence_desde': 'fecha_vencimiento__gte',
+        'vence_hasta': 'fecha_vencimiento__lte',
+    }
+
+    def get(self, request):
+        params = request.query_params
+        agrupar = [g.strip() for g in params.get('agrupar', '').split(',') if g.strip()]
+        if invalidas := [g for g in agrupar if g not in valoracion.AGRUPACIONES]:
+            return Response({"error": f"Agrupación no soportada: {', '.join(invalidas)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        drogueria, categoria = params.get('drogueria'), params.get('categoria')
+        if (drogueria and not drogueria.isdigit()) or (categoria and not categoria.isdigit()):
+            return Response({"error": "drogueria y categoria deben ser ids"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        qs = Medicamento.objects.all()
+        if params.get('incluir_inactivos', '').lower() != 'true':
+            qs = qs.filter(estado=True)
+        if drogueria:
+            qs = qs.filter(drogueria_id=drogueria)
+        if categoria:
+            qs = qs.filter(categoria_id=categoria)
+        for param, lookup in self.FILTROS_FECHA.items():
+            if crudo := params.get(param):
+                try:
+                    fecha = parse_date(crudo)
+                except ValueError:  # bien formada pero imposible (2025-02-30)
+                    fecha = None
+                if fecha is None:
+                    return Response({"error": f"{param} debe tener formato AAAA-MM-DD"},
+                                    status=status.HTTP_400_BAD_REQUEST)
+                qs = qs.filter(**{lookup: fecha})
+        return Response(valoracion.valorizar(qs, list(dict.fromkeys(agrupar))))
+
+
+class DisponibilidadProductoView(APIView):
+    """
+    ¿Qué sucursales tienen stock de sobra de un producto? (antes de pedir un préstamo)
+    Query params (uno de):
+    - sku: SKU del maestro de productos
+    - nombre: nombre del medicamento (sin distinguir mayúsculas ni espacios)
+    - codigo_barra
+    - medicamento: id de un medicamento del producto
+    Opcionales:
+    - excluir_drogueria: id de la droguería que solicita
+    - solo_excedente=true: solo sucursales con stock por encima del mínimo
+    """
+    permission_classes = [EsEmpleadoOPermisoAdmin]
+
+    def get(self, request):
+        params = request.query_params
+        excluir = params.get('excluir_drogueria')
+        medicamento = params.get('medicamento')
+        if (excluir and not excluir.isdigit()) or (medicamento and not medicamento.isdigit()):
+            return Response({"error": "excluir_drogueria y medicamento deben ser ids"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            filas = disponibilidad.localizar(
+                nombre=params.get('nombre') or None,
+                codigo_barra=params.get('codigo_barra') or None,
+                sku=params.get('sku') or None,
+                medicamento_id=int(medicamento) if medicamento else None,
+                excluir_drogueria=int(excluir) if excluir else None,
+                solo_excedente=params.get('solo_excedente', '').lower() in ('1', 'true'),
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'droguerias': [{
+                'drogueria_id': f['drogueria_id'],
+                'codigo': f['drogueria__codigo'],
+                'nombre': f['drogueria__nombre'],
+                'medicamento_id': f['medicamento'],
+                'stock_disponible': f['total_disponible'],
+                'stock_minimo': f['total_minimo'],
+                'excedente': f['total_excedente'],
+            } for f in filas],
+        })
+
+
+class ExportarMedicamentosView(APIView):
+    """
+    Exportación completa del inventario en flujo (sin paginar).
+    Query params:
+    - formato: csv (por defecto) o jsonl
+    - comprimir: gzip para descargar el archivo comprimido
+    - mismos filtros que el listado (drogueria, categoria, estado, q, precio_min, ...)
+    """
+    permission_classes = [EsEmpleadoOPermisoAdmin]
+
+    def get(self, request):
+        formato = request.query_params.get('formato', 'csv').lower()
+        if formato not in exportacion.FORMATOS:
+            return Response({"error": "formato debe ser csv o jsonl"}, status=status.HTTP_400_BAD_REQUEST)
+        comprimir = request.query_params.get('comprimir', '').lower() == 'gzip'
+
+        qs = apply_medicamento_filters(Medicamento.objects.all(), request.query_params)
+        if not qs.query.order_by:
+            qs = qs.order_by('id')
+        contenido, content_type, extension = exportacion.exportar(qs, formato, comprimir)
+        respuesta = StreamingHttpResponse(contenido, content_type=content_type)
+        fecha = timezone.localdate().isoformat()
+        respuesta['Content-Disposition'] = f'attachment; filename="inventario-{fecha}.{extension}"'
+        return respuesta
 
 
 class DetallesMedicamentoView(generics.RetrieveAPIView):
@@ -411,26 +813,23 @@ class ProveedoresListView(generics.ListAPIView):
     """Lista de proveedores únicos con búsqueda
     
     Query params:
-    - q: término de búsqueda (opcional)
+    - q: prefijo del nombre (opcional, sin distinguir mayúsculas ni espacios extra)
+
+    Lee la tabla normalizada de proveedores (con el número de medicamentos de
+    cada uno), no la de medicamentos.
+
+    Respuesta: objetos ``{id, nombre, medicamentos}`` (antes era una lista de
+    nombres) y ``q`` busca por prefijo (antes por subcadena).
     """
     permission_classes = [EsEmpleado]
     pagination_class = StandardResultsSetPagination
+    serializer_class = ProveedorSerializer
 
-    def list(self, request, *args, **kwargs):
-        q = request.query_params.get('q')
-        qs = Medicamento.objects.values_list('proveedor', flat=True).distinct()
-        if q:
-            qs = qs.filter(proveedor__icontains=q)
-        # Filtrar valores nulos o vacíos
-        qs = qs.exclude(proveedor__isnull=True).exclude(proveedor__exact='')
-        # Paginación
-        page = self.paginate_queryset(qs)
-        if page is not None:
-            return self.get_paginated_response(list(page))
-        return Response(list(qs), status=status.HTTP_200_OK)
-
-
-class DrogueriasListPublicAPIView(generics.ListAPIView):
+    def get_queryset(self):
+        return proveedores.buscar(self.request.query_params.get('q'))
+
+
+class DrogueriasListPublicAPIView(RespuestaCondicionalMixin, generics.ListAPIView):
     """
     Lista de droguerías con búsqueda y filtrado
     
@@ -7,7 +7,7 @@ from django.utils.decorators import method_decorator
 from django.urls import reverse_lazy
 
 from .models import Pedido, DetallePedido, HistorialPedido
-from inventario.models import Medicamento
+from inventario.models import Medicamento, MovimientoInventario
 from .forms import CrearPedidoForm, DetallePedidoFormSet
 
 
@@ -126,12 +126,18 @@ def cambiar_estado_pedido(request, pk, nuevo_estado):
                 comentario=request.POST.get("comentario", ""),
             )
 
-            # Si se cancela, devolver el stock
+            # Si se cancela, devolver el stock con un movimiento (queda en el stock histórico)
             if nuevo_estado == "cancelado":
-                for detalle in pedido.detalles.all():
-                    if detalle.medicamento:
-                        detalle.medicamento.stock_actual += detalle.cantidad
-                        detalle.medicamento.save()
+                for detalle in pedido.detalles.select_related("medicamento"):
+                    if detalle.medicamento_id and detalle.cantidad:
+                        MovimientoInventario.objects.create(
+                            medicamento=detalle.medicamento,
+                            drogueria_id=detalle.medicamento.drogueria_id,
+                            tipo_movimiento="ajuste",
+                            cantidad=detalle.cantidad,
+                            usuario=request.user,
+                            observacion=f"Cancelación del pedido #{pedido.id}",
+                        )
 
             messages.success(
                 request,